@@ -1,26 +1,42 @@
 """
 This is what could become a template for a script for downloading
 Datastream data.
+
+The instruments and datatypes are packed into DSWS bundle requests by
+dsws_client, several bundles are in flight at once, and the data is saved
+as one row per instrument and date, with one column per datatype, to a
+Parquet file, as the Eikon scripts save theirs.
+
+Run it offline against the stand-in by setting DSWS = fake_datastream.
 """
-import DatastreamDSWS as dsws
+import pathlib as pl
+
+import pandas as pd
+from src.my_functions import batch_sink as snk
+from src.my_functions import dsws_client as dsc
+from src.my_functions import fake_datastream
+
+MAX_WORKERS = 4  # Number of bundles in flight at once
+DSWS = None  # The DatastreamDSWS package, or fake_datastream to run offline
+
+# WHICH SERIES, AND WHICH DATATYPES?
+TICKERS = ["@:M1WLDXA", "@:VEMSCIP"]
+DATATYPES = ["PI", "RI"]
+START = "2000-01-01"
+END = "2021-12-31"
+FREQ = "M"  # D, W, M, Q or Y
+
+# WHERE TO PUT DATA?
+proj_path = pl.Path(r"D:")
+out_path = proj_path.joinpath("out")
+OUT_FILE = out_path.joinpath("datastream.parquet")
 
 # We can use our Refinitiv's Datastream Web Socket (DSWS) API keys that allows
 # us to be identified by Refinitiv's back-end services and enables us to
 # request (and fetch) data: Credentials are placed in a text file so that it
 # may be used in this code without showing it itself.
-
-(dsws_username, dsws_password) = (
-    open("Datastream_username.txt", "r"),
-    open("Datastream_password.txt", "r"),
-)
-ds = dsws.Datastream(
-    username=str(dsws_username.read()), password=str(dsws_password.read())
-)
-
-# It is best to close the files we opened in order to make sure that we don't
-# stop any other services/programs from accessing them if they need to.
-dsws_username.close()
-dsws_password.close()
+USERNAME_FILE = pl.Path(__file__).with_name("Datastream_username.txt")
+PASSWORD_FILE = pl.Path(__file__).with_name("Datastream_password.txt")
 
 # Alternatively one can use the following:
 # import getpass
@@ -28,22 +44,23 @@
 # dspassword = getpass.getpass()
 # ds = dsws.Datastream(username = dsusername, password = dspassword)
 
-import warnings  # ' warnings ' is a native Python library allowing us to raise warnings and errors to users.
-from datetime import datetime  # This is needed to keep track of when code runs.
-import pandas as pd
-import numpy as np
-
-from tqdm.notebook import (
-    trange,
-)  # ' tqdm ' allows loops to show a progress meter. Version 4.48.2 was used in this article.
-import ipywidgets as widgets
-
-# # From the ' Reference data.xls ' file, one could run and use the following:
-# xl_countries = pd.read_excel("Reference data.xls", sheet_name = "Countries")
-# xl_regions = pd.read_excel("Reference data.xls", sheet_name = "Regions")
-# xl_index = pd.read_excel("Reference data.xls", sheet_name = "Index Names 3")
-# xl_columns = pd.read_excel("Reference data.xls", sheet_name = "Column Names 2")
-# # If you don't have the ' Reference data.xls ' file, just use the bellow:
-xl_regions = pd.DataFrame(data={'Region': {0: 'EAFE', 1: 'EAFE + Canada', 2: '@:M1WLDXA'}})
-xl_countries = pd.DataFrame(data={'Region': {0: 'Argentina', 1: 'Australia', 2:'@:VEMSCIP'}})
-print(xl_regions.head(10))
+if __name__ == "__main__":
+    if DSWS is fake_datastream:
+        ds = dsc.connect(dsws=DSWS)
+    else:
+        ds = dsc.connect(USERNAME_FILE, PASSWORD_FILE, dsws=DSWS)
+
+    # The out-file is written as the bundles arrive
+    with snk.BatchSink(OUT_FILE) as sink:
+        rows = dsc.get_data_bundled(
+            ds,
+            TICKERS,
+            DATATYPES,
+            sink=sink,
+            max_workers=MAX_WORKERS,
+            start=START,
+            end=END,
+            freq=FREQ,
+        )
+    print(f"{rows} rows saved to {OUT_FILE}")
+    print(pd.read_parquet(OUT_FILE).head(10))
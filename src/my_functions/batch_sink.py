@@ -0,0 +1,332 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with a streaming sink for retrieved batches.
+
+The scripts used to collect the batches of a year with
+dta_all = pd.concat([dta_all, dta]) and drop_duplicates(), copying and
+hashing all earlier batches again for each new one, and holding the year
+in memory until it was saved. The sink instead writes each batch to a
+tab-separated csv-file, or a Parquet file, as soon as it arrives. The
+duplicates are dropped with a set of row hashes, so only the hashes of the
+written rows are kept in memory.
+
+RawSink does the same for raw output, i.e. the dictionaries get_data
+returns with raw_output=True, written as NDJSON or as Arrow record batches
+in a Parquet file, with the header metadata stored once.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import csv
+import json as js
+import os
+import pathlib as pl
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class BatchSink:
+    """
+    Streaming writer of batches, dropping duplicate rows across batches.
+
+    Arguments:
+
+    file: The out-file. A file with suffix .parquet is written as Parquet,
+    any other as a tab-separated csv-file.
+
+    key: The columns identifying a row. Default is all columns, as for
+    drop_duplicates().
+
+    header: True to write the header of the first batch. A csv-file is
+    appended to, so use False if the header is already written.
+
+    staged: True to write to a part file next to the out-file, which is
+    only appended to the out-file by commit(). A run that is aborted then
+    leaves the out-file untouched.
+
+    compression: The compression of a Parquet file.
+
+    quoting: The quoting of a csv-file, e.g. csv.QUOTE_ALL, as for
+    to_csv(). Default is csv.QUOTE_MINIMAL.
+
+    Notes:
+    Parquet files are written with all columns as strings, the same as
+    own.read_csv_file reads the csv-files.
+    """
+
+    def __init__(
+        self,
+        file,
+        key=None,
+        header=False,
+        staged=False,
+        compression="snappy",
+        quoting=csv.QUOTE_MINIMAL,
+    ):
+        self.file = pl.Path(file)
+        self.key = key
+        self.header = header
+        self.staged = staged
+        self.compression = compression
+        self.quoting = quoting
+        self.parquet = self.file.suffix == ".parquet"
+        if self.parquet and staged:
+            raise ValueError("A Parquet file can't be appended to. Use staged=False.")
+        self.rows = 0  # Number of rows written
+        self.duplicates = 0  # Number of duplicate rows dropped
+        self._seen = set()
+        self._handle = None
+        self._writer = None
+
+    @property
+    def target(self):
+        """ The file the batches are written to. """
+        if self.staged:
+            return self.file.with_name(f"{self.file.name}.part")
+        return self.file
+
+    def _open(self, dta):
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        if self.parquet:
+            self._writer = pq.ParquetWriter(
+                self.target,
+                pa.Schema.from_pandas(dta, preserve_index=False),
+                compression=self.compression,
+            )
+        else:
+            # A part file is always started anew
+            self._handle = open(
+                self.target,
+                mode="w" if self.staged else "a",
+                encoding="utf-8",
+                newline="",
+            )
+
+    def _new_rows(self, dta):
+        if self.key is None:
+            hashes = pd.util.hash_pandas_object(dta, index=False)
+        else:
+            hashes = pd.util.hash_pandas_object(dta[self.key], index=False)
+        mask = np.zeros(len(dta), dtype=bool)
+        seen = self._seen
+        for i, hsh in enumerate(hashes.tolist()):
+            if hsh not in seen:
+                seen.add(hsh)
+                mask[i] = True
+        return mask
+
+    def write(self, dta):
+        """
+        Enter a batch and append its new rows to the out-file.
+
+        Return: The number of rows written.
+        """
+        if dta is None or dta.empty:
+            return 0
+        mask = self._new_rows(dta)
+        self.duplicates += int(len(dta) - mask.sum())
+        dta = dta[mask]
+        if dta.empty:
+            return 0
+        if self.parquet:
+            dta = dta.astype("string")
+        if self._handle is None and self._writer is None:
+            self._open(dta)
+            write_header = self.header
+        else:
+            write_header = False
+        if self.parquet:
+            self._writer.write_table(
+                pa.Table.from_pandas(dta, preserve_index=False).cast(
+                    self._writer.schema
+                )
+            )
+        else:
+            dta.to_csv(
+                self._handle,
+                sep="\t",
+                index=False,
+                header=write_header,
+                quoting=self.quoting,
+            )
+            self._handle.flush()
+        self.rows += len(dta)
+        return len(dta)
+
+    def close(self):
+        """ Close the out-file. """
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def commit(self):
+        """
+        Close the out-file, and append the part file to it if staged.
+
+        Return: The number of rows written.
+        """
+        self.close()
+        if self.staged and self.target.exists():
+            with open(self.target, mode="rb") as src:
+                with open(self.file, mode="ab") as dst:
+                    shutil.copyfileobj(src, dst)
+            os.remove(self.target)
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawSink:
+    """
+    Streaming writer of raw output batches.
+
+    Arguments:
+
+    file: The out-file. A file with suffix .parquet is written as Parquet,
+    any other as NDJSON, i.e. one json document per line.
+
+    compression: The compression of a Parquet file.
+
+    Notes:
+    The header metadata of the first batch, i.e. all but data, error and
+    totalRowsCount, is stored once: as the first line of an NDJSON file, and as the
+    eikon_metadata of the Parquet schema. An NDJSON file then holds one
+    line per data row, as a list, and one line per error, as a dictionary
+    {"error": ...}. A Parquet file has one string column per header, named
+    by its field, or display name, and no errors. The errors not recovered
+    are in the error ledger.
+    """
+
+    def __init__(self, file, compression="snappy"):
+        self.file = pl.Path(file)
+        self.compression = compression
+        self.parquet = self.file.suffix == ".parquet"
+        self.rows = 0  # Number of rows written
+        self.errors = 0  # Number of errors written
+        self._handle = None
+        self._writer = None
+        self._columns = None
+
+    def _open(self, dta):
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        metadata = {
+            key: value
+            for key, value in dta.items()
+            # The row count of the first batch is not that of the file
+            if key not in ["data", "error", "totalRowsCount"]
+        }
+        if self.parquet:
+            self._columns = _unique_columns(dta.get("headers", [[]])[-1])
+            schema = pa.schema(
+                [pa.field(name, pa.string()) for name in self._columns],
+                metadata={"eikon_metadata": js.dumps(metadata)},
+            )
+            self._writer = pq.ParquetWriter(
+                self.file, schema, compression=self.compression
+            )
+        else:
+            self._handle = open(self.file, mode="w", encoding="utf-8", newline="")
+            self._handle.write(js.dumps(metadata) + "\n")
+
+    def write(self, dta):
+        """
+        Enter a raw output batch and append its rows to the out-file.
+
+        Return: The number of rows written.
+        """
+        if not dta:
+            return 0
+        if self._handle is None and self._writer is None:
+            self._open(dta)
+        data = dta.get("data", [])
+        if self.parquet:
+            width = len(self._columns)
+            columns = [
+                [
+                    None if pos >= len(row) or row[pos] is None else str(row[pos])
+                    for row in data
+                ]
+                for pos in range(width)
+            ]
+            self._writer.write_batch(
+                pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=pa.string()) for column in columns],
+                    schema=self._writer.schema,
+                )
+            )
+        else:
+            lines = [js.dumps(row) for row in data]
+            lines += [js.dumps({"error": entry}) for entry in dta.get("error", [])]
+            self.errors += len(dta.get("error", []))
+            if lines:
+                self._handle.write("\n".join(lines) + "\n")
+                self._handle.flush()
+        self.rows += len(data)
+        return len(data)
+
+    def close(self):
+        """ Close the out-file. """
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _unique_columns(headers):
+    """ Enter the headers of a raw output and get unique column names. """
+    names = []
+    for hdr in headers:
+        name = hdr.get("field", hdr.get("displayName", "")) or "column"
+        unique = name
+        count = 1
+        while unique in names:
+            count += 1
+            unique = f"{name}_{count}"
+        names.append(unique)
+    return names
+
+
+def read_ndjson(file):
+    """
+    Enter an NDJSON file of RawSink and get the raw output dictionary.
+
+    Notes:
+    The whole file is read into memory, as for a json-file written by
+    own.save_to_json.
+    """
+    with open(file, mode="r", encoding="utf-8") as ndjson_file:
+        dta = js.loads(ndjson_file.readline())
+        dta["data"] = []
+        errors = []
+        for line in ndjson_file:
+            row = js.loads(line)
+            if isinstance(row, dict):
+                errors.append(row["error"])
+            else:
+                dta["data"].append(row)
+    dta["totalRowsCount"] = len(dta["data"])
+    if errors:
+        dta["error"] = errors
+    return dta
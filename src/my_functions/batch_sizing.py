@@ -0,0 +1,321 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with adaptive batch sizing for the Eikon retrieval engine.
+
+The batch size grows after fast successes and shrinks after slow requests,
+failures and truncated payloads, always within the configured bounds. The
+learned size is saved per field set, so the next run starts near it.
+
+For field sets whose payload varies much between instruments, e.g. full
+statement templates, RowBudget instead packs each batch up to a budget of
+rows, using the rows per instrument seen by earlier runs.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import collections
+import json as js
+import os
+import pathlib as pl
+import threading
+
+from src.my_functions import rate_limit as rl
+
+SIZE_FILE = pl.Path.home().joinpath(".refinitiv", "batch_sizes.json")
+COUNT_FILE = pl.Path.home().joinpath(".refinitiv", "row_counts.json")
+ROW_BUDGET = 2500  # Rows per request when packing by row counts
+MIN_SIZE = 1  # Smallest batch ever sent
+MAX_SIZE = 10000  # Largest batch ever sent
+TARGET_SECONDS = 60  # A request faster than this is "fast"
+GROW = 1.25  # Growth factor after a fast success
+SHRINK = 0.5  # Shrink factor after a failure or a truncated payload
+
+
+def field_set_key(fields):
+    """
+    Enter a list of fields and get a key identifying the field set.
+
+    Arguments:
+
+    fields: A field name, or a list of field names and/or ek.TR_Field
+    objects. TR_Field objects are dictionaries keyed by the field name.
+
+    Return: A string with the sorted field names, e.g. TR.ISIN|TR.RIC.
+
+    Notes:
+    The parameters (e.g. SDate) are not part of the key, so the size
+    learned for one year is reused for the next.
+    """
+    if isinstance(fields, (str, dict)):
+        fields = [fields]
+    names = []
+    for fld in fields:
+        if isinstance(fld, dict):
+            names.extend(str(name) for name in fld)
+        else:
+            names.append(str(fld))
+    return "|".join(sorted(set(names)))
+
+
+def read_sizes(file=SIZE_FILE):
+    """ Enter the size file and get the learned sizes as a dictionary. """
+    try:
+        with open(file, mode="r", encoding="utf-8") as json_file:
+            return js.load(json_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_size(key, size, file=SIZE_FILE):
+    """
+    Enter a field set key and a size and save it to the size file.
+
+    Arguments:
+
+    key: The field set key, see field_set_key.
+
+    size: The learned batch size.
+
+    file: The json-file holding the learned sizes.
+
+    Notes:
+    The sizes of the other field sets are kept, see update_json.
+    """
+
+    def update(sizes):
+        sizes[key] = int(size)
+
+    update_json(file, update)
+
+
+def update_json(file, update):
+    """
+    Enter a json-file and a function and apply it to the file's dictionary.
+
+    Arguments:
+
+    file: The json-file, e.g. SIZE_FILE.
+
+    update: Function changing the dictionary read from the file in place.
+
+    Notes:
+    The file is shared by the scripts and shards running at once, so it is
+    read, updated and written under a rl.FileLock. It is written to a
+    temporary file first and then replaced, so a crash never leaves a
+    half-written file.
+    """
+    file = pl.Path(file)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with rl.FileLock(file.with_name(f"{file.name}.lock")):
+        try:
+            with open(file, mode="r", encoding="utf-8") as json_file:
+                dta = js.load(json_file)
+        except (FileNotFoundError, ValueError):
+            dta = {}
+        update(dta)
+        tmp_file = file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, mode="w", encoding="utf-8") as outfile:
+            outfile.write(js.dumps(dta, indent=4, sort_keys=True))
+        os.replace(tmp_file, file)
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size that adapts to the observed latency and failures.
+
+    Arguments:
+
+    size: The starting batch size.
+
+    min_size, max_size: The bounds of the batch size.
+
+    target_seconds: Requests faster than this grow the size. Requests
+    slower than twice this shrink it.
+
+    row_limit: Number of rows at which a payload is considered truncated,
+    e.g. Eikon's cap on rows per response. None to disable the check.
+
+    key: The field set key. If given, the size is saved to file after each
+    change.
+
+    file: The json-file holding the learned sizes.
+    """
+
+    def __init__(
+        self,
+        size,
+        min_size=MIN_SIZE,
+        max_size=MAX_SIZE,
+        target_seconds=TARGET_SECONDS,
+        row_limit=None,
+        key=None,
+        file=SIZE_FILE,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.row_limit = row_limit
+        self.key = key
+        self.file = file
+        self.size = self._bound(size)
+        self._lock = threading.Lock()
+
+    def _bound(self, size):
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def _set(self, size):
+        size = self._bound(size)
+        if size != self.size:
+            self.size = size
+            if self.key is not None:
+                save_size(self.key, size, self.file)
+
+    def next_size(self):
+        """ Get the size of the next batch. """
+        with self._lock:
+            return self.size
+
+    def record_success(self, n, seconds, rows=None):
+        """
+        Enter the outcome of a successful request and update the size.
+
+        Arguments:
+
+        n: Number of instruments in the batch.
+
+        seconds: Duration of the request.
+
+        rows: Number of rows returned, used for the truncation check.
+
+        Return: True if the payload is truncated, else False.
+        """
+        with self._lock:
+            if self.row_limit is not None and rows is not None:
+                if rows >= self.row_limit:
+                    # Truncated payload, the batch was too large
+                    self._set(min(self.size, n) * SHRINK)
+                    return True
+            if seconds > 2 * self.target_seconds:
+                self._set(min(self.size, n) * SHRINK)
+            elif seconds < self.target_seconds and n >= self.size:
+                # Only grow on batches of the current size, so that the
+                # short last batch of a list doesn't count
+                self._set(max(self.size * GROW, self.size + 1))
+            return False
+
+    def record_failure(self, n):
+        """ Enter the size of a failed batch and shrink the size. """
+        with self._lock:
+            self._set(min(self.size, n) * SHRINK)
+
+
+def load_batch_size(fields, size, file=SIZE_FILE, **kwargs):
+    """
+    Enter a list of fields and a default size and get an adaptive size.
+
+    Arguments:
+
+    fields: The fields of the request, used as the key of the learned size.
+
+    size: The default size, used when no size has been learned yet.
+
+    file: The json-file holding the learned sizes.
+
+    Return: An AdaptiveBatchSize starting at the learned size.
+
+    Notes:
+    **kwargs is for AdaptiveBatchSize, e.g. min_size and max_size.
+    """
+    key = field_set_key(fields)
+    start = read_sizes(file).get(key, size)
+    return AdaptiveBatchSize(start, key=key, file=file, **kwargs)
+
+
+def read_row_counts(file=COUNT_FILE):
+    """ Enter the row count file and get the rows per instrument and key. """
+    return read_sizes(file)
+
+
+class RowBudget:
+    """
+    Batch size packing instruments up to a budget of rows per request.
+
+    Arguments:
+
+    instruments: The list of instruments, in the order of the batches.
+
+    key: The field set key, see field_set_key.
+
+    budget: Number of rows per request.
+
+    default_rows: Rows assumed for an instrument not seen before. None for
+    the median of the instruments seen, or the budget if none is seen.
+
+    max_size: Largest number of instruments per batch.
+
+    file: The json-file holding the rows per instrument.
+
+    Notes:
+    The batches are contiguous runs of the list, so the output keeps its
+    order. An instrument with more rows than the budget goes alone. The
+    rows seen by this run are saved by save(), for the next run.
+    """
+
+    def __init__(
+        self,
+        instruments,
+        key,
+        budget=ROW_BUDGET,
+        default_rows=None,
+        max_size=MAX_SIZE,
+        file=COUNT_FILE,
+    ):
+        self.key = key
+        self.budget = budget
+        self.max_size = max_size
+        self.file = file
+        counts = read_row_counts(file).get(key, {})
+        if default_rows is None:
+            known = sorted(counts.values())
+            default_rows = known[len(known) // 2] if known else budget
+        self.rows = [
+            counts.get(str(instrument), default_rows) for instrument in instruments
+        ]
+        self._seen = collections.Counter()
+        self._lock = threading.Lock()
+
+    def size_at(self, line_start):
+        """ Enter the line of the next batch and get its size. """
+        total = 0
+        size = 0
+        for rows in self.rows[line_start:line_start + self.max_size]:
+            if size and total + rows > self.budget:
+                break
+            total += rows
+            size += 1
+        return max(1, size)
+
+    def record(self, dta):
+        """ Enter a retrieved batch and count its rows per instrument. """
+        if isinstance(dta, dict):
+            instruments = [row[0] for row in dta.get("data", []) if row]
+        elif dta is not None and hasattr(dta, "iloc") and not dta.empty:
+            instruments = dta.iloc[:, 0].tolist()
+        else:
+            return
+        with self._lock:
+            self._seen.update(str(instrument) for instrument in instruments)
+
+    def save(self):
+        """ Save the rows per instrument seen, keeping the others. """
+        if not self._seen:
+            return
+
+        def update(counts):
+            counts.setdefault(self.key, {}).update(self._seen)
+
+        with self._lock:
+            update_json(self.file, update)
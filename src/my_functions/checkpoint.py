@@ -0,0 +1,172 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with the checkpoint manifest for resumable downloads.
+
+The manifest is an append-only JSONL file next to the output file. Each
+line records a completed batch (a range of lines of the instrument list)
+of a unit, or a completed unit. A unit is e.g. one year and template of
+a download, identified by its year, period, field set and instrument list.
+The data of each completed batch is kept as a part file until its unit is
+complete, so a restarted run reads the finished batches from disk and
+only retrieves the remaining ones.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import hashlib
+import json as js
+import os
+import pathlib as pl
+import shutil
+import threading
+
+import pandas as pd
+from src.my_functions import batch_sizing as bsz
+
+
+def list_digest(instruments):
+    """
+    Enter a list of instruments and get a short digest of it.
+
+    The digest is part of the unit, so that the recorded line ranges are
+    not reused for a different, or differently ordered, instrument list.
+    """
+    hsh = hashlib.sha1()
+    for instrument in instruments:
+        hsh.update(str(instrument).encode("utf-8"))
+        hsh.update(b"\n")
+    return hsh.hexdigest()[:16]
+
+
+def make_unit(instruments, fields, **kwargs):
+    """
+    Enter the instruments and fields of a download and get its unit.
+
+    Arguments:
+
+    instruments: The instrument list of the unit.
+
+    fields: The fields of the unit.
+
+    Return: A dictionary with the field set, the list digest and **kwargs,
+    e.g. year=2020 and period="FY2020".
+    """
+    unit = dict(kwargs)
+    unit["fields"] = bsz.field_set_key(fields)
+    unit["list"] = list_digest(instruments)
+    return unit
+
+
+def unit_key(unit):
+    """ Enter a unit as a dictionary and get it as a string key. """
+    return js.dumps(unit, sort_keys=True, default=str)
+
+
+class Manifest:
+    """
+    Append-only JSONL manifest of completed batches and units.
+
+    Arguments:
+
+    file: The manifest file, e.g. the output file with suffix
+    .manifest.jsonl.
+
+    part_dir: Directory of the part files. Default is a directory named
+    after the manifest file.
+    """
+
+    def __init__(self, file, part_dir=None):
+        self.file = pl.Path(file)
+        if part_dir is None:
+            part_dir = self.file.parent.joinpath(f"{self.file.stem}_parts")
+        self.part_dir = pl.Path(part_dir)
+        self._lock = threading.Lock()
+        self._ranges = {}  # Unit key -> list of completed (start, end)
+        self._complete = set()  # Keys of completed units
+        if self.file.exists():
+            with open(self.file, mode="r", encoding="utf-8") as fl:
+                for line in fl:
+                    try:
+                        rec = js.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    self._add(rec)
+
+    @classmethod
+    def for_output(cls, out_file):
+        """ Enter an output file and get the manifest next to it. """
+        out_file = pl.Path(out_file)
+        return cls(out_file.with_name(f"{out_file.stem}.manifest.jsonl"))
+
+    def _add(self, rec):
+        if rec.get("complete"):
+            self._complete.add(rec["unit"])
+        else:
+            self._ranges.setdefault(rec["unit"], []).append(
+                tuple(rec["lines"])
+            )
+
+    def _append(self, rec):
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(self.file, mode="a", encoding="utf-8") as fl:
+                fl.write(js.dumps(rec) + "\n")
+                fl.flush()
+                os.fsync(fl.fileno())
+            self._add(rec)
+
+    def is_complete(self, unit):
+        """ Enter a unit and get True if it has been completed. """
+        return unit_key(unit) in self._complete
+
+    def mark_complete(self, unit):
+        """ Enter a unit and record it as completed. Drops its part files. """
+        self._append({"unit": unit_key(unit), "complete": True})
+        shutil.rmtree(self._unit_dir(unit), ignore_errors=True)
+
+    def done_ranges(self, unit):
+        """ Enter a unit and get its completed (start, end) line ranges. """
+        return sorted(self._ranges.get(unit_key(unit), []))
+
+    def pending_ranges(self, unit, n):
+        """
+        Enter a unit and the length of its list and get the missing ranges.
+
+        Return: A list of (start, end) ranges not yet completed.
+        """
+        pending = []
+        line_start = 0
+        for start, end in self.done_ranges(unit):
+            if start > line_start:
+                pending.append((line_start, start))
+            line_start = max(line_start, end)
+        if line_start < n:
+            pending.append((line_start, n))
+        return pending
+
+    def _unit_dir(self, unit):
+        digest = hashlib.sha1(unit_key(unit).encode("utf-8")).hexdigest()
+        return self.part_dir.joinpath(digest[:16])
+
+    def _part_file(self, unit, line_start, line_end):
+        return self._unit_dir(unit).joinpath(f"{line_start}_{line_end}.pkl")
+
+    def save_batch(self, unit, line_start, line_end, dta):
+        """
+        Enter a completed batch, save its data and record it as done.
+
+        Notes:
+        The part file is a pickle, so the data is read back with the dtypes
+        (or the raw dictionary) exactly as retrieved.
+        """
+        part_file = self._part_file(unit, line_start, line_end)
+        part_file.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle(dta, part_file)
+        self._append({"unit": unit_key(unit), "lines": [line_start, line_end]})
+
+    def read_batch(self, unit, line_start, line_end):
+        """ Enter a completed batch and get its data from the part file. """
+        return pd.read_pickle(self._part_file(unit, line_start, line_end))
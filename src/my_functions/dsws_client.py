@@ -0,0 +1,394 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with a batched client for Refinitiv Datastream (DSWS).
+
+DSWS takes a bundle of requests in one call, each request holding a list
+of instruments and datatypes. The client packs a list of instruments and
+datatypes into requests and bundles up to the limits of DSWS, keeps
+several bundles in flight at once, and converts each response into one
+row per instrument and date, with one column per datatype, as the Eikon
+scripts save their data. The batches are returned in the order of the
+instrument list and can be written to a snk.BatchSink, e.g. a Parquet
+file.
+
+fake_datastream is a local stand-in for DSWS, so the client can be run
+without credentials, e.g. dsc.connect(dsws=fake_datastream).
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import collections
+import concurrent.futures as cf
+import importlib
+import time  # For sleep functionality
+
+import numpy as np
+import pandas as pd
+from src.my_functions import retry_policy as rp
+
+# Limits of DSWS
+MAX_INSTRUMENTS = 50  # Instruments per request
+MAX_DATATYPES = 50  # Datatypes per request
+MAX_ITEMS = 100  # Instruments times datatypes per request
+MAX_BUNDLE_REQUESTS = 20  # Requests per bundle
+MAX_BUNDLE_ITEMS = 500  # Items per bundle
+MAX_WORKERS = 4  # Default number of bundles in flight at once
+ATTEMPTS = 5  # Default number of attempts per bundle
+PERMANENT_TEXT = [  # Errors of DSWS that retrying won't fix
+    "invalid username",
+    "invalid password",
+    "invalid credentials",
+    "not entitled",
+    "not authorised",
+    "not authorized",
+    "exceeds the limits",
+    "too many instruments",
+]
+
+
+def load_dsws(dsws=None):
+    """
+    Enter an optional module and get the module used for DSWS.
+
+    Arguments:
+
+    dsws: A module exposing Datastream, e.g. DatastreamDSWS. If None,
+    DatastreamDSWS is imported.
+    """
+    if dsws is None:
+        dsws = importlib.import_module("DatastreamDSWS")
+    return dsws
+
+
+def connect(username_file=None, password_file=None, dsws=None):
+    """
+    Enter the files with the DSWS credentials and get a session.
+
+    Arguments:
+
+    username_file, password_file: Text files with the username and the
+    password, e.g. Datastream_username.txt. None for no credentials, e.g.
+    for fake_datastream.
+
+    dsws: The module exposing Datastream. Default is DatastreamDSWS.
+
+    Return: A Datastream session.
+    """
+    dsws = load_dsws(dsws)
+    credentials = []
+    for file in [username_file, password_file]:
+        if file is None:
+            credentials.append("")
+        else:
+            with open(file, "r") as f:
+                credentials.append(f.read().strip())
+    return dsws.Datastream(username=credentials[0], password=credentials[1])
+
+
+def pack_requests(tickers, datatypes):
+    """
+    Enter instruments and datatypes and get them packed into requests.
+
+    Arguments:
+
+    tickers: The list of instruments, e.g. Datastream codes or RICs as <VOD.L>.
+
+    datatypes: The list of datatypes, e.g. ["P", "MV"].
+
+    Return: A list of (chunk, tickers, datatypes) tuples, where chunk is
+    the number of the chunk of instruments. Each chunk is requested with
+    all datatypes, in one or more requests in a row.
+
+    Notes:
+    A request holds at most MAX_INSTRUMENTS instruments, MAX_DATATYPES
+    datatypes and MAX_ITEMS instruments times datatypes.
+    """
+    per_request = max(1, min(len(datatypes), MAX_DATATYPES, MAX_ITEMS))
+    datatype_chunks = [
+        datatypes[start:start + per_request]
+        for start in range(0, len(datatypes), per_request)
+    ]
+    size = max(1, min(MAX_INSTRUMENTS, MAX_ITEMS // per_request))
+    requests = []
+    for chunk, start in enumerate(range(0, len(tickers), size)):
+        for datatype_chunk in datatype_chunks:
+            requests.append((chunk, tickers[start:start + size], datatype_chunk))
+    return requests
+
+
+def pack_bundles(requests):
+    """
+    Enter the requests and get them packed into bundles.
+
+    Return: A list of bundles, each a list of requests in the order given,
+    holding at most MAX_BUNDLE_REQUESTS requests and MAX_BUNDLE_ITEMS items.
+    """
+    bundles = []
+    bundle = []
+    items = 0
+    for request in requests:
+        request_items = len(request[1]) * len(request[2])
+        if bundle and (
+            len(bundle) >= MAX_BUNDLE_REQUESTS
+            or items + request_items > MAX_BUNDLE_ITEMS
+        ):
+            bundles.append(bundle)
+            bundle = []
+            items = 0
+        bundle.append(request)
+        items += request_items
+    if bundle:
+        bundles.append(bundle)
+    return bundles
+
+
+def classify(err):
+    """
+    Enter an exception raised by a DSWS call and get its kind.
+
+    Return: rp.TRANSIENT, rp.PERMANENT or rp.PROXY_DOWN, as rp.classify,
+    with the permanent errors of DSWS, e.g. bad credentials or a request
+    beyond the limits of DSWS.
+    """
+    text = str(err).lower()
+    if any(txt in text for txt in PERMANENT_TEXT):
+        return rp.PERMANENT
+    return rp.classify(err)
+
+
+def fetch_bundle(
+    ds,
+    bundle,
+    start="",
+    end="",
+    freq="D",
+    kind=1,
+    attempts=ATTEMPTS,
+    backoff_base=rp.BACKOFF_BASE,
+):
+    """
+    Enter a session and a bundle of requests and get the responses.
+
+    Arguments:
+
+    ds: A Datastream session.
+
+    bundle: A list of (chunk, tickers, datatypes) requests.
+
+    start, end: The first and last date, e.g. "2020-01-01", or relative
+    dates such as "-5Y".
+
+    freq: The frequency, i.e. D, W, M, Q or Y.
+
+    kind: 1 for time series, 0 for static data.
+
+    attempts: Number of attempts before giving up.
+
+    backoff_base: Seconds to sleep after the first failed attempt.
+
+    Return: A list of dataframes, one per request, as returned by
+    get_bundle_data.
+
+    Notes:
+    A permanent error, see classify, is raised at once.
+    """
+    posted = [
+        ds.post_user_request(
+            tickers=",".join(tickers),
+            fields=list(datatypes),
+            start=start,
+            end=end,
+            freq=freq,
+            kind=kind,
+        )
+        for chunk, tickers, datatypes in bundle
+    ]
+    for rec_attempts in range(attempts):
+        try:
+            return ds.get_bundle_data(bundleRequest=posted)
+        except Exception as own_err:
+            last_err = own_err
+            err_kind = classify(own_err)
+            print(
+                f"Exception ({err_kind}) in DSWS attempt # {str(rec_attempts)}: {str(own_err)}, was raised."
+            )
+            if err_kind == rp.PERMANENT:
+                raise
+            time.sleep(rp.backoff_seconds(rec_attempts, backoff_base))
+    raise RuntimeError(
+        f"All {attempts} attempts have failed for a bundle of {len(bundle)} requests."
+    ) from last_err
+
+
+def to_columnar(dta, datatypes):
+    """
+    Enter a response of DSWS and get one row per instrument and date.
+
+    Arguments:
+
+    dta: A dataframe of get_bundle_data. A time series is indexed by Dates
+    with the columns (Instrument, Datatype, Currency). Static data has the
+    columns Instrument, Datatype, Value and Dates.
+
+    datatypes: The datatypes of the request.
+
+    Return: A dataframe with the columns Instrument, Date, as e.g.
+    2020-12-31, and the datatypes. Error values, e.g. $$ER: 0904,NO DATA
+    AVAILABLE, are missing, and rows without any value are dropped.
+    """
+    columns = ["Instrument", "Date"] + list(datatypes)
+    if dta is None or dta.empty:
+        return pd.DataFrame(columns=columns)
+    if isinstance(dta.columns, pd.MultiIndex):
+        # Only Instrument and Datatype identify a column, e.g. the Currency
+        # level is dropped
+        if dta.columns.nlevels > 2:
+            dta = dta.droplevel(list(range(2, dta.columns.nlevels)), axis=1)
+        # Reshape the block of values at once, instrument by instrument
+        instruments = dta.columns.get_level_values(0).unique()
+        dta = dta.reindex(
+            columns=pd.MultiIndex.from_product([instruments, list(datatypes)])
+        )
+        dates = dta.index.to_numpy()
+        n_dates = len(dates)
+        values = (
+            dta.to_numpy()
+            .reshape(n_dates, len(instruments), len(datatypes))
+            .transpose(1, 0, 2)
+            .reshape(len(instruments) * n_dates, len(datatypes))
+        )
+        dta = pd.DataFrame(values, columns=list(datatypes)).infer_objects()
+        dta.insert(0, "Instrument", np.repeat(instruments.to_numpy(), n_dates))
+        dta.insert(1, "Date", np.tile(dates, len(instruments)))
+    else:
+        dta = dta.pivot_table(
+            index=["Instrument", "Dates"],
+            columns="Datatype",
+            values="Value",
+            aggfunc="first",
+            dropna=False,
+        ).reset_index()
+        dta = dta.rename(columns={"Dates": "Date"})
+        dta.columns.name = None
+    dta = dta.reindex(columns=columns)
+    dta["Date"] = pd.to_datetime(dta["Date"]).dt.strftime("%Y-%m-%d")
+    for col in columns[2:]:
+        # Only a column holding text can hold an error value
+        if not pd.api.types.is_numeric_dtype(dta[col]):
+            errors = dta[col].astype(str).str.startswith("$$ER")
+            dta[col] = dta[col].mask(errors).infer_objects()
+    return dta.dropna(how="all", subset=columns[2:]).reset_index(drop=True)
+
+
+def join_chunk(frames, datatypes):
+    """
+    Enter the frames of the requests of a chunk and get them as one.
+
+    The requests of a chunk have the same instruments and different
+    datatypes, so the frames are joined on Instrument and Date.
+    """
+    if len(frames) == 1:
+        dta = frames[0]
+    else:
+        dta = frames[0]
+        for frame in frames[1:]:
+            dta = dta.merge(frame, on=["Instrument", "Date"], how="outer")
+    return dta.reindex(columns=["Instrument", "Date"] + list(datatypes))
+
+
+def iter_chunks(ds, tickers, datatypes, max_workers=MAX_WORKERS, **kwargs):
+    """
+    Enter a session, instruments and datatypes and get the data by chunk.
+
+    At most max_workers bundles are in flight at once. The chunks are
+    yielded in the order of the instrument list.
+
+    Arguments:
+
+    ds: A Datastream session.
+
+    tickers: The list of instruments.
+
+    datatypes: The list of datatypes.
+
+    max_workers: Number of bundles in flight at once.
+
+    Return: A generator of (tickers, dta) tuples, with the instruments of
+    the chunk and its dataframe of to_columnar.
+
+    Notes:
+    **kwargs is for fetch_bundle, e.g. start, end, freq and kind.
+    """
+    requests = pack_requests(list(tickers), list(datatypes))
+    bundles = pack_bundles(requests)
+    print(
+        f" + {len(tickers)} instruments and {len(datatypes)} datatypes in "
+        f"{len(requests)} requests and {len(bundles)} bundles"
+    )
+    current = None  # The chunk being collected, (chunk, tickers, frames)
+
+    def collect(bundle, frames):
+        nonlocal current
+        for (chunk, chunk_tickers, chunk_datatypes), frame in zip(bundle, frames):
+            frame = to_columnar(frame, chunk_datatypes)
+            if current is not None and current[0] != chunk:
+                yield current[1], join_chunk(current[2], datatypes)
+                current = None
+            if current is None:
+                current = (chunk, chunk_tickers, [])
+            current[2].append(frame)
+
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = collections.deque()
+        for bundle in bundles:
+            pending.append((bundle, pool.submit(fetch_bundle, ds, bundle, **kwargs)))
+            # Keep the pool fed, but don't queue all bundles at once
+            if len(pending) >= 2 * max_workers:
+                bundle, future = pending.popleft()
+                yield from collect(bundle, future.result())
+        while pending:
+            bundle, future = pending.popleft()
+            yield from collect(bundle, future.result())
+    if current is not None:
+        yield current[1], join_chunk(current[2], datatypes)
+
+
+def get_data_bundled(ds, tickers, datatypes, sink=None, **kwargs):
+    """
+    Enter a session, instruments and datatypes and get all the data.
+
+    Arguments:
+
+    ds: A Datastream session.
+
+    tickers: The list of instruments.
+
+    datatypes: The list of datatypes.
+
+    sink: A snk.BatchSink. If given, each chunk is written to it as it
+    arrives, and nothing is kept in memory.
+
+    Return: The dataframe with the columns Instrument, Date and the
+    datatypes, or the number of rows written if sink is given.
+
+    Notes:
+    **kwargs is for iter_chunks and fetch_bundle, e.g. max_workers, start,
+    end, freq and kind.
+    """
+    dta_all = []
+    rows = 0
+    for chunk_tickers, dta in iter_chunks(ds, tickers, datatypes, **kwargs):
+        if dta.empty:
+            continue
+        if sink is not None:
+            rows += sink.write(dta)
+        else:
+            dta_all.append(dta)
+    if sink is not None:
+        return rows
+    if not dta_all:
+        return pd.DataFrame(columns=["Instrument", "Date"] + list(datatypes))
+    return pd.concat(dta_all, ignore_index=True)
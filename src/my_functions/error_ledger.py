@@ -0,0 +1,98 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with the error ledger of the retrieval engine.
+
+get_data returns the failures of single instruments in an error list next
+to the data, while the batch as a whole succeeds. The engine re-queues the
+instruments with transient errors, and records the failures it cannot
+recover in the ledger, an append-only JSONL file, so they can be found and
+retried without a full re-run.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import json as js
+import pathlib as pl
+import threading
+from datetime import datetime, timezone
+
+import pandas as pd
+from src.my_functions import batch_sizing as bsz
+
+
+class ErrorLedger:
+    """
+    Append-only JSONL file of instrument failures.
+
+    Arguments:
+
+    file: The ledger file, e.g. the output file with suffix .errors.jsonl.
+
+    Notes:
+    Each line holds the time, the instrument, the field set, the code and
+    message of the error, its kind (see rp.classify) and the number of
+    times the instrument was re-queued.
+    """
+
+    def __init__(self, file):
+        self.file = pl.Path(file)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_output(cls, out_file):
+        """ Enter an output file and get the ledger next to it. """
+        out_file = pl.Path(out_file)
+        return cls(out_file.with_name(f"{out_file.stem}.errors.jsonl"))
+
+    def record(self, entry, fields, kind, attempts=0):
+        """
+        Enter an entry of the error list of get_data and append it.
+
+        Arguments:
+
+        entry: The error dictionary, tagged with its instrument.
+
+        fields: The fields of the request.
+
+        kind: The kind of the error, e.g. rp.PERMANENT.
+
+        attempts: Number of times the instrument was re-queued.
+        """
+        rec = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "instrument": entry.get("instrument"),
+            "fields": bsz.field_set_key(fields),
+            "code": entry.get("code"),
+            "message": entry.get("message"),
+            "kind": kind,
+            "attempts": attempts,
+        }
+        with self._lock:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file, mode="a", encoding="utf-8") as fl:
+                fl.write(js.dumps(rec, default=str) + "\n")
+
+    def read(self):
+        """ Get the ledger as a dataframe, one row per recorded failure. """
+        if not self.file.exists():
+            return pd.DataFrame()
+        with open(self.file, mode="r", encoding="utf-8") as fl:
+            recs = []
+            for line in fl:
+                try:
+                    recs.append(js.loads(line))
+                except ValueError:
+                    continue  # A line cut short by a crash
+        return pd.DataFrame(recs)
+
+    def instruments(self, kind=None):
+        """ Enter an optional kind and get the set of failed instruments. """
+        dta = self.read()
+        if dta.empty:
+            return set()
+        if kind is not None:
+            dta = dta[dta["kind"] == kind]
+        return set(dta["instrument"].dropna())
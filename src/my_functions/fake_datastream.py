@@ -0,0 +1,286 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with an offline stand-in for the DatastreamDSWS package.
+
+It exposes the part of the DatastreamDSWS surface used by dsws_client,
+i.e. the Datastream class with post_user_request, get_bundle_data and
+get_data, and returns deterministic synthetic data in the same frames as
+DatastreamDSWS: a time series as a dataframe indexed by Dates with the
+columns (Instrument, Datatype, Currency), and static data as a dataframe with the
+columns Instrument, Datatype, Value and Dates. The limits of DSWS on
+instruments, datatypes and items per request and per bundle are enforced,
+and latency and errors can be configured, so the client can be measured
+and tested without DSWS credentials.
+
+Use it as the dsws of the client, e.g.
+
+    ds = dsc.connect(dsws=fake_datastream)
+
+or call install() before a script imports DatastreamDSWS.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import hashlib
+import random
+import sys
+import threading
+import time  # For sleep functionality
+
+import numpy as np
+import pandas as pd
+
+# Limits of DSWS
+MAX_INSTRUMENTS = 50  # Instruments per request
+MAX_DATATYPES = 50  # Datatypes per request
+MAX_ITEMS = 100  # Instruments times datatypes per request
+MAX_BUNDLE_REQUESTS = 20  # Requests per bundle
+CURRENCY = "U$"  # Currency level of the time series columns
+MAX_BUNDLE_ITEMS = 500  # Items per bundle
+
+# DSWS frequencies as pandas frequencies
+FREQUENCIES = {
+    "D": "B",
+    "W": "W-FRI",
+    "M": "ME",
+    "Q": "QE",
+    "Y": "YE",
+}
+
+
+class DSWSError(Exception):
+    """ Raised as DatastreamDSWS raises a failed request. """
+
+
+class FakeDatastream:
+    """
+    Synthetic DSWS service with configurable latency and errors.
+
+    Arguments:
+
+    latency: Seconds each call takes.
+
+    latency_per_item: Extra seconds per item (instrument times datatype).
+
+    error_rate: Share of calls failing with a transient error.
+
+    invalid: Instruments that DSWS doesn't know. Their values are $$ER
+    strings, as DSWS answers an invalid code.
+
+    seed: Seed of the error injection.
+
+    Notes:
+    The data only depend on the instrument, the datatype and the date, so
+    the same request always gets the same response. Each instrument has a
+    fixed lifetime, outside which its values are missing.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        latency_per_item=0.0,
+        error_rate=0.0,
+        invalid=(),
+        seed=0,
+    ):
+        self.latency = latency
+        self.latency_per_item = latency_per_item
+        self.error_rate = error_rate
+        self.invalid = set(invalid)
+        self.calls = 0
+        self.requests = 0
+        self.items = 0
+        self.rows = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """ Get the counts of calls, requests, items and rows served. """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "requests": self.requests,
+                "items": self.items,
+                "rows": self.rows,
+                "max_in_flight": self.max_in_flight,
+            }
+
+    def _enter(self, requests, items):
+        with self._lock:
+            self.calls += 1
+            self.requests += requests
+            self.items += items
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failed = self._random.random() < self.error_rate
+        time.sleep(self.latency + self.latency_per_item * items)
+        if failed:
+            with self._lock:
+                self.in_flight -= 1
+            raise DSWSError("Service Unavailable (503)")
+
+    def _leave(self, rows):
+        with self._lock:
+            self.in_flight -= 1
+            self.rows += rows
+
+    def get_bundle_data(self, bundleRequest=None):
+        """
+        Enter a list of requests of post_user_request and get a dataframe
+        per request, as DatastreamDSWS.
+        """
+        bundleRequest = list(bundleRequest or [])
+        items = sum(_items(req) for req in bundleRequest)
+        if len(bundleRequest) > MAX_BUNDLE_REQUESTS or items > MAX_BUNDLE_ITEMS:
+            raise DSWSError(
+                f"Bundle of {len(bundleRequest)} requests and {items} items "
+                "exceeds the limits"
+            )
+        self._enter(len(bundleRequest), items)
+        try:
+            frames = [_respond(req, self.invalid) for req in bundleRequest]
+        except Exception:
+            self._leave(0)
+            raise
+        self._leave(sum(len(frame) for frame in frames))
+        return frames
+
+
+def _items(request):
+    """ Enter a request and get its number of items. """
+    tickers = request["Instrument"]["Value"].split(",")
+    return len(tickers) * len(request["DataTypes"])
+
+
+def _digest(*parts):
+    text = "|".join(str(part) for part in parts)
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _lifetime(ticker):
+    """ Enter a ticker and get the first and last date it has data. """
+    first = pd.Timestamp("1990-01-01") + pd.Timedelta(
+        days=_digest("first", ticker) % 10000
+    )
+    last = first + pd.Timedelta(days=365 + _digest("last", ticker) % 9000)
+    return first, last
+
+
+def _value(ticker, datatype, dte):
+    number = _digest(ticker, datatype, dte) % 2000001 - 1000000
+    return round(number / 1000, 3)
+
+
+def _respond(request, invalid):
+    """ Enter a request and get its dataframe, or raise DSWSError. """
+    tickers = request["Instrument"]["Value"].split(",")
+    datatypes = [dtp["Value"] for dtp in request["DataTypes"]]
+    if len(tickers) > MAX_INSTRUMENTS or len(datatypes) > MAX_DATATYPES:
+        raise DSWSError("Too many instruments or datatypes in a request")
+    if len(tickers) * len(datatypes) > MAX_ITEMS:
+        raise DSWSError(
+            f"Request of {len(tickers) * len(datatypes)} items exceeds the limits"
+        )
+    date = request["Date"]
+    if date["Kind"] == 0:
+        # Static data, one row per instrument and datatype
+        start = pd.Timestamp(date["Start"] or "today").normalize()
+        rows = [
+            [
+                ticker,
+                datatype,
+                "$$ER: E100,INVALID CODE OR EXPRESSION ENTERED"
+                if ticker in invalid
+                else _value(ticker, datatype, start),
+                start,
+            ]
+            for ticker in tickers
+            for datatype in datatypes
+        ]
+        return pd.DataFrame(rows, columns=["Instrument", "Datatype", "Value", "Dates"])
+    dates = pd.date_range(
+        date["Start"], date["End"], freq=FREQUENCIES.get(date["Frequency"] or "D", "B")
+    )
+    columns = {}
+    for ticker in tickers:
+        first, last = _lifetime(ticker)
+        alive = (dates >= first) & (dates <= last)
+        for datatype in datatypes:
+            if ticker in invalid:
+                values = ["$$ER: E100,INVALID CODE OR EXPRESSION ENTERED"] * len(dates)
+            else:
+                values = [
+                    _value(ticker, datatype, dte) if flag else np.nan
+                    for dte, flag in zip(dates, alive)
+                ]
+            columns[(ticker, datatype, CURRENCY)] = values
+    dta = pd.DataFrame(columns, index=pd.Index(dates, name="Dates"))
+    dta.columns = pd.MultiIndex.from_tuples(
+        list(columns), names=["Instrument", "Datatype", "Currency"]
+    )
+    return dta
+
+
+_fake = FakeDatastream()
+
+
+def configure(**kwargs):
+    """
+    Enter the settings of the fake and get the fake used by the module.
+
+    Notes:
+    **kwargs is for FakeDatastream, e.g. latency=0.5 or error_rate=0.1.
+    The Datastream sessions then use the new fake.
+    """
+    global _fake
+    _fake = FakeDatastream(**kwargs)
+    return _fake
+
+
+def get_fake():
+    """ Get the fake used by the Datastream sessions. """
+    return _fake
+
+
+class Datastream:
+    """
+    Session of the fake, as DatastreamDSWS.Datastream.
+
+    Notes:
+    The credentials are accepted, but not checked.
+    """
+
+    def __init__(self, username="", password="", **kwargs):
+        self.username = username
+
+    def post_user_request(self, tickers, fields=None, start="", end="", freq="", kind=1):
+        """ Enter a request and get it as a dictionary for get_bundle_data. """
+        return {
+            "Instrument": {"Value": tickers, "Properties": None},
+            "DataTypes": [{"Value": fld, "Properties": None} for fld in fields or []],
+            "Date": {"Start": start, "End": end, "Frequency": freq, "Kind": kind},
+            "Tag": None,
+        }
+
+    def get_bundle_data(self, bundleRequest=None):
+        return _fake.get_bundle_data(bundleRequest)
+
+    def get_data(self, tickers, fields=None, start="", end="", freq="", kind=1):
+        return _fake.get_bundle_data(
+            [self.post_user_request(tickers, fields, start, end, freq, kind)]
+        )[0]
+
+
+def install():
+    """
+    Register the fake as the DatastreamDSWS package.
+
+    Notes:
+    Call it before a script runs `import DatastreamDSWS as dsws`.
+    """
+    sys.modules["DatastreamDSWS"] = sys.modules[__name__]
@@ -0,0 +1,612 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with an offline stand-in for the eikon package.
+
+It exposes the part of the eikon surface used by the scripts, i.e.
+get_data, TR_Field, get_symbology, set_app_key and set_timeout, and returns
+deterministic synthetic data with the same column names as Eikon, e.g.
+"Instrument", "Period End Date" and "Daily Total Return". Latency, errors
+and payload limits can be configured, so the retrieval engine can be
+measured and tested without a running Eikon proxy.
+
+Use it as the api of the engine, e.g.
+
+    rtv.get_data_batched(own_list, own_fields, api=fake_eikon)
+
+or call install() before a script imports eikon.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import hashlib
+import random
+import re
+import sys
+import threading
+import time  # For sleep functionality
+
+import pandas as pd
+
+__version__ = "0.0.0+fake"
+
+# Display names of the fields used in the scripts, as returned by Eikon
+# with field_name=False. Other fields get a name made from the field name.
+DISPLAY_NAMES = {
+    "TR.PRICECLOSEDATE": "Date",
+    "TR.TOTALRETURN1D": "Daily Total Return",
+    "TR.TOTALASSETSREPORTED.PERIODENDDATE": "Period End Date",
+    "TR.F.PERIODENDDATE": "Period End Date",
+    "TR.F.ORIGINALANNOUNCEMENTDATE": "Original Announcement Date",
+    "TR.ORGANIZATIONID": "Organization PermID",
+    "TR.ULTIMATEPARENTID": "Ultimate Parent Id",
+    "TR.INSTRUMENTID": "Instrument PermID",
+    "TR.QUOTEID": "Quote PermID",
+    "TR.LEGALENTITYIDENTIFIER": "LEI",
+    "TR.RIC": "RIC",
+    "TR.ISIN": "ISIN",
+    "TR.SEDOL": "SEDOL",
+    "TR.FIRSTTRADEDATE": "First Trade Date",
+    "TR.RETIREDATE": "Retire Date",
+    "TR.COMMONNAME": "Company Common Name",
+    "TR.HQCOUNTRYCODE": "Country ISO Code of Headquarters",
+    "TR.REGCOUNTRYCODE": "Country ISO Code of Incorporation",
+    "TR.EXCHANGECOUNTRYCODE": "Country ISO Code of Exchange",
+    "TR.ORGTYPECODE": "Organization Type Code",
+    "TR.EPSMEAN": "Earnings Per Share - Mean",
+    "TR.EPSMEDIAN": "Earnings Per Share - Median",
+    "TR.EPSSTDDEV": "Earnings Per Share - Standard Deviation",
+    "TR.EPSNUMINCESTIMATES": "Earnings Per Share - Number of Included Estimates",
+    "TR.EPSACTVALUE": "Earnings Per Share - Actual",
+}
+SUFFIX_NAMES = {
+    "PERIODENDDATE": "Period End Date",
+    "ANNOUNCEDATE": "Announce Date",
+    "ORIGDATE": "Original Announcement Date",
+    "DATE": "Date",
+}
+# Frq parameter -> Pandas frequency of the synthetic time series
+FREQUENCIES = {
+    "D": "B",
+    "W": "W-FRI",
+    "M": "ME",
+    "CQ": "QE",
+    "CY": "YE",
+    "FQ": "QE",
+    "FI": "QE",
+    "FS": "2QE",
+    "FY": "YE",
+}
+MAX_DATES = 10000  # Longest time series per instrument and request
+SCREEN_POOL = 2000  # Organizations a SCREEN expression selects from
+
+
+class EikonError(Exception):
+    """ Error raised by the fake, with a code and a message like eikon's. """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        return f"Error code {self.code} | {self.message}"
+
+
+def TR_Field(field_name, params=None, sort_dir=None, sort_priority=None):
+    """
+    Enter a field name and its parameters and get a field as eikon does.
+
+    Return: A dictionary {field_name: {"params": params, ...}}.
+    """
+    field = {field_name: {}}
+    if params:
+        field[field_name]["params"] = params
+    if sort_dir is not None:
+        field[field_name]["sort_dir"] = sort_dir
+    if sort_priority is not None:
+        field[field_name]["sort_priority"] = sort_priority
+    return field
+
+
+def _digest(*parts):
+    text = "|".join(str(part) for part in parts)
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], 16)
+
+
+def display_name(field):
+    """ Enter a field name and get its display name, e.g. "Date". """
+    upper = field.upper()
+    if upper in DISPLAY_NAMES:
+        return DISPLAY_NAMES[upper]
+    stem, _, suffix = upper.rpartition(".")
+    if stem.startswith("TR") and suffix in SUFFIX_NAMES:
+        return SUFFIX_NAMES[suffix]
+    # E.g. TR.F.TotRevenue -> Tot Revenue
+    name = field.rsplit(".", 1)[-1]
+    return re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name)
+
+
+class FakeEikon:
+    """
+    Offline stand-in for the eikon package.
+
+    Arguments:
+
+    latency: Seconds each call takes.
+
+    latency_per_point: Extra seconds per requested data point.
+
+    error_rate: Share of calls failing with a transient error.
+
+    errors: A list of exceptions raised, in order, by the next calls, e.g.
+    [EikonError(503, "Backend error. 503 Service Unavailable")].
+
+    empty_rate: Share of instruments without any data.
+
+    partial_error_rate: Share of instruments failing with a transient error
+    inside an otherwise successful call. They get an empty row and an entry
+    in the error list.
+
+    invalid: Instruments that cannot be resolved. They get an empty row
+    and an entry in the error list.
+
+    max_points: Largest request, in data points (instruments times
+    fields). Larger requests fail with a transient error. None for no limit.
+
+    max_rows: Largest response in rows. Longer responses are cut short
+    without an error, like a truncated payload. None for no limit.
+
+    proxy_down: True to fail every call as if the Eikon proxy is down.
+
+    seed: Seed of the error injection.
+
+    universe_version: The version of the screened universe. About one in
+    twenty organizations selected by a screen differ between versions, as
+    between two runs of a screen some time apart.
+
+    Notes:
+    The data only depend on the instrument, the field and the date, so the
+    same request always gets the same response.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        latency_per_point=0.0,
+        error_rate=0.0,
+        errors=None,
+        empty_rate=0.0,
+        partial_error_rate=0.0,
+        invalid=(),
+        max_points=None,
+        max_rows=None,
+        proxy_down=False,
+        seed=0,
+        universe_version=0,
+    ):
+        self.latency = latency
+        self.latency_per_point = latency_per_point
+        self.error_rate = error_rate
+        self.errors = list(errors or [])
+        self.empty_rate = empty_rate
+        self.partial_error_rate = partial_error_rate
+        self.invalid = set(invalid)
+        self.max_points = max_points
+        self.max_rows = max_rows
+        self.proxy_down = proxy_down
+        self.universe_version = universe_version
+        self.app_key = None
+        self.timeout = 30
+        self.calls = 0
+        self.points = 0
+        self.rows = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # CONFIGURATION
+    def set_app_key(self, app_key):
+        self.app_key = app_key
+
+    def get_app_key(self):
+        return self.app_key
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def get_timeout(self):
+        return self.timeout
+
+    def stats(self):
+        """ Get the counts of calls, data points and rows served. """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "points": self.points,
+                "rows": self.rows,
+                "max_in_flight": self.max_in_flight,
+            }
+
+    # CALLS
+    def _enter(self, points):
+        with self._lock:
+            self.calls += 1
+            self.points += points
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.errors:
+                err = self.errors.pop(0)
+            elif self.proxy_down:
+                err = EikonError(
+                    500, "Eikon Proxy not running or cannot be reached"
+                )
+            elif self.max_points is not None and points > self.max_points:
+                err = EikonError(
+                    413, "Backend error. 413 Request Entity Too Large"
+                )
+            elif self._random.random() < self.error_rate:
+                err = EikonError(503, "Backend error. 503 Service Unavailable")
+            else:
+                err = None
+        time.sleep(self.latency + self.latency_per_point * points)
+        if err is not None:
+            with self._lock:
+                self.in_flight -= 1
+            raise err
+
+    def _leave(self, rows):
+        with self._lock:
+            self.in_flight -= 1
+            self.rows += rows
+
+    def _has_data(self, instrument):
+        if instrument in self.invalid:
+            return False
+        return _digest("empty", instrument) % 10000 >= self.empty_rate * 10000
+
+    def _screen(self, expression):
+        """ Enter a SCREEN expression and get the organizations selected. """
+        return [
+            str(4295000000 + i)
+            for i in range(SCREEN_POOL)
+            if _digest("screen", expression, i) % 4 == 0
+            and _digest("drift", i, self.universe_version) % 20 != 0
+        ]
+
+    def get_data(
+        self,
+        instruments,
+        fields,
+        parameters=None,
+        field_name=False,
+        raw_output=False,
+        debug=False,
+    ):
+        """
+        Enter instruments and fields and get synthetic data, as get_data.
+
+        Return: The tuple (dta, err), where err is a list of error
+        dictionaries or None, or the raw output dictionary if raw_output is
+        True.
+
+        Notes:
+        If the parameters, or those of the first field having any, hold
+        SDate and EDate, each instrument gets one row per date between them
+        at the frequency Frq (default daily), within a fixed lifetime of the
+        instrument. Otherwise each instrument gets one row. A field with
+        parameters of its own gets its own dates, in the same rows as the
+        other fields.
+        """
+        if isinstance(instruments, str):
+            instruments = [instruments]
+        # A screen is answered with the organizations it selects
+        instruments = [
+            org
+            for instrument in instruments
+            for org in (
+                self._screen(instrument)
+                if str(instrument).upper().startswith("SCREEN(")
+                else [instrument]
+            )
+        ]
+        if isinstance(fields, (str, dict)):
+            fields = [fields]
+        names = []
+        name_params = []  # The parameters of each field, if any
+        params = dict(parameters or {})
+        for fld in fields:
+            if isinstance(fld, dict):
+                for name, spec in fld.items():
+                    names.append(name)
+                    name_params.append(spec.get("params"))
+                    if not params and spec.get("params"):
+                        params = dict(spec["params"])
+            else:
+                names.append(fld)
+                name_params.append(None)
+        self._enter(len(instruments) * len(names))
+        try:
+            name_dates = [
+                _dates({**params, **(own or {})}) for own in name_params
+            ]
+            headers = [{"displayName": "Instrument"}] + [
+                {"displayName": display_name(name), "field": name.upper()}
+                for name in names
+            ]
+            data = []
+            errors = []
+            for instrument in instruments:
+                with self._lock:
+                    partial = self._random.random() < self.partial_error_rate
+                if partial:
+                    data.append([instrument] + [None] * len(names))
+                    errors.append(
+                        {
+                            "code": 2504,
+                            "col": 1,
+                            "message": "Backend error. 500 Internal Server Error",
+                            "row": len(data) - 1,
+                        }
+                    )
+                    continue
+                if not self._has_data(instrument):
+                    data.append([instrument] + [None] * len(names))
+                    if instrument in self.invalid:
+                        errors.append(
+                            {
+                                "code": 412,
+                                "col": 0,
+                                "message": "Unable to resolve all requested identifiers.",
+                                "row": len(data) - 1,
+                            }
+                        )
+                    continue
+                instrument_dates = [
+                    _instrument_dates(instrument, dates) for dates in name_dates
+                ]
+                rows = max(len(dates) for dates in instrument_dates)
+                if not rows:
+                    # Not listed in the period, answered with an empty row
+                    data.append([instrument] + [None] * len(names))
+                # Fields with other dates are padded, as the rows are shared
+                for i in range(rows):
+                    data.append(
+                        [instrument]
+                        + [
+                            _value(instrument, name, dates[i])
+                            if i < len(dates)
+                            else None
+                            for name, dates in zip(names, instrument_dates)
+                        ]
+                    )
+            if self.max_rows is not None:
+                data = data[:self.max_rows]
+            self._leave(len(data))
+        except Exception:
+            self._leave(0)
+            raise
+        raw = {
+            "columnHeadersCount": 1,
+            "data": data,
+            "headerOrientation": "horizontal",
+            "headers": [headers],
+            "rowHeadersCount": 1,
+            "totalColumnsCount": len(headers),
+            "totalRowsCount": len(data),
+        }
+        if errors:
+            raw["error"] = errors
+        if raw_output:
+            return raw
+        key = "field" if field_name else "displayName"
+        columns = [hdr.get(key, hdr["displayName"]) for hdr in headers]
+        dta = pd.DataFrame(data, columns=columns)
+        return dta, errors or None
+
+    def get_symbology(
+        self,
+        symbol,
+        from_symbol_type="RIC",
+        to_symbol_type=None,
+        raw_output=False,
+        debug=False,
+        best_match=True,
+    ):
+        """
+        Enter symbols and get synthetic symbols of other types.
+
+        Return: A dataframe indexed by symbol, or the raw output dictionary
+        {"mappedSymbols": [...]} if raw_output is True.
+        """
+        if isinstance(symbol, str):
+            symbol = [symbol]
+        if to_symbol_type is None:
+            to_symbol_type = ["RIC", "ISIN", "CUSIP", "SEDOL", "ticker"]
+        elif isinstance(to_symbol_type, str):
+            to_symbol_type = [to_symbol_type]
+        self._enter(len(symbol))
+        mapped = []
+        for sym in symbol:
+            entry = {"symbol": sym}
+            if not self._has_data(sym):
+                entry["error"] = "Unknown symbol"
+                mapped.append(entry)
+                continue
+            for sym_type in to_symbol_type:
+                if best_match:
+                    entry.setdefault("bestMatch", {})[sym_type] = _symbol(
+                        sym, sym_type, 0
+                    )
+                else:
+                    n_symbols = 1 + _digest("n", sym, sym_type) % 3
+                    entry[f"{sym_type}s"] = [
+                        _symbol(sym, sym_type, i) for i in range(n_symbols)
+                    ]
+            mapped.append(entry)
+        self._leave(len(mapped))
+        if raw_output:
+            return {"mappedSymbols": mapped}
+        rows = {}
+        for entry in mapped:
+            row = {}
+            for sym_type in to_symbol_type:
+                if best_match:
+                    row[sym_type] = entry.get("bestMatch", {}).get(sym_type)
+                else:
+                    row[sym_type] = (entry.get(f"{sym_type}s") or [None])[0]
+            if "error" in entry:
+                row["error"] = entry["error"]
+            rows[entry["symbol"]] = row
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def _param(params, name):
+    # Eikon's parameter names are case-insensitive, e.g. Edate and EDate
+    for key, value in params.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def _dates(params):
+    """ Enter the parameters of a request and get its dates, or [None]. """
+    sdate = _param(params, "SDate")
+    edate = _param(params, "EDate")
+    if sdate is None or edate is None:
+        return [None]
+    frq = str(_param(params, "Frq") or "D").upper()
+    try:
+        start = pd.Timestamp(sdate)
+        end = pd.Timestamp(edate)
+    except ValueError:
+        return [None]  # Relative dates, e.g. 0D, are treated as one date
+    if start > end:
+        start, end = end, start
+    dates = pd.date_range(start, end, freq=FREQUENCIES.get(frq, "B"))
+    return list(dates[-MAX_DATES:]) or [end]
+
+
+def _lifetime(instrument):
+    """ Enter an instrument and get the first and last date it is listed. """
+    first = pd.Timestamp("1995-01-01") + pd.Timedelta(
+        days=_digest("first", instrument) % 10000
+    )
+    last = first + pd.Timedelta(days=200 + _digest("last", instrument) % 8000)
+    return first, last
+
+
+def _instrument_dates(instrument, dates):
+    """ Enter an instrument and the dates of a request and get its dates. """
+    if dates == [None]:
+        return dates
+    # Each instrument is listed for a fixed lifetime, whatever the request
+    first, last = _lifetime(instrument)
+    return [dte for dte in dates if first <= dte <= last]
+
+
+def _value(instrument, field, dte):
+    """ Enter an instrument, a field and a date and get a synthetic value. """
+    upper = field.upper()
+    name = display_name(field)
+    if upper.endswith(".FPERIOD"):
+        # The fiscal years of the fake end in December
+        return f"FY{dte.year}" if dte is not None else None
+    if "DATE" in upper:
+        if dte is not None:
+            return dte.strftime("%Y-%m-%d")
+        days = _digest(instrument, upper) % 9000
+        return (pd.Timestamp("2000-01-01") + pd.Timedelta(days=days)).strftime(
+            "%Y-%m-%d"
+        )
+    if upper.endswith("ID") or upper.endswith("CODE") or name in [
+        "RIC",
+        "ISIN",
+        "SEDOL",
+        "LEI",
+        "Company Common Name",
+    ]:
+        return f"{name.replace(' ', '')}-{_digest(instrument, upper) % 10 ** 8}"
+    number = _digest(instrument, upper, dte) % 2000001 - 1000000
+    return round(number / 10000, 4)
+
+
+def _symbol(sym, sym_type, i):
+    return f"{sym_type.upper()}{_digest(sym, sym_type, i) % 10 ** 9:09d}"
+
+
+_fake = FakeEikon()
+
+
+def configure(**kwargs):
+    """
+    Enter the settings of the fake and get the fake used by the module.
+
+    Notes:
+    **kwargs is for FakeEikon, e.g. latency=0.5 or error_rate=0.1. The
+    module functions get_data, get_symbology etc. then use the new fake.
+    """
+    global _fake
+    _fake = FakeEikon(**kwargs)
+    return _fake
+
+
+def get_fake():
+    """ Get the fake used by the module functions. """
+    return _fake
+
+
+def get_data(
+    instruments,
+    fields,
+    parameters=None,
+    field_name=False,
+    raw_output=False,
+    debug=False,
+):
+    return _fake.get_data(
+        instruments, fields, parameters, field_name, raw_output, debug
+    )
+
+
+def get_symbology(
+    symbol,
+    from_symbol_type="RIC",
+    to_symbol_type=None,
+    raw_output=False,
+    debug=False,
+    best_match=True,
+):
+    return _fake.get_symbology(
+        symbol, from_symbol_type, to_symbol_type, raw_output, debug, best_match
+    )
+
+
+def set_app_key(app_key):
+    _fake.set_app_key(app_key)
+
+
+def get_app_key():
+    return _fake.get_app_key()
+
+
+def set_timeout(timeout):
+    _fake.set_timeout(timeout)
+
+
+def get_timeout():
+    return _fake.get_timeout()
+
+
+def install():
+    """
+    Register the fake as the eikon package.
+
+    Notes:
+    Call it before a script runs `import eikon as ek`, e.g. from a
+    benchmark that runs the script with runpy.
+    """
+    sys.modules["eikon"] = sys.modules[__name__]
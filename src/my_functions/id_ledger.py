@@ -0,0 +1,217 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with the ledger of ids already collected.
+
+The date range scripts worked out what was left to do by reading their
+whole out-file and no_data file on every start, and merging them with the
+source list with indicator=True. The ledger is instead an SQLite file next
+to the out-file, with the id as primary key, updated in one transaction
+as each chunk is saved. The pending ids are then found by an indexed join,
+without reading the csv-files.
+
+The csv-files stay the output. The ledger only records which ids they
+hold, and how far into each csv-file it has read, so delete the ledger
+together with the out-file to start anew. A run that stops after a chunk
+is appended, but before it is recorded, leaves rows beyond that point,
+which the next run records before it looks for pending ids.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import contextlib
+import io
+import os
+import pathlib as pl
+import sqlite3
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from src.my_functions import own_functions as own
+
+FOUND = "found"  # The id has a row in the out-file
+NO_DATA = "no_data"  # The id was answered without data
+
+
+class IdLedger:
+    """
+    SQLite file of the ids collected, with their status.
+
+    Arguments:
+
+    file: The ledger file, e.g. the output file with suffix
+    .ledger.sqlite.
+
+    id_name: The id column of the csv-files, e.g. QuoteID.
+
+    Notes:
+    The table ids has the columns id (primary key), status, FOUND or
+    NO_DATA, firstdt, lastdt and updated. The table meta holds the byte
+    offset read up to in each csv-file. Each call opens its own
+    connection, so the file can be read while a run is writing to it.
+    """
+
+    def __init__(self, file, id_name):
+        self.file = pl.Path(file)
+        self.id_name = id_name
+        self.files = []  # The csv-files of import_files
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY, "
+                "status TEXT NOT NULL, firstdt TEXT, lastdt TEXT, updated TEXT) "
+                "WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    @classmethod
+    def for_output(cls, out_file, id_name):
+        """ Enter an output file and get the ledger next to it. """
+        out_file = pl.Path(out_file)
+        return cls(out_file.with_name(f"{out_file.stem}.ledger.sqlite"), id_name)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.file, timeout=60)
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL
+        try:
+            with conn:  # One transaction, committed or rolled back
+                yield conn
+        finally:
+            conn.close()
+
+    def count(self, status=None):
+        """ Enter an optional status and get the number of ids recorded. """
+        with self._connect() as conn:
+            if status is None:
+                return conn.execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+            return conn.execute(
+                "SELECT COUNT(*) FROM ids WHERE status = ?", (status,)
+            ).fetchone()[0]
+
+    def record(self, found=None, no_data=()):
+        """
+        Enter the ids of a saved chunk and record them in one transaction.
+
+        Arguments:
+
+        found: A dataframe with id_name, firstdt and lastdt, as appended to
+        the out-file.
+
+        no_data: The ids appended to the no_data file.
+
+        Notes:
+        Call it after the chunk is appended to the csv-files. An id already
+        recorded is updated. The sizes of the csv-files of import_files are
+        stored in the same transaction, as the offsets read up to.
+        """
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        rows = []
+        if found is not None and not found.empty:
+            rows += [
+                (str(idx), FOUND, firstdt, lastdt, now)
+                for idx, firstdt, lastdt in zip(
+                    found[self.id_name].tolist(),
+                    found["firstdt"].tolist(),
+                    found["lastdt"].tolist(),
+                )
+            ]
+        rows += [(str(idx), NO_DATA, None, None, now) for idx in no_data]
+        rows.sort()  # Inserted in key order, the index is appended to
+        offsets = [
+            (_offset_key(csv_file), str(os.path.getsize(csv_file)))
+            for csv_file in self.files
+            if os.path.exists(csv_file)
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO ids VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", offsets)
+        return len(rows)
+
+    def pending(self, ids):
+        """
+        Enter a list of ids and get those not recorded.
+
+        Return: A list of the ids not in the ledger, in the order given.
+        """
+        ids = [str(idx) for idx in ids]
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE candidates (pos INTEGER, id TEXT)")
+            conn.executemany(
+                "INSERT INTO candidates VALUES (?, ?)", list(enumerate(ids))
+            )
+            pending = conn.execute(
+                "SELECT candidates.id FROM candidates "
+                "LEFT JOIN ids ON ids.id = candidates.id "
+                "WHERE ids.id IS NULL ORDER BY candidates.pos"
+            ).fetchall()
+        return [row[0] for row in pending]
+
+    def import_files(self, out_file, err_file=None):
+        """
+        Enter the out-file and the no_data file and record the ids not read.
+
+        The csv-files are read from the offset stored by the last record,
+        i.e. in full the first time, as for the runs before the ledger
+        existed, and only for the rows appended after the last record
+        later on. Later runs thus find all ids of the csv-files in the
+        ledger, also those of a chunk saved but not recorded.
+
+        Return: The number of ids recorded, 0 if none were left.
+        """
+        self.files = [
+            pl.Path(csv_file) for csv_file in [out_file, err_file] if csv_file is not None
+        ]
+        with self._connect() as conn:
+            offsets = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        rows = 0
+        if out_file is not None and os.path.exists(out_file):
+            found = _read_tail(out_file, int(offsets.get(_offset_key(out_file), 0)))
+            if not found.empty:
+                found = found.dropna(subset=[self.id_name])
+                found = found.drop_duplicates(subset=[self.id_name], keep="last")
+                rows += self.record(found=found)
+        if err_file is not None and os.path.exists(err_file):
+            no_data = _read_tail(err_file, int(offsets.get(_offset_key(err_file), 0)))
+            if not no_data.empty:
+                no_data = no_data[self.id_name].dropna().drop_duplicates()
+                # An id both found and without data keeps the data found
+                no_data = self.pending(no_data)
+                rows += self.record(no_data=no_data)
+        # Also stores the offsets of csv-files without new rows
+        self.record()
+        if rows:
+            print(f"Recorded {rows} ids of {out_file} in {self.file.name}")
+        return rows
+
+
+def _offset_key(csv_file):
+    """ Enter a csv-file and get its key in the table meta. """
+    return f"offset:{pl.Path(csv_file).name}"
+
+
+def _read_tail(csv_file, offset):
+    """
+    Enter a csv-file and a byte offset and get the rows after the offset.
+
+    Notes:
+    The header is the first line of the file. A last line without a line
+    break, i.e. one cut off while it was written, is left out. A file
+    shorter than the offset has been started anew, and is read in full.
+    """
+    with open(csv_file, mode="rb") as own_file:
+        header = own_file.readline()
+        if offset > os.path.getsize(csv_file):
+            offset = 0
+        own_file.seek(max(offset, len(header)))
+        tail = own_file.read()
+    tail = tail[: tail.rfind(b"\n") + 1]
+    if not tail:
+        return pd.DataFrame()
+    return own.read_csv_file(io.BytesIO(header + tail))
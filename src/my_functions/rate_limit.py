@@ -0,0 +1,236 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with a token-bucket rate limiter for the Eikon API.
+
+Each call to ek.get_data and ek.get_symbology first takes one token from a
+requests bucket (requests per second) and one token per data point from a
+data points bucket (data points per minute). The buckets are kept in a
+state file guarded by a lock file, so several scripts running in parallel
+on one workstation share the same quota.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import json as js
+import os
+import pathlib as pl
+import threading
+import time  # For sleep functionality
+
+STATE_DIR = pl.Path.home().joinpath(".refinitiv")
+REQUESTS_PER_SECOND = 5  # Eikon Data API limit on requests per second
+DATAPOINTS_PER_MINUTE = 1_000_000  # Set to the quota of the licence
+
+
+class FileLock:
+    """
+    Lock shared between processes through a lock file.
+
+    The lock is a lock of the operating system on the lock file, i.e.
+    msvcrt.locking on Windows and fcntl.flock on Linux. It is released by
+    the operating system when the process ends, so a crashed process
+    doesn't leave it behind, and the lock file itself is never removed.
+    """
+
+    def __init__(self, file):
+        self.file = pl.Path(file)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.file, os.O_CREAT | os.O_RDWR)
+            try:
+                _lock_file(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            _unlock_file(fd)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_file(fd):
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)  # The first byte
+                return
+            except OSError:
+                time.sleep(0.005)  # Held by another process
+
+    def _unlock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)  # Blocks while held by another process
+
+    def _unlock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """
+    Rate limiter with a requests bucket and a data points bucket.
+
+    Arguments:
+
+    requests_per_second: Refill rate, and capacity, of the requests bucket.
+
+    datapoints_per_minute: Capacity of the data points bucket, refilled
+    over one minute. None to only limit the requests.
+
+    state_dir: Directory of the state and lock files. Limiters using the
+    same directory share the quota.
+
+    name: Name of the state and lock files, e.g. eikon.
+    """
+
+    def __init__(
+        self,
+        requests_per_second=REQUESTS_PER_SECOND,
+        datapoints_per_minute=DATAPOINTS_PER_MINUTE,
+        state_dir=STATE_DIR,
+        name="eikon",
+    ):
+        self.requests_per_second = requests_per_second
+        self.datapoints_per_minute = datapoints_per_minute
+        state_dir = pl.Path(state_dir)
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.state_file = state_dir.joinpath(f"{name}_rate.json")
+        self.lock = FileLock(state_dir.joinpath(f"{name}_rate.lock"))
+
+    def _read_state(self, now):
+        try:
+            with open(self.state_file, mode="r", encoding="utf-8") as fl:
+                state = js.load(fl)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        requests = state.get("requests", self.requests_per_second)
+        datapoints = state.get("datapoints", self.datapoints_per_minute)
+        updated = state.get("updated", now)
+        # Refill both buckets for the time passed since the last update
+        elapsed = max(0.0, now - updated)
+        requests = min(
+            self.requests_per_second,
+            requests + elapsed * self.requests_per_second,
+        )
+        if self.datapoints_per_minute is not None:
+            datapoints = min(
+                self.datapoints_per_minute,
+                datapoints + elapsed * self.datapoints_per_minute / 60,
+            )
+        return requests, datapoints
+
+    def _write_state(self, requests, datapoints, now):
+        state = {"requests": requests, "datapoints": datapoints, "updated": now}
+        with open(self.state_file, mode="w", encoding="utf-8") as fl:
+            fl.write(js.dumps(state))
+
+    def acquire(self, points=0):
+        """
+        Enter the number of data points of a request and wait for tokens.
+
+        Arguments:
+
+        points: The expected number of data points, e.g. the number of
+        instruments times the number of fields. Capped at the capacity of
+        the data points bucket.
+
+        Return: The number of seconds waited.
+        """
+        if self.datapoints_per_minute is not None:
+            points = min(points, self.datapoints_per_minute)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.time()
+                requests, datapoints = self._read_state(now)
+                wait = 0.0
+                if requests < 1:
+                    wait = (1 - requests) / self.requests_per_second
+                if (
+                    self.datapoints_per_minute is not None
+                    and datapoints < points
+                ):
+                    wait = max(
+                        wait,
+                        (points - datapoints) * 60 / self.datapoints_per_minute,
+                    )
+                if wait == 0:
+                    if self.datapoints_per_minute is not None:
+                        datapoints -= points
+                    self._write_state(requests - 1, datapoints, now)
+                    return waited
+                self._write_state(requests, datapoints, now)
+            time.sleep(wait)
+            waited += wait
+
+
+_limiter = None
+
+
+def get_limiter():
+    """ Get the limiter shared by all Eikon calls of this process. """
+    global _limiter
+    if _limiter is None:
+        _limiter = TokenBucket()
+    return _limiter
+
+
+def count_points(instruments, fields):
+    """
+    Enter instruments and fields and get the expected number of data points.
+
+    Arguments:
+
+    instruments: An instrument, or a list of instruments.
+
+    fields: A field, or a list of fields.
+
+    Return: The number of instruments times the number of fields.
+    """
+    n_instruments = 1 if isinstance(instruments, str) else len(instruments)
+    n_fields = 1 if isinstance(fields, (str, dict)) else len(fields)
+    return n_instruments * n_fields
+
+
+def acquire(instruments=(), fields=(), limiter=None):
+    """
+    Enter the instruments and fields of a request and wait for its tokens.
+
+    Arguments:
+
+    instruments: The instruments of the coming request.
+
+    fields: The fields of the coming request. Empty for get_symbology.
+
+    limiter: A TokenBucket. Default is the shared limiter.
+
+    Return: The number of seconds waited.
+    """
+    if limiter is None:
+        limiter = get_limiter()
+    points = count_points(instruments, fields) if fields else 0
+    return limiter.acquire(points)
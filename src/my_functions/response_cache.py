@@ -0,0 +1,313 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with an opt-in on-disk cache for Eikon responses.
+
+A response is stored under a hash of the normalized request, i.e. the
+function name, the instruments, the fields and the parameters. Dataframes
+are stored as compressed Arrow IPC files and raw output dictionaries as
+gzipped json-files. Entries older than the TTL are ignored, and the least
+recently used entries are evicted when the cache grows beyond its size.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import gzip
+import hashlib
+import json as js
+import os
+import pathlib as pl
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+CACHE_DIR = pl.Path.home().joinpath(".refinitiv", "cache")
+TTL = 7 * 24 * 3600  # Seconds an entry is valid
+MAX_BYTES = 5 * 1024 ** 3  # Size of the cache before eviction
+LOW_WATER = 0.9  # Share of max_bytes kept after an eviction
+COMPRESSION = "zstd"  # Compression of the Arrow IPC files
+
+
+def request_key(func, instruments, fields=None, **params):
+    """
+    Enter a request and get its content address.
+
+    Arguments:
+
+    func: Name of the Eikon function, e.g. get_data or get_symbology.
+
+    instruments: An instrument or a list of instruments.
+
+    fields: A field, or a list of fields and/or ek.TR_Field objects.
+
+    Return: A sha256 hex digest of the normalized request.
+
+    Notes:
+    **params are the other arguments of the call, e.g. raw_output.
+    The key is that of the exact batch, so a cached run only finds its
+    responses again if the batches are the same, i.e. a fixed batch size
+    rather than a learned one.
+    """
+    if isinstance(instruments, str):
+        instruments = [instruments]
+    if isinstance(fields, (str, dict)):
+        fields = [fields]
+    request = {
+        "func": func,
+        "instruments": [str(instrument) for instrument in instruments],
+        "fields": fields,
+        "params": params,
+    }
+    text = js.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of Eikon responses.
+
+    Arguments:
+
+    cache_dir: Directory of the cache files.
+
+    ttl: Seconds an entry is valid. None to keep entries forever.
+
+    max_bytes: Size of the cache in bytes. The least recently used entries
+    are evicted beyond it, down to LOW_WATER of it.
+
+    Notes:
+    The size is counted as entries are stored, and the cache directory is
+    only scanned when the count passes max_bytes, so the count of the
+    entries stored by other processes is caught up then.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=TTL, max_bytes=MAX_BYTES):
+        self.cache_dir = pl.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._total = None  # Bytes in the cache, counted at the first put
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The lock is not picklable, e.g. for the processes of shd.run_sharded
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _files(self, key):
+        sub_dir = self.cache_dir.joinpath(key[:2])
+        return (
+            sub_dir.joinpath(f"{key}.arrow"),
+            sub_dir.joinpath(f"{key}.err.json.gz"),
+            sub_dir.joinpath(f"{key}.json.gz"),
+        )
+
+    def _fresh(self, file):
+        if not file.exists():
+            return False
+        if self.ttl is not None and time.time() - file.stat().st_mtime > self.ttl:
+            return False
+        return True
+
+    def get(self, key):
+        """
+        Enter a request key and get the cached response.
+
+        Return: The tuple (hit, dta, err). hit is False if there is no
+        valid entry.
+        """
+        dta_file, err_file, json_file = self._files(key)
+        try:
+            if self._fresh(dta_file):
+                dta = _read_arrow(dta_file)
+                err = _read_json(err_file) if err_file.exists() else None
+                os.utime(dta_file, (time.time(), dta_file.stat().st_mtime))
+                return True, dta, err
+            if self._fresh(json_file):
+                dta = _read_json(json_file)
+                os.utime(json_file, (time.time(), json_file.stat().st_mtime))
+                return True, dta, None
+        except (OSError, ValueError, pa.ArrowException):
+            pass  # A damaged entry is a miss
+        return False, None, None
+
+    def put(self, key, dta, err=None):
+        """
+        Enter a request key and its response and store it.
+
+        Notes:
+        A dataframe that Arrow cannot convert, e.g. a column mixing numbers
+        and strings, is not cached.
+        """
+        files = self._files(key)
+        dta_file, err_file, json_file = files
+        replaced = _size(files)
+        try:
+            dta_file.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(dta, pd.DataFrame):
+                # The error list of get_data is kept next to the frame
+                if err is not None:
+                    _write_json(err, err_file)
+                elif err_file.exists():
+                    err_file.unlink()  # Of an entry replaced
+                _write_arrow(dta, dta_file)
+            elif dta is not None:
+                _write_json(dta, json_file)
+        except (pa.ArrowException, OSError, TypeError, ValueError) as cache_err:
+            print(f"Response not cached: {str(cache_err)}")
+            return
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan()[1]
+            else:
+                self._total += _size(files) - replaced
+            full = self._total > self.max_bytes
+        if full:
+            self.evict()
+
+    def _scan(self):
+        """ Get the entries of the cache, by key, and their bytes. """
+        entries = {}
+        total = 0
+        for fl in self.cache_dir.rglob("*"):
+            if fl.suffix == ".tmp" or not fl.is_file():
+                continue  # A file being written
+            try:
+                st = fl.stat()
+            except OSError:
+                continue
+            key = fl.name.split(".")[0]  # The files of an entry share the key
+            files, size, atime = entries.get(key, ([], 0, 0))
+            entries[key] = (files + [fl], size + st.st_size, max(atime, st.st_atime))
+            total += st.st_size
+        return entries, total
+
+    def evict(self):
+        """
+        Delete the least recently used entries beyond max_bytes.
+
+        Notes:
+        The files of an entry, e.g. the frame and its error list, are
+        deleted together, down to LOW_WATER of max_bytes.
+        """
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            entries, total = self._scan()
+            if total > self.max_bytes:
+                # Oldest access time first
+                for files, size, atime in sorted(
+                    entries.values(), key=lambda entry: entry[2]
+                ):
+                    if total <= self.max_bytes * LOW_WATER:
+                        break
+                    for fl in files:
+                        try:
+                            fl.unlink()
+                        except OSError:
+                            pass
+                    total -= size
+            self._total = total
+
+    def clear(self):
+        """ Delete all entries. """
+        for fl in self.cache_dir.rglob("*"):
+            if fl.is_file():
+                fl.unlink()
+        with self._lock:
+            self._total = 0
+
+
+def _size(files):
+    """ Enter the files of an entry and get their bytes. """
+    size = 0
+    for fl in files:
+        try:
+            size += fl.stat().st_size
+        except OSError:
+            pass  # Not there
+    return size
+
+
+def _write_arrow(df, file):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+    tmp_file = file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(tmp_file), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file, file)
+
+
+def _read_arrow(file):
+    with pa.memory_map(str(file), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _write_json(dta, file):
+    tmp_file = file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with gzip.open(tmp_file, mode="wt", encoding="utf-8") as fl:
+        js.dump(dta, fl)
+    os.replace(tmp_file, file)
+
+
+def _read_json(file):
+    with gzip.open(file, mode="rt", encoding="utf-8") as fl:
+        return js.load(fl)
+
+
+def cached_call(cache, func_name, func, instruments, fields=None, **kwargs):
+    """
+    Enter a cache and an Eikon call and get the response, cached or not.
+
+    Arguments:
+
+    cache: A ResponseCache, or None to always call func.
+
+    func_name: Name of the function, part of the request key.
+
+    func: The function to call on a miss, e.g. ek.get_symbology.
+
+    instruments: The instruments of the call.
+
+    fields: The fields of the call, or None for get_symbology.
+
+    Return: The response of func.
+
+    Notes:
+    **kwargs is for func.
+    """
+    if cache is None:
+        return _call(func, instruments, fields, **kwargs)
+    key = request_key(func_name, instruments, fields, **kwargs)
+    hit, dta, err = cache.get(key)
+    if hit:
+        return (dta, err) if _returns_tuple(fields, kwargs) else dta
+    response = _call(func, instruments, fields, **kwargs)
+    if _returns_tuple(fields, kwargs):
+        cache.put(key, *response)
+    else:
+        cache.put(key, response)
+    return response
+
+
+def _returns_tuple(fields, kwargs):
+    # get_data returns (dta, err) unless raw_output is True
+    return fields is not None and not kwargs.get("raw_output")
+
+
+def _call(func, instruments, fields, **kwargs):
+    if fields is None:
+        return func(instruments, **kwargs)
+    return func(instruments=instruments, fields=fields, **kwargs)
@@ -0,0 +1,1086 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with the shared retrieval engine for Refinitiv Eikon's
+get_data.
+
+The scripts in refinitiv_api_code used to carry their own copy of the
+batch loop, sending one request at a time. The engine below splits a list
+of instruments into batches and keeps several batches in flight at once,
+while still returning the batches in the order of the instrument list.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import collections
+import concurrent.futures as cf
+import importlib
+import os
+import pathlib as pl
+import queue
+import threading
+import time  # For sleep functionality
+
+import pandas as pd
+from src.my_functions import batch_sizing as bsz
+from src.my_functions import rate_limit as rl
+from src.my_functions import response_cache as rc
+from src.my_functions import retry_policy as rp
+
+SIZE = 1500  # Default number of instruments per batch
+MAX_WORKERS = 4  # Default number of batches in flight at once
+ATTEMPTS = 20  # Default number of attempts per batch
+BISECT_ATTEMPTS = 3  # Attempts per half when a failing batch is split
+REQUEUE_ATTEMPTS = 2  # Times an instrument failing inside a batch is re-queued
+REQUEUE_SIZE = 50  # Number of instruments per re-queued batch
+PARSE_WORKERS = 2  # Default number of batches cleaned at once
+QUEUE_SIZE = 8  # Default number of batches waiting between two stages
+
+
+class RetrievalError(Exception):
+    """ Raised when all attempts to retrieve a batch have failed. """
+
+
+class PermanentError(RetrievalError):
+    """ Raised when a batch fails with an error that retrying won't fix. """
+
+
+class Quarantine:
+    """
+    Tab-separated file of instruments that make their batch fail.
+
+    Arguments:
+
+    file: The quarantine file, e.g. quarantine_quoteid.csv next to the
+    no_data.csv file.
+
+    id_name: Header of the instrument column, e.g. QuoteID.
+
+    Notes:
+    The file has the columns id_name, Fields and Error, like the no_data
+    files it is appended to across runs. It is guarded by a rl.FileLock,
+    since the shards of a sharded run share it.
+    """
+
+    def __init__(self, file, id_name="Instrument"):
+        self.file = pl.Path(file)
+        self.id_name = id_name
+        self.lock = rl.FileLock(self.file.with_name(f"{self.file.name}.lock"))
+
+    def add(self, instrument, fields, err):
+        """ Enter a failing instrument and its error and append it. """
+        row = pd.DataFrame(
+            {
+                self.id_name: [instrument],
+                "Fields": [bsz.field_set_key(fields)],
+                "Error": [" ".join(str(err).split())],
+            }
+        )
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            new_file = not self.file.exists()
+            row.to_csv(
+                self.file,
+                mode="w" if new_file else "a",
+                sep="\t",
+                encoding="utf-8",
+                index=False,
+                header=new_file,
+            )
+
+    def instruments(self):
+        """ Get the set of quarantined instruments. """
+        if not os.path.exists(self.file):
+            return set()
+        dta = pd.read_csv(self.file, sep="\t", dtype=str)
+        return set(dta[self.id_name].dropna())
+
+
+def load_api(api=None):
+    """
+    Enter an optional module and get the module used for the retrieval.
+
+    Arguments:
+
+    api: A module exposing get_data, e.g. eikon. If None, eikon is imported.
+
+    Return: The module exposing get_data.
+    """
+    if api is None:
+        api = importlib.import_module("eikon")
+    return api
+
+
+def split_batches(instruments, size=SIZE, ranges=None):
+    """
+    Enter a list of instruments and get the (line_start, line_end) pairs.
+
+    Arguments:
+
+    instruments: The list of instruments, e.g. QuoteIDs.
+
+    size: Number of instruments per batch, or a bsz.AdaptiveBatchSize or
+    bsz.RowBudget that is asked for the size of each new batch.
+
+    ranges: The (start, end) line ranges to cover. Default is the whole
+    list.
+
+    Return: A generator of (line_start, line_end) tuples covering the
+    ranges.
+    """
+    if ranges is None:
+        ranges = [(0, len(instruments))]
+    for line_start, range_end in ranges:
+        while line_start < range_end:
+            if isinstance(size, bsz.AdaptiveBatchSize):
+                line_end = line_start + size.next_size()
+            elif isinstance(size, bsz.RowBudget):
+                line_end = line_start + size.size_at(line_start)
+            else:
+                line_end = line_start + size
+            line_end = min(line_end, range_end)
+            yield line_start, line_end
+            line_start = line_end
+
+
+def fetch_batch(
+    instruments,
+    fields,
+    api=None,
+    attempts=ATTEMPTS,
+    backoff_base=rp.BACKOFF_BASE,
+    sizer=None,
+    limiter=None,
+    breaker=None,
+    cache=None,
+    **kwargs,
+):
+    """
+    Enter a batch of instruments and fields and get the data from Eikon.
+
+    Arguments:
+
+    instruments: The batch of instruments.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    api: The module exposing get_data. Default is eikon.
+
+    attempts: Number of attempts before giving up.
+
+    backoff_base: Seconds to sleep after the first failed attempt. The
+    sleep then grows exponentially, with jitter.
+
+    sizer: A bsz.AdaptiveBatchSize told about the latency and failures.
+
+    limiter: A rl.TokenBucket paced before each attempt. Default is the
+    limiter shared by all Eikon calls.
+
+    breaker: A rp.CircuitBreaker pausing all workers while the Eikon proxy
+    is down. Default is the breaker shared by all Eikon calls.
+
+    cache: A rc.ResponseCache. If given, a cached response is returned
+    without calling Eikon, and a new response is cached.
+
+    Return: The tuple (dta, err) as returned by get_data.
+
+    Notes:
+    **kwargs is for get_data, e.g. field_name and raw_output.
+    Raises PermanentError at once on errors that retrying won't fix, and
+    RetrievalError if all attempts fail.
+    """
+    api = load_api(api)
+    if cache is not None:
+        key = rc.request_key("get_data", instruments, fields, **kwargs)
+        hit, dta, err = cache.get(key)
+        if hit:
+            return dta, err
+    if breaker is None:
+        breaker = rp.get_breaker()
+    for rec_attempts in range(attempts):
+        breaker.wait()
+        rl.acquire(instruments, fields, limiter)
+        started = time.monotonic()
+        try:
+            if kwargs.get("raw_output"):
+                # Raw output is a single dictionary, holding the error list
+                dta = api.get_data(
+                    instruments=instruments, fields=fields, **kwargs
+                )
+                err = dta.get("error") if isinstance(dta, dict) else None
+            else:
+                dta, err = api.get_data(
+                    instruments=instruments, fields=fields, **kwargs
+                )
+        except Exception as own_err:
+            last_err = own_err
+            kind = rp.classify(own_err)
+            print(
+                f"Exception ({kind}) in attempt # {str(rec_attempts)}: {str(own_err)}, was raised."
+            )
+            if kind == rp.PERMANENT:
+                raise PermanentError(
+                    f"Permanent error for {len(instruments)} instruments: {str(own_err)}"
+                ) from own_err
+            # Try again after an exponential backoff
+            rp.handle_failure(own_err, rec_attempts, breaker, backoff_base)
+            if sizer is not None and kind == rp.TRANSIENT:
+                sizer.record_failure(len(instruments))
+                size = sizer.next_size()
+                if len(instruments) > size:
+                    # Don't retry an oversized batch, fetch it in parts of
+                    # the shrunk size instead
+                    return _fetch_parts(
+                        [
+                            instruments[line_start:line_start + size]
+                            for line_start in range(0, len(instruments), size)
+                        ],
+                        fields,
+                        api=api,
+                        attempts=attempts,
+                        backoff_base=backoff_base,
+                        sizer=sizer,
+                        limiter=limiter,
+                        breaker=breaker,
+                        cache=cache,
+                        **kwargs,
+                    )
+            continue
+        else:
+            breaker.record_success()
+            break
+    else:
+        # All attempts failed
+        raise RetrievalError(
+            f"All {attempts} attempts have failed for {len(instruments)} instruments."
+        ) from last_err
+    err = tag_errors(instruments, dta, err)
+    if sizer is not None:
+        truncated = sizer.record_success(
+            len(instruments),
+            time.monotonic() - started,
+            rows=len(dta) if isinstance(dta, pd.DataFrame) else None,
+        )
+        if truncated and len(instruments) > 1:
+            # Fetch the truncated batch again as two halves
+            half = len(instruments) // 2
+            dta, err = _fetch_parts(
+                [instruments[:half], instruments[half:]],
+                fields,
+                api=api,
+                attempts=attempts,
+                backoff_base=backoff_base,
+                sizer=sizer,
+                limiter=limiter,
+                breaker=breaker,
+                cache=cache,
+                **kwargs,
+            )
+    if cache is not None and not any(
+        rp.classify_entry(entry) != rp.PERMANENT for entry in err or []
+    ):
+        # Don't keep a response with failures that a retry may recover
+        cache.put(key, dta, err)
+    return dta, err
+
+
+def tag_errors(instruments, dta, err):
+    """
+    Enter a response of get_data and get its error list, with instruments.
+
+    Arguments:
+
+    instruments: The instruments of the request.
+
+    dta: The dataframe, or raw output dictionary, of the response.
+
+    err: The error list of the response, i.e. dictionaries with code,
+    message, row and col.
+
+    Return: The error list with the instrument of each error added, or None
+    if there are no errors.
+
+    Notes:
+    The row of an error is the row of the response, so the instrument is
+    taken from the first column of that row. The instrument is kept when
+    batches are combined, while the row is not valid anymore.
+    """
+    if not err:
+        return None
+    if isinstance(instruments, str):
+        instruments = [instruments]
+    if isinstance(dta, dict):
+        rows = [row[0] for row in dta.get("data", []) if row]
+    elif isinstance(dta, pd.DataFrame) and not dta.empty:
+        rows = dta.iloc[:, 0].tolist()
+    else:
+        rows = list(instruments)
+    tagged = []
+    for entry in err:
+        entry = dict(entry)
+        row = entry.get("row")
+        if "instrument" not in entry and isinstance(row, int):
+            if row < len(rows):
+                entry["instrument"] = rows[row]
+        tagged.append(entry)
+    return tagged
+
+
+def drop_instruments(dta, instruments):
+    """ Enter a batch and a list of instruments and drop their rows. """
+    instruments = set(instruments)
+    if isinstance(dta, dict):
+        dta = dict(dta)
+        dta["data"] = [
+            row for row in dta.get("data", []) if row and row[0] not in instruments
+        ]
+        dta["totalRowsCount"] = len(dta["data"])
+        return dta
+    if isinstance(dta, pd.DataFrame) and not dta.empty:
+        return dta[~dta.iloc[:, 0].isin(instruments)]
+    return dta
+
+
+def combine_batches(batches):
+    """
+    Enter a list of retrieved batches and get them as one batch.
+
+    Arguments:
+
+    batches: A list of dataframes, or of raw output dictionaries.
+
+    Return: A dataframe, or a raw output dictionary holding all the data.
+    """
+    batches = [dta for dta in batches if dta is not None]
+    if all(isinstance(dta, dict) for dta in batches) and batches:
+        # Raw output. Eikon holds the actual data as a list inside the dict
+        dta = dict(batches[0])
+        dta["data"] = [row for part in batches for row in part["data"]]
+        dta["totalRowsCount"] = len(dta["data"])
+        errors = [entry for part in batches for entry in part.get("error", [])]
+        dta.pop("error", None)
+        if errors:
+            dta["error"] = errors
+        return dta
+    frames = [dta for dta in batches if not dta.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def _fetch_parts(parts, fields, fetch=fetch_batch, **kwargs):
+    """ Enter a list of instrument lists and get their data as one batch. """
+    dta_parts = []
+    err_parts = []
+    for part in parts:
+        dta, err = fetch(part, fields, **kwargs)
+        dta_parts.append(dta)
+        if err is not None:
+            err_parts.append(err)
+    dta = combine_batches(dta_parts)
+    err = [row for part in err_parts for row in part] if err_parts else None
+    return dta, err
+
+
+def fetch_bisect(
+    instruments,
+    fields,
+    quarantine=None,
+    bisect_attempts=BISECT_ATTEMPTS,
+    **kwargs,
+):
+    """
+    Enter a batch of instruments and fields and get the data from Eikon.
+
+    If the batch keeps failing, it is split in half, and the halves are
+    split again, until the failing instruments are found. These are added
+    to the quarantine, while the data of the other instruments is returned.
+
+    Arguments:
+
+    instruments: The batch of instruments.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    quarantine: A Quarantine. If None, a failing batch raises as in
+    fetch_batch.
+
+    bisect_attempts: Number of attempts per half, fewer than for the whole
+    batch since a half is expected to fail again.
+
+    Return: The tuple (dta, err) as returned by get_data. dta is None if all
+    instruments of the batch are quarantined.
+
+    Notes:
+    **kwargs is for fetch_batch and get_data.
+    A batch failing because the Eikon proxy is down is not split, since all
+    of its instruments would be quarantined. Neither is a batch failing
+    with a permanent error not caused by an instrument, e.g. a bad field
+    name, which is raised as a PermanentError.
+    """
+    if not instruments:
+        return None, None  # All instruments of the batch are quarantined
+    try:
+        return fetch_batch(instruments, fields, **kwargs)
+    except RetrievalError as batch_err:
+        cause = batch_err.__cause__
+        if quarantine is None or (
+            cause is not None and rp.classify(cause) == rp.PROXY_DOWN
+        ):
+            raise
+        if isinstance(batch_err, PermanentError) and not rp.is_instrument_error(
+            cause if cause is not None else batch_err
+        ):
+            raise
+        if len(instruments) == 1:
+            reason = cause if cause is not None else batch_err
+            print(f"     Quarantined {instruments[0]}: {str(reason)}")
+            quarantine.add(instruments[0], fields, reason)
+            return None, None
+    half = len(instruments) // 2
+    print(f"     Splitting a failing batch of {len(instruments)} instruments")
+    kwargs["attempts"] = min(kwargs.get("attempts", ATTEMPTS), bisect_attempts)
+    return _fetch_parts(
+        [instruments[:half], instruments[half:]],
+        fields,
+        fetch=fetch_bisect,
+        quarantine=quarantine,
+        bisect_attempts=bisect_attempts,
+        **kwargs,
+    )
+
+
+def fetch_recover(
+    instruments,
+    fields,
+    ledger=None,
+    requeue_attempts=REQUEUE_ATTEMPTS,
+    requeue_size=REQUEUE_SIZE,
+    backoff_base=rp.BACKOFF_BASE,
+    **kwargs,
+):
+    """
+    Enter a batch of instruments and fields and get the data from Eikon.
+
+    Instruments failing with a transient error inside an otherwise
+    successful batch are re-queued, after a backoff, in small batches of
+    their own. The failures that remain are recorded in the ledger.
+
+    Arguments:
+
+    instruments: The batch of instruments.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    ledger: An erl.ErrorLedger recording the failures not recovered.
+
+    requeue_attempts: Number of times a failed instrument is re-queued.
+
+    requeue_size: Number of instruments per re-queued batch.
+
+    backoff_base: See fetch_batch.
+
+    Return: The tuple (dta, err), where err holds the failures not
+    recovered, or None.
+
+    Notes:
+    **kwargs is for fetch_bisect, fetch_batch and get_data.
+    """
+    dta, err = fetch_bisect(
+        instruments, fields, backoff_base=backoff_base, **kwargs
+    )
+    kept = []  # Failures not re-queued
+    for attempt in range(requeue_attempts + 1):
+        retry = []
+        for entry in err or []:
+            kind = rp.classify_entry(entry)
+            if (
+                kind != rp.PERMANENT
+                and entry.get("instrument") is not None
+                and attempt < requeue_attempts
+            ):
+                retry.append(entry)
+            else:
+                kept.append(entry)
+                if ledger is not None:
+                    ledger.record(entry, fields, kind, attempt)
+        if not retry:
+            break
+        failed = list(dict.fromkeys(entry["instrument"] for entry in retry))
+        print(f"     Re-queueing {len(failed)} failed instruments")
+        time.sleep(rp.backoff_seconds(attempt, backoff_base))
+        dta_retry, err = _fetch_parts(
+            [
+                failed[line_start:line_start + requeue_size]
+                for line_start in range(0, len(failed), requeue_size)
+            ],
+            fields,
+            fetch=fetch_bisect,
+            backoff_base=backoff_base,
+            **kwargs,
+        )
+        dta = combine_batches([drop_instruments(dta, failed), dta_retry])
+    if isinstance(dta, dict):
+        # Raw output holds the error list too
+        dta = dict(dta)
+        dta.pop("error", None)
+        if kept:
+            dta["error"] = kept
+    return dta, kept or None
+
+
+def split_errors(err):
+    """
+    Enter the error list of a response and get its instruments by outcome.
+
+    Return: The tuple (answered, failed) of sets of instruments. answered
+    holds the instruments with a permanent error, e.g. code 412 or 416,
+    i.e. answered without data. failed holds the instruments with a
+    transient error not recovered, which a later run may recover.
+    """
+    answered = set()
+    failed = set()
+    for entry in err or []:
+        if entry.get("instrument") is None:
+            continue
+        if rp.classify_entry(entry) == rp.PERMANENT:
+            answered.add(entry["instrument"])
+        else:
+            failed.add(entry["instrument"])
+    return answered, failed
+
+
+def partition_fields(fields, field_groups, key_fields=None):
+    """
+    Enter a list of fields and get it split into narrower groups.
+
+    Arguments:
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    field_groups: Number of groups.
+
+    key_fields: The names of the fields identifying a row within an
+    instrument, e.g. TR.F.IncomeStatement.periodenddate. They are part of
+    every group.
+
+    Return: A list of lists with the positions of the fields of each group,
+    in the order of the fields.
+    """
+    names = [_field_name(fld) for fld in fields]
+    keys = [pos for pos, name in enumerate(names) if name in (key_fields or [])]
+    others = [pos for pos in range(len(fields)) if pos not in keys]
+    field_groups = max(1, min(field_groups, len(others)))
+    step = -(-len(others) // field_groups)  # Rounded up
+    return [
+        sorted(keys + others[pos:pos + step])
+        for pos in range(0, len(others), step)
+    ]
+
+
+def _field_name(fld):
+    # A TR_Field is a dictionary keyed by the field name
+    if isinstance(fld, dict):
+        return next(iter(fld))
+    return fld
+
+
+def join_partitions(parts, groups, keys):
+    """
+    Enter the frames of the field groups and get them as one frame.
+
+    Arguments:
+
+    parts: The dataframes of the groups, each with the instrument column
+    followed by one column per field of the group.
+
+    groups: The positions of the fields of each group, see
+    partition_fields.
+
+    keys: The positions of the key fields, part of every group.
+
+    Return: A dataframe with the instrument column and one column per field
+    in the order of the fields, as if fetched in one request. None if the
+    rows of the groups don't align.
+
+    Notes:
+    The rows are joined on the instrument, the key fields and the
+    occurrence of the key within the instrument. Without key fields, this
+    is the row number within the instrument. The rows don't align if the
+    groups differ in the number of rows of an instrument, or if a row
+    finds no match.
+    """
+    frames = []
+    names = {}
+    for part, group in zip(parts, groups):
+        if part is None or part.shape[1] != len(group) + 1:
+            return None  # A field gave several columns, or none at all
+        names[-1] = part.columns[0]
+        names.update(zip(group, part.columns[1:]))
+        part = part.copy()
+        part.columns = ["_instrument"] + [f"_f{pos}" for pos in group]
+        frames.append(part)
+    sizes = [part.groupby("_instrument", sort=True).size() for part in frames]
+    if any(not size.equals(sizes[0]) for size in sizes[1:]):
+        return None
+    on = ["_instrument"] + [f"_f{pos}" for pos in keys]
+    for part in frames:
+        part["_row"] = part.groupby(on, sort=False, dropna=False).cumcount()
+    dta = frames[0]
+    for part in frames[1:]:
+        # The groups have the same number of rows, so if every row finds
+        # its match, the rows of the groups are one-to-one
+        try:
+            dta = dta.merge(
+                part,
+                how="left",
+                on=on + ["_row"],
+                validate="one_to_one",
+                indicator=True,
+            )
+        except pd.errors.MergeError:
+            return None
+        if (dta["_merge"] != "both").any():
+            return None
+        dta = dta.drop(columns="_merge")
+    positions = sorted(pos for group in groups for pos in group)
+    columns = ["_instrument"] + [f"_f{pos}" for pos in dict.fromkeys(positions)]
+    dta = dta[columns]
+    dta.columns = [names[-1]] + [names[pos] for pos in dict.fromkeys(positions)]
+    return dta.reset_index(drop=True)
+
+
+def fetch_partitioned(
+    instruments, fields, field_groups=None, key_fields=None, **kwargs
+):
+    """
+    Enter a batch of instruments and fields and get the data from Eikon.
+
+    The fields are split into field_groups narrower groups, which are
+    fetched concurrently and joined back together.
+
+    Arguments:
+
+    instruments: The batch of instruments.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    field_groups: Number of groups. None or 1 to fetch all fields at once.
+
+    key_fields: The names of the fields identifying a row within an
+    instrument, e.g. the period end date, see join_partitions.
+
+    Return: The tuple (dta, err) as returned by get_data.
+
+    Notes:
+    **kwargs is for fetch_recover, fetch_bisect, fetch_batch and get_data.
+    If the rows of the groups don't align, the batch is fetched again with
+    all fields at once. Raw output is always fetched at once.
+    """
+    if not field_groups or field_groups < 2 or kwargs.get("raw_output"):
+        return fetch_recover(instruments, fields, **kwargs)
+    groups = partition_fields(fields, field_groups, key_fields)
+    if len(groups) < 2:
+        return fetch_recover(instruments, fields, **kwargs)
+    names = [_field_name(fld) for fld in fields]
+    keys = [pos for pos, name in enumerate(names) if name in (key_fields or [])]
+    # The groups fail for the same instruments, so their failures are
+    # recorded once, when the groups are joined
+    ledger = kwargs.pop("ledger", None)
+    records = _GroupRecords()
+    with cf.ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        futures = [
+            pool.submit(
+                fetch_recover,
+                instruments,
+                [fields[pos] for pos in group],
+                ledger=records,
+                **kwargs,
+            )
+            for group in groups
+        ]
+        results = [future.result() for future in futures]
+    parts = [dta for dta, err in results]
+    if all(dta is None for dta in parts):
+        return None, None  # All instruments are quarantined
+    dta = join_partitions(parts, groups, keys)
+    if dta is None:
+        print(
+            f"     Rows of {len(groups)} field groups don't align. "
+            f"Fetching the fields at once"
+        )
+        return fetch_recover(instruments, fields, ledger=ledger, **kwargs)
+    err = {}
+    for dta_err in results:
+        for entry in dta_err[1] or []:
+            err.setdefault(_entry_key(entry), entry)
+    if ledger is not None:
+        records.replay(ledger, fields)
+    return dta, list(err.values()) or None
+
+
+def _entry_key(entry):
+    return entry.get("instrument"), entry.get("code"), entry.get("message")
+
+
+class _GroupRecords:
+    """ Collects the failures of the field groups, as an erl.ErrorLedger. """
+
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def record(self, entry, fields, kind, attempts=0):
+        with self._lock:
+            key = _entry_key(entry)
+            if key in self.records:
+                attempts = max(attempts, self.records[key][2])
+            self.records[key] = (entry, kind, attempts)
+
+    def replay(self, ledger, fields):
+        """ Enter the ledger and record each failure once, for all fields. """
+        for entry, kind, attempts in self.records.values():
+            ledger.record(entry, fields, kind, attempts)
+
+
+def iter_requests(requests, max_workers=MAX_WORKERS, api=None, **kwargs):
+    """
+    Enter a sequence of requests and get the responses as they are retrieved.
+
+    At most max_workers requests are in flight at once. The responses are
+    yielded in the order of the requests.
+
+    Arguments:
+
+    requests: An iterable of (tag, instruments, fields) tuples. The tag is
+    anything identifying the request, e.g. its line range or date window.
+    A generator is consumed lazily.
+
+    max_workers: Number of requests in flight at once.
+
+    api: The module exposing get_data. Default is eikon.
+
+    Return: A generator of (tag, dta, err) tuples.
+
+    Notes:
+    **kwargs is for fetch_partitioned, fetch_recover, fetch_bisect,
+    fetch_batch and get_data, e.g. field_groups, ledger and quarantine.
+    The instruments in the quarantine are not requested again.
+    """
+    api = load_api(api)
+    quarantine = kwargs.get("quarantine")
+    skip = quarantine.instruments() if quarantine is not None else set()
+    if skip:
+        print(f" + Skipping {len(skip)} quarantined instruments")
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = collections.deque()
+        for tag, instruments, fields in requests:
+            if skip and not isinstance(instruments, str):
+                instruments = [ins for ins in instruments if ins not in skip]
+            future = pool.submit(
+                fetch_partitioned, instruments, fields, api=api, **kwargs
+            )
+            pending.append((tag, future))
+            # Keep the pool fed, but don't queue all requests at once
+            if len(pending) >= 2 * max_workers:
+                tag, future = pending.popleft()
+                yield (tag, *future.result())
+        while pending:
+            tag, future = pending.popleft()
+            yield (tag, *future.result())
+
+
+def iter_batches(
+    instruments,
+    fields,
+    size=SIZE,
+    max_workers=MAX_WORKERS,
+    api=None,
+    label="",
+    ranges=None,
+    **kwargs,
+):
+    """
+    Enter instruments and fields and get the batches as they are retrieved.
+
+    At most max_workers requests are in flight at once. The batches are
+    yielded in the order of the instrument list, so the output is the same
+    as for a serial loop.
+
+    Arguments:
+
+    instruments: The list of instruments, e.g. QuoteIDs.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    size: Number of instruments per batch, a bsz.AdaptiveBatchSize or a
+    bsz.RowBudget.
+
+    max_workers: Number of batches in flight at once.
+
+    api: The module exposing get_data. Default is eikon.
+
+    label: Text added to the progress print, e.g. the year.
+
+    ranges: The (start, end) line ranges to retrieve. Default is the whole
+    list.
+
+    Return: A generator of (line_start, line_end, dta, err) tuples.
+
+    Notes:
+    **kwargs is for fetch_partitioned, fetch_recover, fetch_bisect,
+    fetch_batch and get_data, e.g. field_groups, ledger and quarantine.
+    """
+    if isinstance(size, bsz.AdaptiveBatchSize):
+        kwargs["sizer"] = size
+    requests = (
+        ((line_start, line_end), instruments[line_start:line_end], fields)
+        for line_start, line_end in split_batches(instruments, size, ranges)
+    )
+    for (line_start, line_end), dta, err in iter_requests(
+        requests, max_workers=max_workers, api=api, **kwargs
+    ):
+        print(f" + Lines: {str(line_start)}/{str(line_end)} {label}")
+        if isinstance(size, bsz.RowBudget):
+            size.record(dta)  # Rows per instrument, for the next run
+        yield line_start, line_end, dta, err
+    if isinstance(size, bsz.RowBudget):
+        size.save()
+
+
+def drop_empty_rows(dta, how="all"):
+    """
+    Enter a retrieved dataframe and get it without empty and duplicate rows.
+
+    Arguments:
+
+    dta: The dataframe as returned by get_data. The first column is the
+    instrument.
+
+    how: "all" drops rows where all data columns are NaN, "any" drops rows
+    where any data column is NaN.
+
+    Return: The cleaned dataframe.
+    """
+    if dta is None:
+        return pd.DataFrame()
+    if not dta.empty:
+        # Drop empty rows
+        my_header = list(dta.columns.values)
+        dta = dta.dropna(how=how, subset=my_header[1:])
+        # Remove any duplicates
+        dta = dta.drop_duplicates()
+    return dta
+
+
+def iter_parsed(items, parse, workers=PARSE_WORKERS, queue_size=QUEUE_SIZE):
+    """
+    Enter retrieved items and a function and get the items parsed.
+
+    This is the parse stage of the pipeline: the items are parsed by a
+    pool of workers while the next items are retrieved, and yielded in the
+    order given.
+
+    Arguments:
+
+    items: An iterable of items, e.g. the (line_start, line_end, dta, err)
+    tuples of iter_batches or the (tag, dta, err) tuples of iter_requests.
+
+    parse: Function applied to each item, returning the parsed item.
+
+    workers: Number of items parsed at once.
+
+    queue_size: Number of items parsed, or being parsed, ahead of the one
+    yielded. The retrieval waits when they are all taken.
+    """
+    with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(parse, item))
+            if len(pending) >= queue_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class OrderedWriter:
+    """
+    Single writer thread fed by a bounded queue.
+
+    This is the write stage of the pipeline: the items are written one at
+    a time, in the order they are put, while the next items are retrieved
+    and parsed.
+
+    Arguments:
+
+    write: Function called with each item, e.g. the write of a
+    snk.BatchSink.
+
+    queue_size: Number of items waiting to be written. put() waits when
+    the queue is full.
+
+    Notes:
+    An error of write is raised by the next put(), or by close().
+    """
+
+    def __init__(self, write, queue_size=QUEUE_SIZE):
+        self.write = write
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if self._error is None:
+                try:
+                    self.write(item)
+                except Exception as own_err:
+                    self._error = own_err  # The rest of the queue is drained
+
+    def _raise(self):
+        if self._error is not None:
+            raise self._error
+
+    def put(self, item):
+        """ Enter an item and queue it for writing. """
+        self._raise()
+        self._queue.put(item)
+
+    def close(self):
+        """ Wait until all items are written. """
+        self._queue.put(_DONE)
+        self._thread.join()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_DONE = object()  # Marks the end of the queue of an OrderedWriter
+
+
+def get_data_batched(
+    instruments,
+    fields,
+    size=SIZE,
+    max_workers=MAX_WORKERS,
+    api=None,
+    clean=drop_empty_rows,
+    label="",
+    manifest=None,
+    unit=None,
+    sink=None,
+    parse_workers=PARSE_WORKERS,
+    queue_size=QUEUE_SIZE,
+    **kwargs,
+):
+    """
+    Enter instruments and fields and get all batches as one dataframe.
+
+    Arguments:
+
+    instruments: The list of instruments, e.g. QuoteIDs.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    size: Number of instruments per batch, a bsz.AdaptiveBatchSize or a
+    bsz.RowBudget.
+
+    max_workers: Number of batches in flight at once.
+
+    api: The module exposing get_data. Default is eikon.
+
+    clean: Function applied to each batch before it is kept. Use None to
+    keep the batches as retrieved.
+
+    label: Text added to the progress print, e.g. the year.
+
+    manifest: A ckp.Manifest. If given, each completed batch is saved and
+    recorded, and the batches completed by an earlier run are read from
+    disk instead of being retrieved again.
+
+    unit: The unit of the manifest, see ckp.make_unit.
+
+    sink: A snk.BatchSink. If given, each batch is written to it in the
+    order of the instrument list instead of being kept in memory.
+
+    parse_workers: Number of batches cleaned at once.
+
+    queue_size: Number of batches waiting between two stages.
+
+    Return: A Pandas dataframe with the data of all batches, or a raw
+    output dictionary if raw_output is True. The number of rows written
+    if sink is given.
+
+    Notes:
+    **kwargs is for fetch_batch and get_data.
+    The batches run through a pipeline: they are retrieved by max_workers
+    fetchers, cleaned by parse_workers workers and written, or kept, by
+    one writer, in the order of the instrument list. The stages are
+    connected by bounded queues, so a slow stage holds back the others
+    instead of filling the memory.
+    """
+    batches = []
+    done = []
+    ranges = None
+    if manifest is not None:
+        done = manifest.done_ranges(unit)
+        ranges = manifest.pending_ranges(unit, len(instruments))
+        if done:
+            print(f"     Resuming: {len(done)} batches already done {label}")
+
+    def keep(dta):
+        if sink is not None:
+            sink.write(dta)
+        else:
+            batches.append(dta)
+
+    def keep_done(line_end):
+        # Keep the batches of an earlier run that come before line_end
+        while done and done[0][0] < line_end:
+            line_start, done_end = done.pop(0)
+            keep(manifest.read_batch(unit, line_start, done_end))
+
+    def parse(item):
+        line_start, line_end, dta, err = item
+        if clean is not None:
+            dta = clean(dta)
+        return line_start, line_end, dta
+
+    def write(item):
+        line_start, line_end, dta = item
+        if manifest is not None:
+            manifest.save_batch(unit, line_start, line_end, dta)
+        keep_done(line_start)
+        keep(dta)
+
+    with OrderedWriter(write, queue_size) as writer:
+        for item in iter_parsed(
+            iter_batches(
+                instruments,
+                fields,
+                size=size,
+                max_workers=max_workers,
+                api=api,
+                label=label,
+                ranges=ranges,
+                **kwargs,
+            ),
+            parse,
+            workers=parse_workers,
+            queue_size=queue_size,
+        ):
+            writer.put(item)
+    keep_done(len(instruments))
+    if sink is not None:
+        return sink.rows
+    return combine_batches(batches)
@@ -0,0 +1,245 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with the retry policy for the Eikon API.
+
+Exceptions are classified as transient (e.g. timeout or 429), permanent
+(e.g. a bad field name or an invalid instrument) or as the Eikon proxy
+being down. Permanent errors are not retried. Transient errors back off
+exponentially with jitter. When the proxy is down a circuit breaker
+pauses all workers of the process, instead of each batch retrying on its
+own.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import json as js
+import random
+import threading
+import time  # For sleep functionality
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+PROXY_DOWN = "proxy down"
+
+BACKOFF_BASE = 2  # Seconds to sleep after the first failed attempt
+BACKOFF_CAP = 300  # Longest sleep after a failed attempt
+BREAKER_THRESHOLD = 3  # Proxy failures in a row before the breaker opens
+BREAKER_COOLDOWN = 60  # Seconds the breaker stays open
+
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+PERMANENT_CODES = {400, 401, 403, 404}
+PROXY_DOWN_TEXT = [
+    "proxy not running",
+    "proxy not installed",
+    "cannot be reached",
+    "connection refused",
+    "failed to establish a new connection",
+]
+TRANSIENT_TEXT = ["timeout", "timed out", "too many requests", "backend error"]
+TRANSIENT_ENTRY_CODES = {408, 429, 500, 502, 503, 504, 2504}  # 2504: Backend error
+INSTRUMENT_CODES = {412}  # The error is caused by an instrument of the request
+INSTRUMENT_TEXT = ["unable to resolve", "invalid instrument", "invalid identifier"]
+PERMANENT_TEXT = INSTRUMENT_TEXT + [
+    "invalid field",
+    "unknown field",
+    "is not a valid",
+    "app key",
+]
+
+
+def classify(err):
+    """
+    Enter an exception raised by an Eikon call and get its kind.
+
+    Arguments:
+
+    err: The exception, e.g. an eikon.EikonError or a requests/httpx error.
+
+    Return: TRANSIENT, PERMANENT or PROXY_DOWN.
+
+    Notes:
+    The classification uses the error code, the class name and the message,
+    so neither eikon nor requests must be imported. Unknown errors are
+    treated as transient, as before.
+    """
+    text = str(err).lower()
+    name = type(err).__name__
+    if any(txt in text for txt in PROXY_DOWN_TEXT) or name in [
+        "ConnectionError",
+        "ConnectionRefusedError",
+        "ConnectError",
+    ]:
+        return PROXY_DOWN
+    code = getattr(err, "code", None)
+    if code in TRANSIENT_CODES:
+        return TRANSIENT
+    if code in PERMANENT_CODES:
+        return PERMANENT
+    if any(txt in text for txt in TRANSIENT_TEXT) or "Timeout" in name:
+        return TRANSIENT
+    if any(txt in text for txt in PERMANENT_TEXT):
+        return PERMANENT
+    if isinstance(err, js.JSONDecodeError):
+        return TRANSIENT  # A truncated or garbled payload
+    if isinstance(err, (TypeError, ValueError)):
+        return PERMANENT  # The request itself is malformed
+    return TRANSIENT
+
+
+def is_instrument_error(err):
+    """
+    Enter an exception raised by an Eikon call and get whether it is caused
+    by an instrument of the request, e.g. one that can't be resolved.
+
+    Notes:
+    Other permanent errors, e.g. a bad field name, a bad parameter or a bad
+    app key, fail for every instrument alike.
+    """
+    if getattr(err, "code", None) in INSTRUMENT_CODES:
+        return True
+    text = str(err).lower()
+    return any(txt in text for txt in INSTRUMENT_TEXT)
+
+
+class EntryError(Exception):
+    """ An instrument-level error from the error list returned by get_data. """
+
+    def __init__(self, entry):
+        super().__init__(entry.get("message", ""))
+        self.code = entry.get("code")
+
+
+def classify_entry(entry):
+    """
+    Enter an entry of the error list returned by get_data and get its kind.
+
+    Arguments:
+
+    entry: A dictionary with code, message, row and col, e.g.
+    {"code": 412, "message": "Unable to resolve all requested identifiers."}.
+
+    Return: TRANSIENT or PERMANENT.
+
+    Notes:
+    Unlike classify, an unknown entry is permanent, since most entries are
+    answers about the instrument, e.g. code 416, Unable to collect data for
+    the field. Only the codes in TRANSIENT_ENTRY_CODES, or a message of
+    TRANSIENT_TEXT, are transient.
+    """
+    err = EntryError(entry)
+    if err.code in TRANSIENT_ENTRY_CODES:
+        return TRANSIENT
+    text = str(err).lower()
+    if any(txt in text for txt in TRANSIENT_TEXT):
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_seconds(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    Enter the attempt number and get the seconds to sleep before the next.
+
+    Arguments:
+
+    attempt: The number of the failed attempt, starting at 0.
+
+    base: Seconds to sleep after the first failed attempt.
+
+    cap: Longest sleep.
+
+    Return: A random number of seconds between base and
+    min(cap, base * 2 ** attempt), i.e. exponential backoff with jitter.
+    """
+    ceiling = min(cap, base * 2 ** attempt)
+    return random.uniform(min(base, ceiling), ceiling)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by all workers of a process.
+
+    After threshold proxy failures in a row the breaker opens, and wait()
+    blocks every worker until cooldown seconds have passed. A success
+    resets the count.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """ Block while the breaker is open. Return the seconds waited. """
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self.open_until - time.monotonic()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def record_success(self):
+        """ Reset the count of proxy failures in a row. """
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        """ Count a proxy failure, and open the breaker at the threshold. """
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.open_until <= time.monotonic():
+                    print(
+                        f"Eikon proxy is down: pausing all requests for {self.cooldown} seconds."
+                    )
+                self.open_until = time.monotonic() + self.cooldown
+
+
+_breaker = None
+
+
+def get_breaker():
+    """ Get the circuit breaker shared by all Eikon calls of this process. """
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker()
+    return _breaker
+
+
+def handle_failure(
+    err, attempt, breaker=None, base=BACKOFF_BASE, cap=BACKOFF_CAP
+):
+    """
+    Enter a failed attempt's exception and sleep before the next attempt.
+
+    Arguments:
+
+    err: The exception raised by the Eikon call.
+
+    attempt: The number of the failed attempt, starting at 0.
+
+    breaker: A CircuitBreaker. Default is the shared breaker.
+
+    base, cap: See backoff_seconds.
+
+    Return: The kind of the error, TRANSIENT or PROXY_DOWN.
+
+    Notes:
+    Re-raises err at once if it is permanent, since retrying won't help.
+    """
+    kind = classify(err)
+    if kind == PERMANENT:
+        raise err
+    if breaker is None:
+        breaker = get_breaker()
+    if kind == PROXY_DOWN:
+        breaker.record_failure()
+    time.sleep(backoff_seconds(attempt, base, cap))
+    breaker.wait()
+    return kind
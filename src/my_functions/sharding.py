@@ -0,0 +1,366 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with a sharded runner of the retrieval engine.
+
+The engine keeps several batches in flight, but all in one process with
+one Eikon session, so a large universe is still limited by the parsing
+speed of that process. The runner splits the instrument list into shards,
+retrieves each shard in a process of its own, with its own session and
+app key, and appends the shard files to the out-file in the order of the
+instrument list when all shards are done. The processes record their
+batches in a shared progress ledger, and share the rate limiter state
+file, so together they keep within the quota of the licence. With a
+checkpoint manifest, each completed shard is recorded, and a restarted run
+only retrieves the shards not completed.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import concurrent.futures as cf
+import importlib
+import json as js
+import os
+import pathlib as pl
+import shutil
+import time  # For sleep functionality
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.my_functions import batch_sink as snk
+from src.my_functions import error_ledger as erl
+from src.my_functions import rate_limit as rl
+from src.my_functions import retrieval as rtv
+
+SHARDS = 4  # Default number of processes
+PROGRESS_EVERY = 30  # Seconds between progress reports
+
+
+class ProgressLedger:
+    """
+    Append-only JSONL file of the batches completed by the shards.
+
+    Arguments:
+
+    file: The ledger file, e.g. the output file with suffix
+    .progress.jsonl.
+
+    Notes:
+    The file is shared by the processes of a run and guarded by a
+    rl.FileLock. Each line holds the time, the shard, the line range of the
+    batch in the shard and the number of rows written, or that the shard
+    is done.
+    """
+
+    def __init__(self, file):
+        self.file = pl.Path(file)
+        self.lock = rl.FileLock(self.file.with_name(f"{self.file.name}.lock"))
+
+    @classmethod
+    def for_output(cls, out_file):
+        """ Enter an output file and get the ledger next to it. """
+        out_file = pl.Path(out_file)
+        return cls(out_file.with_name(f"{out_file.stem}.progress.jsonl"))
+
+    def record(self, shard, line_start=None, line_end=None, rows=0, done=False):
+        """ Enter a completed batch, or a completed shard, and append it. """
+        rec = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "shard": shard,
+            "line_start": line_start,
+            "line_end": line_end,
+            "rows": rows,
+            "done": done,
+        }
+        with self.lock:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file, mode="a", encoding="utf-8") as fl:
+                fl.write(js.dumps(rec) + "\n")
+
+    def read(self):
+        """ Get the ledger as a dataframe, one row per record. """
+        if not self.file.exists():
+            return pd.DataFrame()
+        with open(self.file, mode="r", encoding="utf-8") as fl:
+            recs = []
+            for line in fl:
+                try:
+                    recs.append(js.loads(line))
+                except ValueError:
+                    continue  # A line cut short by a crash
+        return pd.DataFrame(recs)
+
+    def summary(self):
+        """
+        Get the progress per shard.
+
+        Return: A dataframe indexed by shard with the number of lines and
+        rows done, and whether the shard is done.
+        """
+        dta = self.read()
+        if dta.empty:
+            return pd.DataFrame(columns=["lines", "rows", "done"])
+        batches = dta[~dta["done"]]
+        lines = (batches["line_end"] - batches["line_start"]).groupby(
+            batches["shard"]
+        ).sum()
+        return pd.DataFrame(
+            {
+                "lines": lines,
+                "rows": batches.groupby("shard")["rows"].sum(),
+                "done": dta.groupby("shard")["done"].any(),
+            }
+        ).fillna(0).astype({"lines": int, "rows": int})
+
+
+def split_shards(instruments, n_shards=SHARDS):
+    """
+    Enter a list of instruments and get it split into shards.
+
+    Return: A list of at most n_shards lists of instruments in a row, of
+    about the same length, so the shards in order are the list in order.
+    """
+    n_shards = max(1, min(n_shards, len(instruments)))
+    size = -(-len(instruments) // n_shards)
+    return [
+        instruments[line_start:line_start + size]
+        for line_start in range(0, len(instruments), size)
+    ]
+
+
+def shard_file(out_file, shard):
+    """ Enter an output file and a shard and get the file of the shard. """
+    out_file = pl.Path(out_file)
+    return out_file.with_name(f"{out_file.stem}.shard{shard}{out_file.suffix}")
+
+
+def run_shard(
+    shard,
+    instruments,
+    fields,
+    out_file,
+    app_key=None,
+    api="eikon",
+    quarantine=None,
+    id_name="Instrument",
+    clean=rtv.drop_empty_rows,
+    limiter_dir=rl.STATE_DIR,
+    **kwargs,
+):
+    """
+    Enter a shard and get it retrieved to its shard file.
+
+    It runs in a process of the pool, so the arguments are picklable: the
+    api is the name of the module, and the quarantine is its file.
+
+    Arguments:
+
+    shard: The number of the shard.
+
+    instruments: The instruments of the shard.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    out_file: The out-file of the run. The shard is written next to it.
+
+    app_key: The app key of the session of the process. None to keep the
+    app key set at import.
+
+    api: The name of the module exposing get_data, e.g. eikon.
+
+    quarantine: The quarantine file, see rtv.Quarantine. None for none.
+
+    id_name: Header of the instrument column of the quarantine file.
+
+    clean: Function applied to each batch before it is written.
+
+    limiter_dir: The state directory of the rate limiter, shared by the
+    processes.
+
+    Return: The tuple (shard, rows written).
+
+    Notes:
+    **kwargs is for rtv.iter_batches, e.g. size, max_workers and
+    field_name.
+    """
+    api = importlib.import_module(api)
+    if app_key is not None:
+        api.set_app_key(app_key)
+    file = shard_file(out_file, shard)
+    if file.exists():
+        os.remove(file)  # Left by an aborted run
+    progress = ProgressLedger.for_output(out_file)
+    if quarantine is not None:
+        quarantine = rtv.Quarantine(quarantine, id_name=id_name)
+    with snk.BatchSink(file) as sink:
+        for line_start, line_end, dta, err in rtv.iter_batches(
+            instruments,
+            fields,
+            api=api,
+            quarantine=quarantine,
+            ledger=erl.ErrorLedger.for_output(file),
+            limiter=rl.TokenBucket(state_dir=limiter_dir),
+            **kwargs,
+        ):
+            if clean is not None:
+                dta = clean(dta)
+            rows = sink.write(dta)
+            progress.record(shard, line_start, line_end, rows)
+    progress.record(shard, rows=sink.rows, done=True)
+    return shard, sink.rows
+
+
+def merge_shards(out_file, shards):
+    """
+    Enter an output file and the shards and append the shard files to it.
+
+    Arguments:
+
+    out_file: The out-file. A csv-file is appended to, as by a
+    snk.BatchSink. A Parquet file can't be appended to, so it is written
+    anew to a part file, with the rows it holds and then the shards, which
+    then replaces it.
+
+    shards: The numbers of the shards, in the order of the instrument list.
+
+    Notes:
+    The error ledgers of the shards are appended to the ledger of the
+    out-file. The shard files are removed.
+    """
+    out_file = pl.Path(out_file)
+    files = [shard_file(out_file, shard) for shard in shards]
+    files = [file for file in files if file.exists()]
+    if out_file.suffix == ".parquet":
+        if files:
+            part_file = out_file.with_name(f"{out_file.name}.part")
+            writer = None
+            for file in ([out_file] if out_file.exists() else []) + files:
+                for batch in pq.ParquetFile(file).iter_batches():
+                    table = pa.Table.from_batches([batch])
+                    if writer is None:
+                        writer = pq.ParquetWriter(part_file, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+            if writer is not None:
+                writer.close()
+                os.replace(part_file, out_file)
+    else:
+        with open(out_file, mode="ab") as dst:
+            for file in files:
+                with open(file, mode="rb") as src:
+                    shutil.copyfileobj(src, dst)
+    ledger = erl.ErrorLedger.for_output(out_file).file
+    for shard in shards:
+        shard_ledger = erl.ErrorLedger.for_output(shard_file(out_file, shard)).file
+        if shard_ledger.exists():
+            with open(shard_ledger, mode="rb") as src:
+                with open(ledger, mode="ab") as dst:
+                    shutil.copyfileobj(src, dst)
+            os.remove(shard_ledger)
+    for file in files:
+        os.remove(file)
+
+
+def run_sharded(
+    instruments,
+    fields,
+    out_file,
+    n_shards=SHARDS,
+    app_keys=None,
+    initializer=None,
+    initargs=(),
+    manifest=None,
+    unit=None,
+    **kwargs,
+):
+    """
+    Enter instruments and fields and get them retrieved by a process pool.
+
+    Arguments:
+
+    instruments: The list of instruments, e.g. QuoteIDs.
+
+    fields: The list of fields, e.g. ek.TR_Field objects.
+
+    out_file: The out-file, a tab-separated csv-file or a Parquet file.
+
+    n_shards: Number of shards, each retrieved by a process of its own.
+
+    app_keys: A list of app keys. Shard i gets app key i, modulo the
+    length of the list. None to keep the app key set at import.
+
+    initializer, initargs: Run in each process before its shard, e.g. to
+    configure fake_eikon.
+
+    manifest: A ckp.Manifest recording the completed shards, e.g. of the
+    out-file. None to retrieve all shards.
+
+    unit: The unit of the instruments and fields, see ckp.make_unit. Each
+    shard is recorded as the unit with its shard number.
+
+    Return: The number of rows written by this run.
+
+    Notes:
+    **kwargs is for run_shard and rtv.iter_batches, e.g. api, quarantine,
+    cache, size, max_workers and field_name. The progress of the shards is
+    printed every PROGRESS_EVERY seconds from the progress ledger.
+    The shard file of a completed shard is kept until all shards are done,
+    so a restarted run with the same manifest, unit and n_shards only
+    retrieves the other shards. The shards hold different instruments, so
+    they have no rows in common.
+    """
+    shards = split_shards(list(instruments), n_shards)
+    progress = ProgressLedger.for_output(out_file)
+    if progress.file.exists():
+        os.remove(progress.file)  # The ledger of an earlier run
+
+    def shard_unit(shard):
+        return dict(unit or {}, shard=shard, n_shards=len(shards))
+
+    todo = [
+        shard
+        for shard in range(len(shards))
+        if manifest is None
+        or not manifest.is_complete(shard_unit(shard))
+        or not shard_file(out_file, shard).exists()
+    ]
+    print(
+        f" + {len(instruments)} instruments in {len(shards)} shards, "
+        f"{len(shards) - len(todo)} already done"
+    )
+    rows = 0
+    if todo:
+        with cf.ProcessPoolExecutor(
+            max_workers=len(todo), initializer=initializer, initargs=initargs
+        ) as pool:
+            futures = {
+                pool.submit(
+                    run_shard,
+                    shard,
+                    shards[shard],
+                    fields,
+                    out_file,
+                    app_key=app_keys[shard % len(app_keys)] if app_keys else None,
+                    **kwargs,
+                ): shard
+                for shard in todo
+            }
+            started = time.monotonic()
+            pending = set(futures)
+            while pending:
+                done, pending = cf.wait(pending, timeout=PROGRESS_EVERY)
+                for future in done:
+                    rows += future.result()[1]
+                    if manifest is not None:
+                        manifest.mark_complete(shard_unit(futures[future]))
+                summary = progress.summary()
+                print(
+                    f" + Shards done: {int(summary['done'].sum())}/{len(todo)}, "
+                    f"lines: {int(summary['lines'].sum())}/{len(instruments)}, "
+                    f"after {time.monotonic() - started:.0f} s"
+                )
+    merge_shards(out_file, range(len(shards)))
+    return rows
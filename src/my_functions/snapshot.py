@@ -0,0 +1,152 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with dated snapshots of screened universes.
+
+get_data_screener.py used to overwrite its csv-files on each run, so a
+downstream job such as swe_organizationid.py had to process the whole
+universe again. Each run is instead kept as a Parquet snapshot named by
+its date, e.g. organizationid_swe_2026-10-16.parquet, and compared with
+the latest earlier snapshot. The delta, the ids added and removed since
+then, is saved next to it as a tab-separated csv-file.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import datetime as dt
+import pathlib as pl
+import re
+
+import pandas as pd
+
+
+def snapshot_file(directory, name, date):
+    """ Enter a directory, a name and a date and get the snapshot file. """
+    return pl.Path(directory).joinpath(f"{name}_{date}.parquet")
+
+
+def list_snapshots(directory, name):
+    """
+    Enter a directory and a name and get the snapshots saved.
+
+    Return: A list of (date, file) tuples, sorted by date, with the dates
+    as strings, e.g. "2026-10-16".
+    """
+    pattern = re.compile(rf"^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})\.parquet$")
+    directory = pl.Path(directory)
+    if not directory.exists():
+        return []
+    found = []
+    for file in directory.iterdir():
+        match = pattern.match(file.name)
+        if match:
+            found.append((match.group(1), file))
+    return sorted(found)
+
+
+def previous_snapshot(directory, name, date):
+    """
+    Enter a directory, a name and a date and get the latest earlier snapshot.
+
+    Return: The file of the latest snapshot before the date, or None.
+
+    Notes:
+    A snapshot of the same date is not earlier, so a run repeated the same
+    day is compared with the same snapshot as the first run of the day.
+    """
+    earlier = [file for dte, file in list_snapshots(directory, name) if dte < date]
+    return earlier[-1] if earlier else None
+
+
+def save_snapshot(dta, directory, name, date=None):
+    """
+    Enter a dataframe and get it saved as the snapshot of the date.
+
+    Arguments:
+
+    dta: The screened universe, e.g. a dataframe with OrganizationID.
+
+    directory: Where the snapshots are kept.
+
+    name: The name of the universe, e.g. organizationid_swe.
+
+    date: The date of the snapshot, e.g. "2026-10-16". Default is today.
+
+    Return: The snapshot file. A snapshot of the same date is replaced.
+
+    Notes:
+    All columns are saved as strings, the same as own.read_csv_file reads
+    the csv-files.
+    """
+    if date is None:
+        date = dt.date.today().isoformat()
+    file = snapshot_file(directory, name, date)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    dta.astype("string").to_parquet(file, index=False)
+    return file
+
+
+def diff_snapshots(old, new, key):
+    """
+    Enter two snapshots and get the ids added and removed between them.
+
+    Arguments:
+
+    old: The earlier snapshot, as a dataframe or a file. None if there is
+    no earlier snapshot, and all ids are added.
+
+    new: The later snapshot, as a dataframe or a file.
+
+    key: The id column, e.g. OrganizationID.
+
+    Return: A dataframe with the columns key and Change, either "added" or
+    "removed", sorted by Change and key.
+    """
+
+    def ids(snapshot):
+        if snapshot is None:
+            return set()
+        if not isinstance(snapshot, pd.DataFrame):
+            snapshot = pd.read_parquet(snapshot, columns=[key])
+        return set(snapshot[key].dropna().astype(str))
+
+    old_ids = ids(old)
+    new_ids = ids(new)
+    return pd.DataFrame(
+        [(i, "added") for i in sorted(new_ids - old_ids)]
+        + [(i, "removed") for i in sorted(old_ids - new_ids)],
+        columns=[key, "Change"],
+    )
+
+
+def save_delta(delta, directory, name, date):
+    """
+    Enter the delta of a snapshot and get it saved next to the snapshot.
+
+    Return: The delta file, e.g. organizationid_swe_2026-10-16_delta.csv, a
+    tab-separated csv-file with a header.
+    """
+    file = pl.Path(directory).joinpath(f"{name}_{date}_delta.csv")
+    file.parent.mkdir(parents=True, exist_ok=True)
+    delta.to_csv(file, sep="\t", encoding="utf-8", index=False, header=True)
+    return file
+
+
+def read_delta(file, change=None):
+    """
+    Enter a delta file and get its ids.
+
+    Arguments:
+
+    file: The delta file of save_delta.
+
+    change: "added" or "removed" to get only those ids. None for all.
+
+    Return: A dataframe with the id column and Change.
+    """
+    delta = pd.read_csv(file, sep="\t", dtype=str)
+    if change is not None:
+        delta = delta[delta["Change"] == change]
+    return delta
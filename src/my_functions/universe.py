@@ -0,0 +1,233 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with the date-aware pruning of the instrument universe.
+
+The yearly scripts used to request every instrument for every year, even
+though the lifetime of each instrument is known, e.g. FirstTradeDate and
+RetireDate per QuoteID in refinitiv_relations.csv, or firstdt and lastdt
+per OrganizationID in refinitiv_fundamentals_date_range.csv. The functions
+below drop the instruments whose lifetime doesn't overlap the period of a
+request, before the batches are built, and group instruments with similar
+date windows so that they can share one request. When only the first and
+last date of an instrument is wanted, boundary_windows narrows its window
+to the periods around the first and last date found at a coarse frequency.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import os
+
+import pandas as pd
+
+# Eikon frequencies (Frq) as pandas periods
+PERIODS = {
+    "W": "W-FRI",
+    "M": "M",
+    "CQ": "Q",
+    "FQ": "Q",
+    "CY": "Y",
+    "FY": "Y",
+}
+
+
+def read_lifetimes(file, id_name, first="FirstTradeDate", last="RetireDate"):
+    """
+    Enter a file with the first and last dates per instrument and get them.
+
+    Arguments:
+
+    file: A tab-separated csv-file, e.g. refinitiv_relations.csv.
+
+    id_name: The instrument column, e.g. QuoteID or OrganizationID.
+
+    first, last: The columns with the first and last date, e.g. firstdt and
+    lastdt.
+
+    Return: A dataframe indexed by id_name with the columns first and last
+    as dates, or None if the file doesn't exist.
+
+    Notes:
+    An instrument listed more than once gets its earliest first date and
+    its latest last date. A missing last date means it is still alive, and
+    is kept as NaT.
+    """
+    if not os.path.exists(file):
+        print(f"No lifetimes in {file}: the universe is not pruned.")
+        return None
+    dta = pd.read_csv(
+        file, sep="\t", dtype=str, usecols=[id_name, first, last], low_memory=False
+    )
+    dta = dta.dropna(subset=[id_name])
+    dta[first] = pd.to_datetime(dta[first], errors="coerce")
+    dta[last] = pd.to_datetime(dta[last], errors="coerce")
+    alive = dta[last].isna().groupby(dta[id_name]).any()
+    lifetimes = dta.groupby(id_name).agg({first: "min", last: "max"})
+    lifetimes.loc[alive[alive].index, last] = pd.NaT
+    lifetimes.columns = ["first", "last"]
+    return lifetimes
+
+
+def prune(instruments, lifetimes, start, end, margin_days=0):
+    """
+    Enter instruments and a period and get the instruments alive in it.
+
+    Arguments:
+
+    instruments: The list of instruments.
+
+    lifetimes: The lifetimes from read_lifetimes, or None to keep all.
+
+    start, end: The first and last date of the period, e.g. "2020-01-01"
+    and "2021-12-31".
+
+    margin_days: Days added to both ends of the period, to allow for e.g.
+    fiscal years not ending in December.
+
+    Return: The instruments whose lifetime overlaps the period, in the
+    order of the list. A missing date counts as open-ended, so instruments
+    without known dates are kept.
+    """
+    if lifetimes is None:
+        return list(instruments)
+    margin = pd.Timedelta(days=margin_days)
+    start = pd.Timestamp(start) - margin
+    end = pd.Timestamp(end) + margin
+    known = lifetimes.reindex(pd.Index(instruments, dtype=object))
+    keep = (known["first"].isna() | (known["first"] <= end)) & (
+        known["last"].isna() | (known["last"] >= start)
+    )
+    kept = [instrument for instrument, flag in zip(instruments, keep) if flag]
+    if len(kept) < len(instruments):
+        print(
+            f"     Pruned {len(instruments) - len(kept)} of {len(instruments)} "
+            f"instruments not alive {start.date()} -- {end.date()}."
+        )
+    return kept
+
+
+def group_windows(windows, id_name, freq="M", start="SDate", end="EDate"):
+    """
+    Enter the date window per instrument and get them grouped by window.
+
+    Arguments:
+
+    windows: A dataframe with one row per instrument and its first and
+    last date.
+
+    id_name: The instrument column, e.g. QuoteID.
+
+    freq: The windows are widened to whole periods of this frequency, e.g.
+    "M" for months, so that similar windows share a group. None to only
+    group identical windows.
+
+    start, end: The columns with the first and last date of the window.
+
+    Return: A list of (sdate, edate, instruments) tuples, sorted by window,
+    with the dates as strings, e.g. "2020-01-01". The window of a group
+    covers the windows of all its instruments.
+
+    Notes:
+    An instrument may have more than one window, e.g. from
+    boundary_windows. It is listed once per group.
+    """
+    dta = windows[[id_name, start, end]].copy()
+    dta[start] = pd.to_datetime(dta[start])
+    dta[end] = pd.to_datetime(dta[end])
+    if freq is None:
+        dta["group_start"] = dta[start]
+        dta["group_end"] = dta[end]
+    else:
+        dta["group_start"] = dta[start].dt.to_period(freq).dt.start_time
+        dta["group_end"] = dta[end].dt.to_period(freq).dt.end_time.dt.normalize()
+    groups = []
+    for (group_start, group_end), grp in dta.groupby(
+        ["group_start", "group_end"], sort=True
+    ):
+        groups.append(
+            (
+                group_start.strftime("%Y-%m-%d"),
+                group_end.strftime("%Y-%m-%d"),
+                grp[id_name].drop_duplicates().tolist(),
+            )
+        )
+    return groups
+
+
+def boundary_windows(
+    windows,
+    found,
+    bounds,
+    id_name,
+    frq,
+    lead=0,
+    lag=1,
+    start="SDate",
+    end="EDate",
+    date="date",
+):
+    """
+    Enter the windows probed at a frequency and get the boundary windows.
+
+    Arguments:
+
+    windows: A dataframe with the windows probed, one or more rows per
+    instrument, with id_name, start and end.
+
+    found: A dataframe with id_name and date, the dates with data found by
+    the probe.
+
+    bounds: A dataframe indexed by id_name with start and end, the window
+    of each instrument. Dates outside it are ignored.
+
+    id_name: The instrument column, e.g. QuoteID.
+
+    frq: The Eikon frequency probed, e.g. "M" or "CY", see PERIODS.
+
+    lead: Number of periods before the first date found that may hold an
+    earlier date at a finer frequency.
+
+    lag: Number of periods after the last date found that may hold a later
+    date, 1 since the data of the period after the last date found is
+    missing.
+
+    Return: A dataframe with id_name, start and end, as strings, holding the
+    window around the first and the last date found, or one window if they
+    overlap. An instrument with no date found keeps its windows, so it is
+    probed again at the finer frequency.
+
+    Notes:
+    A date found at a coarse frequency is the end, or the last date with
+    data, of a period. The first date at a finer frequency is then in the
+    same period, and the last date in the same or the next period.
+    """
+    period = PERIODS[frq]
+    found = found[[id_name, date]].dropna()
+    found = found[found[id_name].isin(bounds.index)].reset_index(drop=True)
+    found[date] = pd.to_datetime(found[date]).dt.normalize()
+    low = pd.to_datetime(found[id_name].map(bounds[start]))
+    high = pd.to_datetime(found[id_name].map(bounds[end]))
+    found["low"] = low
+    found["high"] = high
+    found = found[(found[date] >= low) & (found[date] <= high)]
+    dates = found.groupby(id_name).agg(
+        first=(date, "min"), last=(date, "max"), low=("low", "first"), high=("high", "first")
+    )
+    first_start = (dates["first"].dt.to_period(period) - lead).dt.start_time
+    last_end = (dates["last"].dt.to_period(period) + lag).dt.end_time.dt.normalize()
+    first_start = first_start.clip(lower=dates["low"])
+    last_end = last_end.clip(upper=dates["high"])
+    first = pd.DataFrame({start: first_start, end: dates["first"]})
+    last = pd.DataFrame({start: dates["last"], end: last_end})
+    # One window if the first and last window overlap
+    overlap = first[end] >= last[start] - pd.Timedelta(days=1)
+    first.loc[overlap, end] = last.loc[overlap, end]
+    narrowed = pd.concat([first, last[~overlap]]).sort_index(kind="stable")
+    narrowed = narrowed.reset_index()
+    narrowed[start] = narrowed[start].dt.strftime("%Y-%m-%d")
+    narrowed[end] = narrowed[end].dt.strftime("%Y-%m-%d")
+    # Instruments without any date found keep their windows
+    kept = windows[~windows[id_name].isin(dates.index)][[id_name, start, end]]
+    return pd.concat([narrowed, kept], ignore_index=True)
@@ -9,14 +9,18 @@
 
 """
 import os
-import sys
 import csv
 
 # import json
-import time  # For sleep functionality
 import eikon as ek
 import pandas as pd
+from src.my_functions import batch_sink as snk
+from src.my_functions import batch_sizing as bsz
+from src.my_functions import checkpoint as ckp
+from src.my_functions import error_ledger as erl
 from src.my_functions import own_functions as own
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
 
 # SET PANDAS CONFIGURATION
 pd.set_option("display.max_columns", None)
@@ -28,6 +32,15 @@
 # insert APP_KEY from app key generator in eikon
 ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
 SIZE = 5  # Number of IDs gathered per Eikon-loop. This must be very small.
+# Batches are packed by the rows per OrganizationID seen by earlier runs, so
+# small firms go many at a time and conglomerates alone. Unseen IDs count as
+# ROW_BUDGET / SIZE rows, i.e. as SIZE per Eikon-loop.
+ROW_BUDGET = 2500  # Rows per Eikon-loop
+MAX_PACK = 50  # Most IDs per Eikon-loop
+MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+USE_CACHE = False  # True to reuse responses of earlier runs
+CACHE = rc.ResponseCache() if USE_CACHE else None
+FIELD_GROUPS = None  # e.g. 2 narrower field groups fetched concurrently
 # print(sys.version)
 # print(ek.__version__)
 
@@ -53,7 +66,8 @@
     False  # If False, data is downloaded and saved as CSV, else as JSON
 )
 if save_as_json:
-    SUFFIX = "json"  # Adds correct file suffix
+    # Raw output is streamed to disk as NDJSON, or as "parquet"
+    SUFFIX = "ndjson"  # Adds correct file suffix
 else:
     SUFFIX = "csv"
 
@@ -78,9 +92,41 @@
         "VariableValue",
     ]
 
+
+def clean_statement(dta):
+    """
+    Enter a retrieved statement batch and get it cleaned.
+
+    Drops rows missing the period end date or the preliminary flag, and
+    duplicates. Drops the Org ID column and names the instrument column
+    OrganizationID.
+    """
+    if dta is None or dta.empty:
+        return pd.DataFrame()
+    my_header = list(dta.columns.values)
+    my_idx = list(my_header[1:3])
+    dta = dta.dropna(how="any", subset=my_idx)
+
+    # Remove any duplicates
+    dta = dta.drop_duplicates()
+    if not dta.empty:
+        dta = dta.drop("Org ID", axis="columns")
+        dta = dta.rename(columns={"Instruments": "OrganizationID"})
+        dta = dta.rename(columns={"Instrument": "OrganizationID"})
+    return dta
+
+
 if __name__ == "__main__":
     # PREPARE FILES
     SOURCE_FNAME_CPL = os.path.join(SOURCE_PATH, SOURCE_FNAME)
+    # Completed templates, years and batches, for resuming after a crash
+    manifest = ckp.Manifest(os.path.join(OUT_PATH, "actg.manifest.jsonl"))
+    ledger = erl.ErrorLedger(os.path.join(OUT_PATH, "actg.errors.jsonl"))
+    # Instruments that make their batch fail, like no_data.csv
+    quarantine = rtv.Quarantine(
+        os.path.join(OUT_PATH, "quarantine_organizationid.csv"),
+        id_name="OrganizationID",
+    )
 
     # READ THE DATA FROM SOURCE FILE
     # File has header. make it into a list
@@ -133,26 +179,12 @@
 
         for yr in range(LAST_YEAR, FIRST_YEAR - 1, -1):
             sdate = f"{yr + 1}-12-31"
-            period = f"FY{yr}"
+            period = f"FY{yr}"  # E.g. "FY2020".
             # OUT FILE MGMT
             # File per year
             o_fname = f"{tmpl}_{str(yr)}.{SUFFIX}"
             out_fname_cpl = os.path.join(OUT_PATH, o_fname)
 
-            # Remove output file, if it exists
-            if os.path.exists(out_fname_cpl):
-                os.remove(out_fname_cpl)
-
-            # Header to output file?
-            if not save_as_json:
-                with open(out_fname_cpl, "w", encoding="UTF8", newline="") as f:
-                    writer = csv.DictWriter(
-                        f, delimiter="\t", fieldnames=header
-                    )
-                    writer.writeheader()
-
-            period = f"FY{yr}"  # E.g. "FY2020".
-
             print(f"SDate :{str(sdate)}. Period: {period}. Template: {tmpl}.")
             # Set the parameters for TR.Field as a dictionary
 
@@ -189,96 +221,68 @@
                 #     ek.TR_Field("TR.F.IncomeStatement.FCCNameShort", own_dict),
             ]
 
-            dta_all = pd.DataFrame()  # Just so it is defined
-            year_idx = 0  # Counter needed for appending dataframe or dict
-            # The actual retrieval loop
-            # I run this in sections to avoid other types of errors such as 'timeout'
-            # errors
-
-            for line_start in range(0, len(own_list) + 1, SIZE):
-                line_end = line_start + SIZE
-                print(f"   + Lines: {str(line_start)}/{str(line_end)}")
-                # Have added a retry loop if error since sometimes there are
-                # problems in the API-connection
-                for rec_attempts in range(10):
-                    try:
-                        if not save_as_json:
-                            dta = pd.DataFrame()  # Just so it is defined
-                            dta, err = ek.get_data(
-                                instruments=own_list[line_start:line_end],
-                                fields=own_fields,
-                                raw_output=False,
-                            )
-                        else:
-                            dta_dict = ek.get_data(
-                                instruments=own_list[line_start:line_end],
-                                fields=own_fields,
-                                field_name=True,
-                                raw_output=True,
-                            )
-                    except Exception as own_err:
-                        print(
-                            f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
-                            f"again. "
-                        )
-                        # Try again after a sleep of 30 seconds
-                        time.sleep(30)
-                        continue
-                    else:
-                        break
-                else:
-                    # All attempts failed
-                    print("All attempts have failed: Program aborted")
-                    sys.exit()
+            # Skip the year if an earlier run has completed it. Don't touch
+            # its out-file.
+            unit = ckp.make_unit(
+                own_list, own_fields, template=tmpl, year=yr, json=save_as_json
+            )
+            if manifest.is_complete(unit):
+                print(f"   Template {tmpl} for {period} is already done.")
+                continue
 
-                if not save_as_json:
-                    if dta is not None:
-                        if not dta.empty:
-                            my_header = list(dta.columns.values)
-                            my_idx = list(my_header[1:3])
-                            dta = dta.dropna(how="any", subset=my_idx)
-
-                            # Remove any duplicates
-                            dta = dta.drop_duplicates()
-                        # Appends the retrieved Eikon data to out-file, unless empty dta
-                        if not dta.empty:
-                            dta = dta.drop("Org ID", axis="columns")
-                            # dta.columns = header
-                            # dta.columns = header
-                            # dta["VariableName"] = f"TR.F.{tmpl}"
-                            dta = dta.rename(
-                                columns={"Instruments": "OrganizationID"}
-                            )
-                            dta = dta.rename(
-                                columns={"Instrument": "OrganizationID"}
-                            )
+            # Remove output file, if it exists
+            if os.path.exists(out_fname_cpl):
+                os.remove(out_fname_cpl)
 
-                            frames = [dta_all, dta]
-                            dta_all = pd.concat(frames)
-                            print(f"     dta_all len is {len(dta_all)}")
+            # Header to output file?
+            if not save_as_json:
+                with open(out_fname_cpl, "w", encoding="UTF8", newline="") as f:
+                    writer = csv.DictWriter(
+                        f, delimiter="\t", fieldnames=header
+                    )
+                    writer.writeheader()
 
-                else:
-                    # Update dict prior to save
-                    if year_idx == 0:
-                        # Copy the first retrieved diction for the current year
-                        dict_all = dta_dict.copy()
-                    else:
-                        # Eikon json output saves its actual data as a list inside the diction.
-                        # I pop the list for the diction, append the list with the current retrieved data
-                        # and then add it back.
-                        dta_all = dict_all.pop("data")
-                        dta_update = dta_dict.pop("data")
-                        dict_all["data"] = dta_all + dta_update
-                year_idx += (
-                    1  # Index within a year (yr) to track each retrieval
-                )
-                time.sleep(1)
-            # Only save data to file once per yr
+            # The actual retrieval loop
+            # I run this in sections to avoid other types of errors such as 'timeout'
+            # errors. Completed sections are saved, so a restart resumes.
+            # CSV sections are appended to the out-file as they arrive.
+            # JSON sections are streamed to the out-file as they arrive too.
             if save_as_json:
-                dict_all["totalRowsCount"] = len(
-                    dta_all + dta_update
-                )  # Update row count based on full set of data
-                own.save_to_json(dict_all, out_fname_cpl)
+                sink = snk.RawSink(out_fname_cpl)
+            else:
+                sink = snk.BatchSink(out_fname_cpl)
+            if CACHE is None:
+                own_size = bsz.RowBudget(
+                    own_list,
+                    bsz.field_set_key(own_fields),  # Per template
+                    budget=ROW_BUDGET,
+                    default_rows=ROW_BUDGET // SIZE,
+                    max_size=MAX_PACK,
+                )
             else:
-                own.save_to_csv_file(dta_all, out_fname_cpl)
+                own_size = SIZE  # Fixed, so that a re-run asks for the same batches
+            rtv.get_data_batched(
+                own_list,
+                own_fields,
+                size=own_size,
+                max_workers=MAX_WORKERS,
+                clean=None if save_as_json else clean_statement,
+                label=f"({tmpl} {period})",
+                manifest=manifest,
+                unit=unit,
+                attempts=10,
+                cache=CACHE,
+                quarantine=quarantine,
+                ledger=ledger,
+                sink=sink,
+                # Joined on the period end date and FCC name per
+                # OrganizationID. JSON mode fetches all fields at once.
+                field_groups=FIELD_GROUPS,
+                key_fields=[datadate, var_name],
+                field_name=save_as_json,
+                raw_output=save_as_json,
+            )
+            print(f"     dta_all len is {sink.rows}")
+            sink.close()
+            manifest.mark_complete(unit)
 print("DONE")
@@ -26,11 +26,12 @@
 import os
 # import pathlib as pl
 import sys
-import time  # For sleep functionality
 from datetime import datetime
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
+from src.my_functions import rate_limit as rl
+from src.my_functions import retry_policy as rp
 
 
 # import pyarrow as pa
@@ -233,6 +234,7 @@ def clean_data(in_dta, in_idx, in_vars):
                 # problems in the API-connection
                 for rec_attempts in range(10):
                     try:
+                        rl.acquire(own_list[line_start:line_end], own_fields)  # Shared Eikon rate limit
                         dta, err = ek.get_data(
                             instruments=own_list[line_start:line_end],
                             fields=own_fields,
@@ -244,8 +246,8 @@ def clean_data(in_dta, in_idx, in_vars):
                             f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
                             f"again. "
                         )
-                        # Try again after a sleep of 30 seconds
-                        time.sleep(30)
+                        # Give up at once on permanent errors, else back off
+                        rp.handle_failure(own_err, rec_attempts)
                         continue
                     else:
                         break
@@ -7,7 +7,8 @@
 Retrieves a single Eikon instrument variable and saves it into a single csv-file.
 The script generates a -raw- file.
 
-Frequency is Interim
+Frequency is Interim. The periods of several fiscal years are retrieved in
+one request, see compile_plan, and split into one file per fiscal year.
 
 The output file is prefixed with the variable name in lower case
 (and suffixed csv). The csv-file is tab separated.
@@ -24,11 +25,15 @@
 import os
 # import pathlib as pl
 import sys
-import time  # For sleep functionality
 from datetime import datetime
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
+from src.my_functions import batch_sizing as bsz
+from src.my_functions import error_ledger as erl
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
+from src.my_functions import universe as unv
 
 
 # import pyarrow as pa
@@ -115,12 +120,105 @@ def clean_data(in_dta, in_idx, in_vars):
     return df
 
 
+# The report dates retrieved per period, in the order of the out-file header
+INTERIM_FIELDS = [
+    "TR.F.PeriodEndDate",
+    "TR.F.OriginalAnnouncementDate",
+    "TR.EPSActReportDate",
+    "TR.EPSFRActReportDate",
+    "TR.EBITActReportDate",
+    "TR.EBITDAActReportDate",
+]
+# The fiscal period of a row, e.g. FY2020 or FS1 2020, to file it by year
+FISCAL_PERIOD_FIELD = "TR.F.PeriodEndDate.fperiod"
+
+
+def compile_plan(rep_freq, first_year, last_year, years_per_request):
+    """
+    Enter a report frequency and a range of years and get the request plan.
+
+    Arguments:
+
+    rep_freq: The interim report frequency, FQ or FS.
+
+    first_year, last_year: The first and last fiscal year.
+
+    years_per_request: Number of years covered by one request.
+
+    Return: A list of (years, fields) tuples, one per request, where years
+    is the list of years covered and fields the ek.TR_Field objects, with
+    FISCAL_PERIOD_FIELD last.
+
+    Notes:
+    A request used to ask for one period, e.g. 1FS2020. The periods of a
+    span of years are instead expressed by the SDate, EDate and Frq
+    parameters, so one request gets all the periods ending in the span,
+    one row per period and instrument. A fiscal year need not end in
+    December, so the span is widened by a calendar year on each side, and
+    the rows are filed by their fiscal period, see split_by_year.
+    """
+    plan = []
+    for span_start in range(first_year, last_year + 1, years_per_request):
+        years = list(
+            range(span_start, min(span_start + years_per_request, last_year + 1))
+        )
+        own_dict = {
+            "SDate": f"{years[0] - 1}-01-01",
+            "EDate": f"{years[-1] + 1}-12-31",
+            "Frq": rep_freq,
+            "RollPeriods": "False",
+            # 'Scale': '6',s
+            "AlignType": "PeriodEndDate",
+            # 'ReportingState': 'Orig',
+            # 'ReportType': 'Final'
+        }
+        own_fields = [
+            ek.TR_Field(field, own_dict)
+            for field in INTERIM_FIELDS + [FISCAL_PERIOD_FIELD]
+        ]
+        plan.append((years, own_fields))
+    return plan
+
+
+def split_by_year(in_dta, years):
+    """
+    Enter a retrieved batch and its years and get the rows per year.
+
+    Arguments:
+
+    in_dta: The dataframe as returned by get_data, with the fiscal period
+    in the last column, see compile_plan.
+
+    years: The fiscal years of the request.
+
+    Return: A dictionary of year and dataframe, without the fiscal period
+    column, for the years having rows.
+
+    Notes:
+    The year of a row is the fiscal year of its period, e.g. 2020 for
+    FS2 2020, as when each period was requested on its own. Rows of other
+    fiscal years, at the widened ends of the span, are dropped. So are
+    rows without a fiscal period.
+    """
+    year = pd.to_numeric(
+        in_dta.iloc[:, -1].astype(str).str.extract(r"(\d{4})", expand=False),
+        errors="coerce",
+    )
+    return {
+        yr: in_dta[year == yr].iloc[:, :-1] for yr in years if (year == yr).any()
+    }
+
+
 if __name__ == "__main__":
     # SET THE EIKON CONFIGURATION
     ek.set_timeout(300)  # Set Eikon's timeout to be 5 min.
     # insert APP_KEY from app key generator in eikon
     ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
     SIZE = 7000  # Number of rows gathered per Eikon-loop
+    MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+    USE_CACHE = False  # True to reuse responses of earlier runs
+    CACHE = rc.ResponseCache() if USE_CACHE else None
+    YEARS_PER_REQUEST = 5  # Fiscal years of interim periods per request
     print(sys.version)
     print(ek.__version__)
 
@@ -150,7 +248,6 @@ def clean_data(in_dta, in_idx, in_vars):
     FIRST_YEAR = 2022
     # Adding +1 to hedge any possible missmatch btw fyr & cal-yr
     LAST_YEAR = datetime.now().year + 1
-    MIN_QTR = 1
 
     # WHERE IS, AND WHERE TO PUT, DATA?
     SOURCE_PATH = "G:\\"  # where is?
@@ -161,6 +258,8 @@ def clean_data(in_dta, in_idx, in_vars):
     # SOURCE_FNAME = 'rics_cleaned_v2'  # Name of source file
     SOURCE_FNAME = "organizationid_cleaned"  # Name of source file
     SOURCE_FNAME_SUFFIX = ".csv"  # Source file type
+    # firstdt and lastdt (first and last PeriodEndDate) per OrganizationID
+    DATE_RANGE_FNAME = "refinitiv_fundamentals_date_range.csv"
 
     OUT_FNAME = "anndats_act"  # Name of output file
     OUT_FNAME_SUFFIX = ".csv"  # Output file type
@@ -182,177 +281,95 @@ def clean_data(in_dta, in_idx, in_vars):
             "No of OrganizationIDs to retrieve data for: "
             + str(len(own_list))
         )
+        # Instruments that make their batch fail, like no_data.csv
+        quarantine = rtv.Quarantine(
+            os.path.join(OUT_PATH, "quarantine_organizationid.csv"),
+            id_name="OrganizationID",
+        )
+        ledger = erl.ErrorLedger(os.path.join(OUT_PATH, "interim.errors.jsonl"))
+        lifetimes = unv.read_lifetimes(
+            os.path.join(SOURCE_PATH, DATE_RANGE_FNAME),
+            "OrganizationID",
+            first="firstdt",
+            last="lastdt",
+        )
 
         # RETRIEVE DATA FROM EIKON
         for midix in REP_FREQ:
-            # IF bi-annuals, there's only two reports per year, otherwise there's four.
-            if midix == "FS":
-                MAX_QTR = 2
-            else:
-                MAX_QTR = 4
-
-            for yr in range(FIRST_YEAR, LAST_YEAR + 1):
+            # One request per span of fiscal years, instead of per period
+            for years, own_fields in compile_plan(
+                    midix, FIRST_YEAR, LAST_YEAR, YEARS_PER_REQUEST
+            ):
                 # OUT FILE MGMT
                 # File per year
-                O_FNAME = (
-                        OUT_FNAME
-                        + "_"
-                        + str(midix.lower())
-                        + "_"
-                        + str(yr)
-                        + OUT_FNAME_SUFFIX
-                )
-                OUT_FNAME_CPL = os.path.join(OUT_PATH, O_FNAME)
-
-                # Remove output file, if it exist
-                if os.path.exists(OUT_FNAME_CPL):
-                    os.remove(OUT_FNAME_CPL)
-
-                # Header to output file?
-                with open(
-                        OUT_FNAME_CPL, "w", encoding="UTF8", newline=""
-                ) as f:
-                    writer = csv.DictWriter(
-                        f, delimiter="\t", fieldnames=header
-                    )
-                    writer.writeheader()
-
-                for qtr in range(MIN_QTR, MAX_QTR + 1):
-                    # What period? E.g. 1FS2020, or 1FQ2020
-                    period = f"{qtr}{midix}{yr}"
-                    # If rolling start date (SDate)? What should it be?
-                    # s_dte = START_DATE
-                    s_yr = yr + 1
-                    s_dte = (
-                            str(s_yr)
-                            + "-"
-                            + str(START_MONTH)
-                            + "-"
-                            + str(START_DAY)
+                out_files = {}
+                for yr in years:
+                    O_FNAME = (
+                            OUT_FNAME
+                            + "_"
+                            + str(midix.lower())
+                            + "_"
+                            + str(yr)
+                            + OUT_FNAME_SUFFIX
                     )
-                    print(" - Period: " + str(period))
-                    own_fields = [
-                        ek.TR_Field(
-                            "TR.F.PeriodEndDate",
-                            {
-                                "SDate": s_dte,
-                                "Period": period,
-                                "RollPeriods": "False",
-                                # 'Scale': '6',s
-                                "AlignType": "PeriodEndDate",
-                                # 'ReportingState': 'Orig',
-                                # 'ReportType': 'Final'
-                            },
-                        ),
-                        ek.TR_Field(
-                            "TR.F.OriginalAnnouncementDate",
-                            {
-                                "SDate": s_dte,
-                                "Period": period,
-                                "RollPeriods": "False",
-                                # 'Scale': '6',s
-                                "AlignType": "PeriodEndDate",
-                                # 'ReportingState': 'Orig',
-                                # 'ReportType': 'Final'
-                            },
-                        ),
-                        ek.TR_Field(
-                            "TR.EPSActReportDate",
-                            {
-                                "SDate": s_dte,
-                                "Period": period,
-                                "RollPeriods": "False",
-                                # 'Scale': '6',s
-                                "AlignType": "PeriodEndDate",
-                                # 'ReportingState': 'Orig',
-                                # 'ReportType': 'Final'
-                            },
-                        ),
-                        ek.TR_Field(
-                            "TR.EPSFRActReportDate",
-                            {
-                                "SDate": s_dte,
-                                "Period": period,
-                                "RollPeriods": "False",
-                                # 'Scale': '6',s
-                                "AlignType": "PeriodEndDate",
-                                # 'ReportingState': 'Orig',
-                                # 'ReportType': 'Final'
-                            },
-                        ),
-                        ek.TR_Field(
-                            "TR.EBITActReportDate",
-                            {
-                                "SDate": s_dte,
-                                "Period": period,
-                                "RollPeriods": "False",
-                                # 'Scale': '6',s
-                                "AlignType": "PeriodEndDate",
-                                # 'ReportingState': 'Orig',
-                                # 'ReportType': 'Final'
-                            },
-                        ),
-                        ek.TR_Field(
-                            "TR.EBITDAActReportDate",
-                            {
-                                "SDate": s_dte,
-                                "Period": period,
-                                "RollPeriods": "False",
-                                # 'Scale': '6',s
-                                "AlignType": "PeriodEndDate",
-                                # 'ReportingState': 'Orig',
-                                # 'ReportType': 'Final'
-                            },
-                        ),
-                    ]
-                    # The actual retrieval loop
-                    # I run this in sections to avoid other types of errors such as 'timeout'
-                    # errors
-                    for line_start in range(0, len(own_list) + 1, SIZE):
-                        line_end = line_start + SIZE
-                        print(
-                            "   + Lines: "
-                            + str(line_start)
-                            + "/"
-                            + str(line_end)
+                    OUT_FNAME_CPL = os.path.join(OUT_PATH, O_FNAME)
+
+                    # Remove output file, if it exist
+                    if os.path.exists(OUT_FNAME_CPL):
+                        os.remove(OUT_FNAME_CPL)
+
+                    # Header to output file?
+                    with open(
+                            OUT_FNAME_CPL, "w", encoding="UTF8", newline=""
+                    ) as f:
+                        writer = csv.DictWriter(
+                            f, delimiter="\t", fieldnames=header
                         )
-                        # Have added a retry loop if error since sometimes there are
-                        # problems in the API-connection
-                        for rec_attempts in range(10):
-                            try:
-                                dta, err = ek.get_data(
-                                    instruments=own_list[line_start:line_end],
-                                    fields=own_fields,
-                                    field_name=False,
-                                    raw_output=False,
-                                )
-                            except Exception as own_err:
-                                print(
-                                    "Exception in attempt #"
-                                    + str(rec_attempts)
-                                    + ": "
-                                    + str(own_err)
-                                    + ", was raised. Trying again."
-                                )
-                                # Try again after a sleep of 30 seconds
-                                time.sleep(30)
-                                continue
-                            else:
-                                break
-                        else:
-                            # All attempts failed
-                            print("All attempts have failed: Program aborted")
-                            sys.exit()
-
-                        # Saves the retrieved Eikon data to out-file
-                        dta.to_csv(
-                            OUT_FNAME_CPL,
+                        writer.writeheader()
+                    out_files[yr] = OUT_FNAME_CPL
+
+                # Only the OrganizationIDs with fiscal periods ending around
+                # the years. 93 days allow for the start of the first period.
+                span_list = unv.prune(
+                    own_list,
+                    lifetimes,
+                    f"{years[0] - 1}-01-01",
+                    f"{years[-1] + 1}-{START_MONTH}-{START_DAY}",
+                    margin_days=93,
+                )
+                print(f" - Periods: {midix} {years[0]}--{years[-1]}")
+                # The actual retrieval loop
+                # I run this in sections to avoid other types of errors such as 'timeout'
+                # errors. Several sections are in flight at once.
+                for line_start, line_end, dta, err in rtv.iter_batches(
+                        span_list,
+                        own_fields,
+                        # Learned per field set, but fixed when cached, so
+                        # that a re-run asks for the same batches
+                        size=(
+                            bsz.load_batch_size(own_fields, SIZE // len(years))
+                            if CACHE is None
+                            else SIZE // len(years)
+                        ),
+                        max_workers=MAX_WORKERS,
+                        attempts=10,
+                        cache=CACHE,
+                        quarantine=quarantine,
+                        ledger=ledger,
+                        field_name=False,
+                        raw_output=False,
+                ):
+                    if dta is None:
+                        continue  # All instruments are quarantined
+                    # Saves the retrieved Eikon data to the out-file of its
+                    # fiscal year
+                    for yr, dta_yr in split_by_year(dta, years).items():
+                        dta_yr.to_csv(
+                            out_files[yr],
                             mode="a",
                             sep="\t",
                             encoding="utf-8",
                             index=False,
                             header=False,
                         )
-                        # Pause for 10s to reduce risk of throwing an exception
-                        time.sleep(10)
         print("DONE")
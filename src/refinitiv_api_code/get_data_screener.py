@@ -5,33 +5,42 @@
 This is an application of Refinitiv Screener.
 It seeks out firms (Business Organizations) that have either its
 headquarter in SE, or that is has its legal place in Sweden.
+
+The four screens (active/inactive, public/private) run concurrently. Each
+screen is saved as a csv-file, e.g. active_public.csv, and as a dated
+Parquet snapshot. The union of the screens is saved as
+organizationid_swe.csv and as a snapshot, together with a delta file of
+the OrganizationIDs added and removed since the previous snapshot, e.g.
+organizationid_swe_2026-10-16_delta.csv. Downstream jobs can then process
+only the delta.
 """
 
 # IMPORT PACKAGES
 
-import csv
+import concurrent.futures as cf
+import datetime as dt
 import os
+import pathlib as pl
 import sys
-import time  # For sleep functionality
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
+from src.my_functions import snapshot as snp
 
 # SET THE EIKON CONFIGURATION
 ek.set_timeout(300)  # Set Eikon's timeout to be 5 min.
 # insert APP_KEY from app key generator in eikon
 ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
-# SIZE = 7200  # Number of rows gathered per Eikon-loop
-print(sys.version)
-print(ek.__version__)
+MAX_WORKERS = 4  # Number of screens in flight at once
+USE_CACHE = False  # True to reuse responses of earlier runs
+CACHE = rc.ResponseCache() if USE_CACHE else None
 
 
 OUT_PATH = "D:\\"  # where to?
-OUT_FNAME_CPL = os.path.join(OUT_PATH, "test.csv")
-
-# Remove out-file, if it exist
-if os.path.exists(OUT_FNAME_CPL):
-    os.remove(OUT_FNAME_CPL)
+SNAPSHOT_PATH = pl.Path(OUT_PATH).joinpath("snapshots")  # Dated snapshots
+UNIVERSE = "organizationid_swe"  # Name of the union of the screens
 
 # COMBINATIONS
 # active, public
@@ -41,25 +50,61 @@
 # Selection criteria:
 #     HQ in Sweden OR RegCountry Sweden, AND
 #     OrgType is Business Organization (COM)
-# Combos:
-#   inactive, private
-#   inactive, public
-#   active, private
-#   inactive, private
 status = ["active", "inactive"]
 pubpriv = ["public", "private"]
 
-dta = pd.DataFrame()
-for s in status:
-    for p in pubpriv:
-        print(f"Screening for {s} and {p} firms")
-        df, err = ek.get_data(
-            instruments=f"SCREEN(U(IN(Equity({s},{p}))/*UNV:PublicPrivate*/), IN(TR.HQCountryCode,""SE"") OR IN(TR.RegCountryCode,""SE""), IN(TR.OrgTypeCode,""COM""), CURN=SEK)",fields=["TR.OrganizationID"],
-        )
+
+def screen_expression(s, p):
+    """ Enter a status and public or private and get the SCREEN expression. """
+    return f"SCREEN(U(IN(Equity({s},{p}))/*UNV:PublicPrivate*/), IN(TR.HQCountryCode,""SE"") OR IN(TR.RegCountryCode,""SE""), IN(TR.OrgTypeCode,""COM""), CURN=SEK)"
+
+
+def run_screens(screens, max_workers=MAX_WORKERS, **kwargs):
+    """
+    Enter the screens and get their results, retrieved concurrently.
+
+    Arguments:
+
+    screens: A list of (status, pubpriv) tuples, e.g. ("active", "public").
+
+    max_workers: Number of screens in flight at once.
+
+    Return: A dictionary of dataframes with the columns Instrument and
+    Organization PermID, as returned by get_data, per screen.
+
+    Notes:
+    **kwargs is for rtv.fetch_batch, e.g. cache. A screen is a single
+    request, so it is retried but never split.
+    """
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            (s, p): pool.submit(
+                rtv.fetch_batch,
+                screen_expression(s, p),
+                ["TR.OrganizationID"],
+                **kwargs,
+            )
+            for s, p in screens
+        }
+        results = {}
+        for (s, p), future in futures.items():
+            df, err = future.result()
+            print(f"Screened {len(df)} {s} and {p} firms")
+            results[(s, p)] = df
+    return results
+
+
+if __name__ == "__main__":
+    print(sys.version)
+    print(ek.__version__)
+    today = dt.date.today().isoformat()
+    screens = [(s, p) for s in status for p in pubpriv]
+    print(f"Screening for {len(screens)} combinations of firms")
+    results = run_screens(screens, cache=CACHE)
+
+    dta = []
+    for (s, p), df in results.items():
         # Saves the retrieved Eikon data to out-file
-        # Remove out-file, if it exist
-        # if os.path.exists(OUT_FNAME_CPL):
-        #     os.remove(OUT_FNAME_CPL)
         OUT_FNAME_CPL = os.path.join(OUT_PATH, f"{s}_{p}.csv")
         df.to_csv(
             OUT_FNAME_CPL,
@@ -71,26 +116,29 @@
         )
         df = df.drop("Instrument", axis="columns")
         df = df.rename(columns={"Organization PermID": "OrganizationID"})
-        dta = dta.append(df)  # TODO Replace with pd.concat(df1, df2, sort=False)
-dta = dta.drop_duplicates()
-OUT_FNAME_CPL = os.path.join(OUT_PATH, "organizationid_swe.csv")
-df.to_csv(
-    OUT_FNAME_CPL,
-    mode="w",
-    sep="\t",
-    encoding="utf-8",
-    index=False,
-    header=True,
-)
-
-# df, err = ek.get_data(
-#     # instruments="SCREEN(U(IN(Equity(inactive,private))/*UNV:PublicPrivate*/), IN(TR.HQCountryCode,""SE"") OR IN(TR.RegCountryCode,""SE"") OR IN(TR.ExchangeCountryCode,""SE""), CURN=USD)",
-#     instruments="SCREEN(U(IN(Equity(inactive,private))/*UNV:PublicPrivate*/), IN(TR.HQCountryCode,""SE"") OR IN(TR.RegCountryCode,""SE""), IN(TR.OrgTypeCode,""COM""), CURN=USD)",
-#     fields=['TR.OrganizationID'])
-
-# # Saves the retrieved Eikon data to out-file
-# df.to_csv(OUT_FNAME_CPL, mode='a', sep='\t',
-#           encoding='utf-8', index=False, header=True)
-
-print(len(df))
-print("Done")
+        df = df.dropna().drop_duplicates()
+        snp.save_snapshot(df, SNAPSHOT_PATH, f"{s}_{p}", today)
+        dta.append(df)
+    dta = pd.concat(dta, sort=False).drop_duplicates()
+    dta = dta.sort_values(by="OrganizationID")
+    OUT_FNAME_CPL = os.path.join(OUT_PATH, f"{UNIVERSE}.csv")
+    dta.to_csv(
+        OUT_FNAME_CPL,
+        mode="w",
+        sep="\t",
+        encoding="utf-8",
+        index=False,
+        header=True,
+    )
+
+    # Compare with the previous snapshot of the union
+    previous = snp.previous_snapshot(SNAPSHOT_PATH, UNIVERSE, today)
+    snp.save_snapshot(dta, SNAPSHOT_PATH, UNIVERSE, today)
+    delta = snp.diff_snapshots(previous, dta, "OrganizationID")
+    delta_file = snp.save_delta(delta, SNAPSHOT_PATH, UNIVERSE, today)
+    n_added = int((delta["Change"] == "added").sum())
+    print(
+        f"{len(dta)} firms, {n_added} added and {len(delta) - n_added} removed "
+        f"since {previous.name if previous is not None else 'no snapshot'}: {delta_file}"
+    )
+    print("Done")
@@ -4,8 +4,9 @@
 
 Based on a list of RICs
 
-Retrieves a single Eikon variable (TR.XXX) and saves it into a single csv-file.
-The script generates two files, a -raw- file and a v2 file. The v2 file has data
+Retrieves Eikon variables (TR.XXX) in one pass, all variables per request.
+The script generates a wide Parquet file, static_{sym_in}.parquet, with one
+column per variable, and a v2 file per variable. The v2 file has data
 where empty rows, and possible duplicate rows, are discarded. Use v2.
 
 If another type of Eikon variable is sought, as e.g. following the format
@@ -13,8 +14,8 @@
 
 Beware that the list of RICs expects a heading, then a single empty row.
 
-The output file is prefixed with the variable name in lower case
-(and suffixed csv). The csv-file is tab separated.
+The v2 file is prefixed with the variable name in lower case
+(and suffixed _v2.csv). The csv-file is tab separated.
 
 Input required
 ---------------
@@ -28,10 +29,12 @@
 # from datetime import datetime
 import csv
 import os
-import sys
 import pathlib as pl
-import time  # For sleep functionality
+from src.my_functions import batch_sink as snk
+from src.my_functions import error_ledger as erl
 from src.my_functions import own_functions as own
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
@@ -48,6 +51,9 @@
 # insert APP_KEY from app key generator in eikon
 ek.set_app_key('1418cf51ee9046a3a767d6f8c871c1d3fcaf1953')
 SIZE = 6500  # Number of rows gathered per Eikon-loop
+MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+USE_CACHE = False  # True to reuse responses of earlier runs
+CACHE = rc.ResponseCache() if USE_CACHE else None
 
 # FROM WHICH VARIABLE?
 # SYM_IN = "InstrumentID"
@@ -82,6 +88,26 @@
 name = "refinitiv_relations.csv"
 SOURCE_FILE = pl.Path.joinpath(raw_path, name)
 
+
+def clean_static(dta, columns):
+    """
+    Enter a retrieved batch and its column names and get it cleaned.
+
+    The columns are named SYM_IN and the variable names, in the order of
+    the fields. Dates are formatted as e.g. 2020-12-31, and rows without
+    any variable are dropped.
+    """
+    if dta is None or dta.empty:
+        return pd.DataFrame(columns=columns)
+    dta = dta.copy()
+    dta.columns = columns
+    for col in columns[1:]:
+        if pd.api.types.is_datetime64_any_dtype(dta[col]):
+            dta[col] = dta[col].dt.strftime("%Y-%m-%d")
+    dta = dta.dropna(how='all', subset=columns[1:])
+    return dta
+
+
 if __name__ == '__main__':
 
     # READ THE DATA FROM SOURCE FILE
@@ -102,98 +128,57 @@
     own_list = own_list[SYM_IN].values.tolist()
 
     # RETRIEVE DATA FROM EIKON
+    # All variables in one pass. The wide file holds all of them, and the
+    # v2 file of each variable is derived from it batch by batch.
     print(f'No of {SYM_IN}s to retrieve data for: {str(len(own_list))}')
-    for i in OWN_VARIABLES:
-        OWN_VAR = str(OWN_VAR_SUFFIX) + i
-        print(f'Retrieves data for Eikon variable: {str(OWN_VAR)}')
-
-        # Out file name concatenation
-        O_FNAME = str(i).lower() + '.csv'
-        OUT_FNAME_CPL = pl.Path.joinpath(out_path, O_FNAME)
-
-        # Remove out-file, if it exist
-        if os.path.exists(OUT_FNAME_CPL):
-            os.remove(OUT_FNAME_CPL)
-
-        # Header to output file?
-        header = [SYM_IN, i]
-        with open(OUT_FNAME_CPL, 'w', encoding='UTF8', newline='') as f:
-            writer = csv.DictWriter(f, delimiter='\t', fieldnames=header)
-            writer.writeheader()
-
-        # The actual retrieval loop
-        # I run this in sections to avoid other types of errors such as 'timeout'
-        # errors
-        for line_start in range(0, len(own_list) + 1, SIZE):
-            line_end = line_start + SIZE
-            print(' - From ' + str(line_start) + ', to ' + str(line_end))
-            my_fields = OWN_VAR
-
-            # Have added a retry loop if error since sometimes there are
-            # problems in the API-connection
-            for rec_attempts in range(20):
-                try:
-                    dta, err = ek.get_data(
-                        instruments=own_list[line_start:line_end],
-                        fields=my_fields
-                    )
-                    dta["PriceCloseDate"] = dta["PriceCloseDate"].dt.strftime(
-                        "%Y-%m-%d"
-                    )
-                except Exception as own_err:
-                    print('Exception in attempt #' + str(rec_attempts) +
-                          ': ' + str(own_err) + ', was raised. Trying again.')
-                    # Try again after a sleep of 30 seconds
-                    time.sleep(30)
-                    continue
-                else:
-                    break
-            else:
-                # All attempts failed
-                print('All attempts have failed: Program aborted while \
-                processing variable' + str(my_fields))
-                sys.exit()
-
-            # Saves the retrieved Eikon data to out-file
-            dta.to_csv(OUT_FNAME_CPL, mode='a', sep='\t', float_format='str',
-                       quoting=csv.QUOTE_ALL, encoding='utf-8',
-                       index=False, header=False)
-            # Pause for 10s to reduce risk of throwing an exception
-            # time.sleep(10)
-
-    # FIX OUTPUT FILES
+    own_fields = [str(OWN_VAR_SUFFIX) + i for i in OWN_VARIABLES]
+    print(f'Retrieves data for Eikon variables: {", ".join(own_fields)}')
+    WIDE_FNAME_CPL = pl.Path.joinpath(out_path, f"static_{SYM_IN.lower()}.parquet")
+    # Remove out-files, if they exist
+    if os.path.exists(WIDE_FNAME_CPL):
+        os.remove(WIDE_FNAME_CPL)
+    wide = snk.BatchSink(WIDE_FNAME_CPL)
+    long = {}
     for o_var in OWN_VARIABLES:
-        print('Final process for ' + str(o_var))
-        # Out-file name concatenation
-        # Original file
-        O_FNAME = str(o_var).lower() + '.csv'
-        OUT_FNAME_CPL = pl.Path.joinpath(out_path, O_FNAME)
         # Revised file
         NEW_O_FNAME = str(o_var).lower() + '_v2' + '.csv'
         NEW_OUT_FNAME_CPL = pl.Path.joinpath(out_path, NEW_O_FNAME)
-
-        # Remove revised out-file, if it exists
         if os.path.exists(NEW_OUT_FNAME_CPL):
             os.remove(NEW_OUT_FNAME_CPL)
-
         # Write header to revised out file
         header = [SYM_IN, o_var]
         with open(NEW_OUT_FNAME_CPL, 'w', encoding='UTF8', newline='') as f:
             writer = csv.DictWriter(f, delimiter='\t', fieldnames=header)
             writer.writeheader()
-        # Read the original out file
-        dta = pd.read_csv(OUT_FNAME_CPL, delimiter='\t', low_memory=False, dtype=str)
-        print(len(dta))
-
-        # Drop empty rows
-        dta = dta.dropna(subset=[o_var])
-
-        # Remove any duplicates
-        dta = dta.drop_duplicates()
-        print(len(dta))
-
-        # Save data
-        dta.to_csv(NEW_OUT_FNAME_CPL, mode='a', sep='\t',
-                   quoting=csv.QUOTE_ALL, encoding='utf-8',
-                   index=False, header=False)
+        # The values are quoted, as before
+        long[o_var] = snk.BatchSink(NEW_OUT_FNAME_CPL, quoting=csv.QUOTE_ALL)
+    # Instruments that make their batch fail
+    quarantine = rtv.Quarantine(
+        raw_path.joinpath(f"quarantine_{SYM_IN.lower()}.csv"), id_name=SYM_IN
+    )
+
+    # The actual retrieval loop
+    # I run this in sections to avoid other types of errors such as 'timeout'
+    # errors. Several sections are in flight at once.
+    for line_start, line_end, dta, err in rtv.iter_batches(
+        own_list,
+        own_fields,
+        size=SIZE,
+        max_workers=MAX_WORKERS,
+        cache=CACHE,
+        quarantine=quarantine,
+        ledger=erl.ErrorLedger.for_output(WIDE_FNAME_CPL),
+        field_name=False,
+        raw_output=False,
+    ):
+        dta = clean_static(dta, [SYM_IN] + OWN_VARIABLES)
+        # Saves the retrieved Eikon data to the out-files, dropping empty
+        # and duplicate rows as they arrive
+        wide.write(dta)
+        for o_var in OWN_VARIABLES:
+            long[o_var].write(dta[[SYM_IN, o_var]].dropna(subset=[o_var]))
+    wide.close()
+    for o_var in OWN_VARIABLES:
+        long[o_var].close()
+        print(f'Final process for {o_var}: {long[o_var].rows} rows')
     print('DONE')
@@ -22,12 +22,13 @@
 import csv
 import os
 import sys
-import time  # For sleep functionality
 # IMPORT PACKAGES
-from datetime import datetime
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
+from src.my_functions import batch_sink as snk
+from src.my_functions import rate_limit as rl
+from src.my_functions import retry_policy as rp
 
 # SET THE EIKON CONFIGURATION
 ek.set_timeout(300)  # Set Eikon's timeout to be 5 min.
@@ -140,7 +141,8 @@
         ]
         # The actual retrieval loop
         # I run this in sections to avoid other types of errors such as 'timeout'
-        # errors
+        # errors. Duplicates are dropped across the sections of the year.
+        sink = snk.BatchSink(OUT_FNAME_CPL)
         for line_start in range(0, len(own_list) + 1, SIZE):
             line_end = line_start + SIZE
             # Have added a retry loop if error since sometimes there are
@@ -148,6 +150,7 @@
             for rec_attempts in range(10):
                 try:
                     # Retrieval function get_data
+                    rl.acquire(own_list[line_start:line_end], own_fields)  # Shared Eikon rate limit
                     dta, err = ek.get_data(
                         instruments=own_list[line_start:line_end],
                         fields=own_fields,
@@ -159,8 +162,8 @@
                         f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
                         f"again. "
                     )
-                    # Try again after a sleep of 30 seconds
-                    time.sleep(30)
+                    # Give up at once on permanent errors, else back off
+                    rp.handle_failure(own_err, rec_attempts)
                     continue
                 else:
                     break
@@ -173,21 +176,11 @@
             my_header = list(dta.columns.values)
             dta = dta.dropna(how="any", subset=my_header[1])
 
-            # Remove any duplicates
-            dta = dta.drop_duplicates()
-
-            # Saves the retrieved Eikon data to out-file
-            if len(dta) > 0:
-                dta.to_csv(
-                    OUT_FNAME_CPL,
-                    mode="a",
-                    sep="\t",
-                    encoding="utf-8",
-                    index=False,
-                    header=False,
-                )
+            # Saves the retrieved Eikon data to out-file, without duplicates
+            sink.write(dta)
             # Pause for 10s to reduce risk of throwing an exception
             # time.sleep(10)
+        sink.close()
 
     # FIX OUTPUT FILE
     # Revised file name
@@ -6,7 +6,12 @@
 in Refinitiv Eikon.
 
 The period end dates collected are from frequency FI (Financial Interim),
-FS (Financial Semi-Annual), FQ (Financial Quarterly) and FY (Financial Year)
+FS (Financial Semi-Annual), FQ (Financial Quarterly) and FY (Financial Year),
+as one field per frequency in the same request.
+
+With PROBE, the FY period end dates are retrieved first. The FI, FS and FQ
+period end dates are then only retrieved in the years around the first and
+last FY period end date, since only these can move firstdt and lastdt.
 
 The OrganizationIDs are contingent on having InstrumentIDs (at least one) being
 Common Stock (ORD, FULLPAID) preference shares (PRF, PREFERRED) and for ADRs.
@@ -26,14 +31,15 @@
 
 """
 import csv
-import os
 import pathlib as pl
-import sys
-import time  # For sleep functionality
 
 # IMPORT PACKAGES
-from datetime import datetime as dt
+from src.my_functions import error_ledger as erl
+from src.my_functions import id_ledger as idl
 from src.my_functions import own_functions as own
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
+from src.my_functions import universe as unv
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
@@ -43,6 +49,14 @@
 # insert APP_KEY from app key generator in eikon
 ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
 SIZE = 100  # Number of rows gathered per Eikon-loop
+MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+USE_CACHE = False  # True to reuse responses of earlier runs
+CACHE = rc.ResponseCache() if USE_CACHE else None
+CHUNK = 5000  # Number of OrganizationIDs probed together, saved once per chunk
+# Probe the fiscal years first, and only get the interim period end dates in
+# the years around the first and last fiscal year. Opt-in: an interim period
+# outside these years is not seen. False to get all of them
+PROBE = False
 
 # SET PANDAS CONFIGURATION
 pd.set_option("display.max_columns", None)
@@ -77,6 +91,114 @@
 first_date = "1990-01-01"
 last_date = "2022-06-06"
 
+
+
+def period_end_dates(dta):
+    """
+    Enter a retrieved batch and get the period end dates.
+
+    Return: A dataframe with OrganizationID and date.
+
+    Notes:
+    The batch has one Period End Date column per frequency. Their rows are
+    shared, not aligned by date, so the columns are stacked.
+    """
+    if dta is None or dta.empty:
+        return pd.DataFrame(columns=["OrganizationID", "date"])
+    dta = pd.DataFrame(
+        {
+            "OrganizationID": dta.iloc[:, 0].tolist() * (dta.shape[1] - 1),
+            "date": [
+                dte for col in range(1, dta.shape[1]) for dte in dta.iloc[:, col]
+            ],
+        }
+    )
+    # Drop empty rows
+    dta = dta.dropna(how="any", subset=["date"])
+    dta = dta.drop_duplicates()
+    D_FORMAT = "%Y-%m-%d"  # E.g. 2020-12-31
+    dta["date"] = pd.to_datetime(dta["date"], format=D_FORMAT)
+    return dta
+
+
+def fetch_period_ends(windows, frequencies, **kwargs):
+    """
+    Enter date windows and fiscal frequencies and get the period end dates.
+
+    Arguments:
+
+    windows: A dataframe with OrganizationID, SDate and EDate, one or more
+    rows per organization.
+
+    frequencies: The list of frequencies, e.g. ["FI", "FS", "FQ"].
+
+    Return: The tuple (found, answered, failed), i.e. a dataframe with
+    OrganizationID and date, the set of organizations answered, with data
+    or not, and the set of organizations with a transient error not
+    recovered.
+
+    Notes:
+    **kwargs is for rtv.iter_requests, e.g. quarantine and ledger.
+    The responses are parsed by rtv.iter_parsed while the next ones are
+    retrieved.
+    """
+    # Organizations with similar windows share one request
+    groups = unv.group_windows(windows, "OrganizationID", freq="Y")
+
+    def requests():
+        for sdate, edate, orgs in groups:
+            # One field per frequency, so that one request gets them all
+            own_fields = []
+            for frequency in frequencies:
+                # Period
+                period = f"{frequency}0"  # E.g. FI0 as in current Fiscal Interim
+                own_dict = {
+                    "Period": period,
+                    "SDate": sdate,
+                    "Edate": edate,
+                    "Frq": frequency,
+                    # "Scale": scale,
+                    # "ReportType": rep_type,
+                    # "ReportingState": rep_state,
+                    # "ConsolBasis": consol_basis,
+                    # "Curn": curn,
+                    # "AlignType": align,
+                    # "RollPeriods": roll,
+                    # "IncludeSpl": special,
+                }
+                own_fields.append(
+                    ek.TR_Field("TR.TotalAssetsReported.periodenddate", own_dict)
+                )
+            for line_start in range(0, len(orgs), SIZE):
+                part = orgs[line_start:line_start + SIZE]
+                yield (sdate, edate, part), part, own_fields
+
+    def parse(item):
+        tag, dta, err = item
+        orgs = set()
+        if dta is not None and not dta.empty:
+            orgs.update(dta.iloc[:, 0])
+        return tag, period_end_dates(dta), orgs, err
+
+    frames = []
+    answered = set()  # Organizations in the responses, even if only an empty row
+    failed = set()
+    for (sdate, edate, orgs), dates, orgs_answered, err in rtv.iter_parsed(
+        rtv.iter_requests(requests(), field_name=False, raw_output=False, **kwargs),
+        parse,
+    ):
+        print(
+            f" - {len(orgs)} OrganizationID for period {sdate} -- {edate} for frequency {', '.join(frequencies)}"
+        )
+        # A permanent error, e.g. 412 or 416, is an answer without data
+        err_answered, err_failed = rtv.split_errors(err)
+        answered.update(orgs_answered, err_answered)
+        failed.update(err_failed)
+        frames.append(dates)
+    found = pd.concat(frames) if frames else period_end_dates(None)
+    return found, answered, failed
+
+
 if __name__ == "__main__":
 
     # PREPARE OUT/ERROR FILES
@@ -94,7 +216,7 @@
     # READ THE DATA FROM SOURCE FILE
     # File has header. make it into a list
     own_list = own.read_csv_file(SOURCE_FILE)
-    own_list =own_list["OrganizationID", "InstrumentID"]
+    own_list = own_list[["OrganizationID", "InstrumentID"]]
     own_list = own_list.dropna(
         how="any",
         subset=[
@@ -103,15 +225,10 @@
         ],  # Must be possible to trace Instrument to Organization
     )
 
-    # Read already collected ID vars
-    existing_id = own.read_csv_file(out_file)
-    existing_id = existing_id["OrganizationID"]
-    existing_id = existing_id.to_frame()
-    err_instrument = own.read_csv_file(err_file)
-    frames = [existing_id, err_instrument]
-    existing_id = pd.concat(frames)
-    existing_id.drop_duplicates(inplace=True)
-    # own.save_to_csv_file(existing_id, test3, header=True, mode="w")
+    # Already collected ID vars, in the out-file or the error file. The
+    # csv-files are only read beyond the rows the ledger has recorded.
+    collected = idl.IdLedger.for_output(out_file, "OrganizationID")
+    collected.import_files(out_file, err_file)
 
     ## Subset to particular types financial instruments
     instrumentid = own_list["InstrumentID"]
@@ -141,116 +258,92 @@
     )
 
     ## Drop if data has already been collected
-    own_list = (own_list.merge(existing_id, on="OrganizationID", how="left", indicator=True)
-                        .query('_merge == "left_only"')
-                        .drop(labels="_merge", axis=1))
     own_list.drop_duplicates(subset=["OrganizationID"], inplace=True)
+    pending = collected.pending(own_list["OrganizationID"])
+    own_list = own_list[own_list["OrganizationID"].isin(pending)]
     own_list = own_list[SYM_IN].values.tolist()
 
     # RETRIEVE DATA FROM EIKON
     print(f"No of 'OrganizationID' to retrieve data for: {str(len(own_list))}.")
-    for line_start in range(0, len(own_list) + 1, SIZE):
-        line_end = line_start + SIZE
-        no_data = pd.DataFrame()
+    bounds = pd.DataFrame(
+        {"OrganizationID": own_list, "SDate": first_date, "EDate": last_date}
+    )
+    bounds = bounds.set_index("OrganizationID")
+    own_kwargs = {
+        "max_workers": MAX_WORKERS,
+        "cache": CACHE,
+        # Organizations that make their batch fail, like no_data_organizationid.csv
+        "quarantine": rtv.Quarantine(
+            raw_path.joinpath("quarantine_organizationid.csv"),
+            id_name="OrganizationID",
+        ),
+        "ledger": erl.ErrorLedger.for_output(out_file),  # Not recovered
+    }
+    for line_start in range(0, len(own_list), CHUNK):
+        line_end = line_start + CHUNK
         my_list = own_list[line_start:line_end]
+        print(f" + Lines: {str(line_start)}/{str(line_end)}")
+        windows = bounds.loc[my_list].reset_index()
+        failed = set()
+        frames = []
+        frequencies = ["FI", "FS", "FQ", "FY"]
+        if PROBE:
+            # The fiscal years give the years of the first and last period
+            # end date. An interim period may end up to a year before the
+            # first fiscal year, and up to two years after the last one.
+            found, answered, failed = fetch_period_ends(windows, ["FY"], **own_kwargs)
+            failed.update(set(my_list) - answered)
+            windows = windows[~windows["OrganizationID"].isin(failed)]
+            windows = unv.boundary_windows(
+                windows, found, bounds, "OrganizationID", "FY", lead=1, lag=2
+            )
+            frames.append(found)
+            frequencies = ["FI", "FS", "FQ"]
+        found, answered_all, stage_failed = fetch_period_ends(
+            windows, frequencies, **own_kwargs
+        )
+        failed.update(stage_failed)
+        if not PROBE:
+            answered = answered_all
+        frames.append(found)
+        dta = pd.concat(frames)
+        # Organizations with a failed request may miss a period end date
+        dta = dta[~dta["OrganizationID"].isin(failed)]
+        # Appends the retrieved Eikon data to out-file, unless empty dta
+        if not dta.empty:
+            ## Create firstdt and lastdt
+            dta = dta.groupby("OrganizationID", sort=False)["date"].agg(
+                ["min", "max"]
+            )
+            dta["firstdt"] = dta["min"].dt.strftime("%Y-%m-%d")
+            dta["lastdt"] = dta["max"].dt.strftime("%Y-%m-%d")
+            dta = dta.reset_index()[["OrganizationID", "firstdt", "lastdt"]]
 
-        dta_all = pd.DataFrame()
-        for frequency in ["FI", "FS", "FQ", "FY"]:
-            print(f" + Lines: {str(line_start)}/{str(line_end)} for frequency {frequency}")
-            # Period
-            period = f"{frequency}0"  # E.g. FI0 as in current Fiscal Interim
-            own_dict = {
-                "Period": period,
-                "SDate": first_date,
-                "Edate": last_date,
-                "Frq": frequency,
-                # "Scale": scale,
-                # "ReportType": rep_type,
-                # "ReportingState": rep_state,
-                # "ConsolBasis": consol_basis,
-                # "Curn": curn,
-                # "AlignType": align,
-                # "RollPeriods": roll,
-                # "IncludeSpl": special,
-            }
-            own_fields = [
-                ek.TR_Field("TR.TotalAssetsReported.periodenddate", own_dict)
-            ]
-            # The actual retrieval loop
-            # I run this in sections to avoid other types of errors such as 'timeout'
-            # errors
-
-            # Have added a retry loop if error since sometimes there are
-            # problems in the API-connection
-            for rec_attempts in range(20):
-                try:
-                    # Retrieval function get_data
-                    dta, err = ek.get_data(
-                        instruments=my_list,
-                        fields=own_fields,
-                        field_name=False,
-                        raw_output=False,
-                    )
-                    dta.rename(
-                        {
-                            "Instrument": "OrganizationID",
-                            "Period End Date": "PeriodEndDate"
-                        },
-                        axis=1,
-                        inplace=True,
-                    )
-                    frames = [dta_all, dta]
-                    dta_all = pd.concat(frames)
-                except Exception as own_err:
-                    print(
-                        f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
-                        f"again. "
-                    )
-                    # Try again after a sleep of 30 seconds
-                    time.sleep(30)
-                    continue
-                else:
-                    break
+            # Only save data to file once per loop
+            if pl.Path.exists(out_file):
+                own.save_to_csv_file(dta, out_file)
             else:
-                # All attempts failed
-                print(
-                    f"All attempts have failed: Program aborted while running lines: {str(line_start)}/{str(line_end)}"
-                )
-                sys.exit()
-        dta = dta_all.copy()
-        if dta is not None:
-            if not dta.empty:
-                # Drop empty rows
-                my_header = list(dta.columns.values)
-                dta = dta.dropna(how="any", subset=my_header[1:])
-                # Remove any duplicates
-                dta = dta.drop_duplicates()
-            # Appends the retrieved Eikon data to out-file, unless empty dta
-            if not dta.empty:
-                ## Create firstdt and lastdt
-                D_FORMAT = "%Y-%m-%d"  # E.g. 2020-12-31
-                dta["PeriodEndDate"] = pd.to_datetime(dta["PeriodEndDate"], format=D_FORMAT)
-                dta["firstdt"] = dta.groupby("OrganizationID")["PeriodEndDate"].transform("min")
-                dta["lastdt"] = dta.groupby("OrganizationID")["PeriodEndDate"].transform("max")
-                dta["firstdt"] = dta["firstdt"].dt.strftime("%Y-%m-%d")
-                dta["lastdt"] = dta["lastdt"].dt.strftime("%Y-%m-%d")
-                dta = dta[["OrganizationID", "firstdt", "lastdt"]]
-                # Drop empty rows
-                my_header = list(dta.columns.values)
-                dta = dta.dropna(how="any", subset=my_header[1:])
-                dta = dta.drop_duplicates()
-
-                # Only save data to file once per loop
-                if pl.Path.exists(out_file):
-                    own.save_to_csv_file(dta, out_file)
-                else:
-                    own.save_to_csv_file(dta, out_file, header=True, mode="w")
+                own.save_to_csv_file(dta, out_file, header=True, mode="w")
+        # Organizations answered without data. Organizations that failed
+        # are left out, so they are tried again by the next run.
+        found = set(dta["OrganizationID"])
+        no_data = pd.DataFrame(
+            {
+                "OrganizationID": [
+                    org
+                    for org in my_list
+                    if org in answered
+                    and org not in failed
+                    and org not in found
+                ]
+            }
+        )
+        if not no_data.empty:
+            if pl.Path.exists(err_file):
+                own.save_to_csv_file(no_data, err_file)
             else:
-                no_data["OrganizationID"] = my_list
-                if pl.Path.exists(err_file):
-                    own.save_to_csv_file(no_data, err_file)
-                else:
-                    own.save_to_csv_file(no_data, err_file, header=True, mode="w")
-                print(f"     No data")
-        time.sleep(1)
+                own.save_to_csv_file(no_data, err_file, header=True, mode="w")
+            print(f"     No data for {len(no_data)} OrganizationID")
+        # Record the chunk as collected, once it is saved
+        collected.record(found=dta, no_data=no_data["OrganizationID"])
     print("DONE")
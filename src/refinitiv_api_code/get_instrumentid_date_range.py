@@ -14,15 +14,13 @@
 Source file path: Where is the list
 Out file path: Where to put the output file?
 """
-import csv
-import os
 import pathlib as pl
 import sys
-import time  # For sleep functionality
 
 # IMPORT PACKAGES
-from datetime import datetime as dt
 from src.my_functions import own_functions as own
+from src.my_functions import rate_limit as rl
+from src.my_functions import retry_policy as rp
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
@@ -292,6 +290,7 @@
         for rec_attempts in range(20):
             try:
                 # Retrieval function get_data
+                rl.acquire(qte, own_fields)  # Shared Eikon rate limit
                 dta, err = ek.get_data(
                     instruments=qte,
                     fields=own_fields,
@@ -312,8 +311,8 @@
                     f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
                     f"again. "
                 )
-                # Try again after a sleep of 30 seconds
-                time.sleep(30)
+                # Give up at once on permanent errors, else back off
+                rp.handle_failure(own_err, rec_attempts)
                 continue
             else:
                 break
@@ -353,5 +352,4 @@
                 else:
                     own.save_to_csv_file(no_data, err_file, header=True, mode="w")
                 print(f"     No data")
-        time.sleep(1)
     print("DONE")
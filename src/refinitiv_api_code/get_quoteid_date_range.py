@@ -14,15 +14,15 @@
 Source file path: Where is the list
 Out file path: Where to put the output file?
 """
-import csv
-import os
 import pathlib as pl
-import sys
-import time  # For sleep functionality
 
 # IMPORT PACKAGES
-from datetime import datetime as dt
+from src.my_functions import error_ledger as erl
+from src.my_functions import id_ledger as idl
 from src.my_functions import own_functions as own
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
+from src.my_functions import universe as unv
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
@@ -32,6 +32,18 @@
 # insert APP_KEY from app key generator in eikon
 ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
 SIZE = 1500  # Number of rows gathered per Eikon-loop
+ROWS = 100000  # Most daily rows per request, i.e. QuoteIDs times trading days
+MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+USE_CACHE = False  # True to reuse responses of earlier runs
+CACHE = rc.ResponseCache() if USE_CACHE else None
+GROUPED = True  # Fetch QuoteIDs with similar SDate and EDate in one request
+GROUP_FREQ = "M"  # Windows are widened to whole months to share a request
+CHUNK = 20000  # Number of QuoteIDs probed together, saved once per chunk
+# Coarse frequencies probed for the periods holding the first and last date,
+# before the daily data, e.g. ["CY", "M"]. Opt-in: a quote without a value in
+# its first coarse period, e.g. listed in its last days, may lose its first
+# date. [] to download the full daily history per quote
+PROBE_FREQS = []
 
 # SET PANDAS CONFIGURATION
 pd.set_option("display.max_columns", None)
@@ -73,6 +85,164 @@
 test3 = pl.Path.joinpath(out_path, "test3.csv")
 
 
+def dates_per_quote(dta, windows):
+    """
+    Enter a retrieved batch and the date windows and get the dates.
+
+    Arguments:
+
+    dta: The dataframe as returned by get_data, with the columns
+    Instrument, Date and Daily Total Return.
+
+    windows: A dataframe indexed by QuoteID with the SDate and EDate of
+    each quote.
+
+    Return: A dataframe with QuoteID and date, the dates with a total
+    return.
+
+    Notes:
+    A group of quotes is requested over a window covering all their
+    windows. The rows outside a quote's own window are dropped, so each
+    quote gets the same dates as when requested on its own.
+    """
+    if dta is None or dta.empty:
+        return pd.DataFrame(columns=["QuoteID", "date"])
+    dta = dta.rename(
+        {
+            "Instrument": "QuoteID",
+            "Date": "date",
+            "Daily Total Return": "tret",
+        },
+        axis=1,
+    )
+    # Drop empty rows
+    my_header = list(dta.columns.values)
+    dta = dta.dropna(how="any", subset=my_header[1:])
+    # Remove any duplicates
+    dta = dta.drop_duplicates()
+    if dta.empty:
+        return pd.DataFrame(columns=["QuoteID", "date"])
+    dta["date"] = pd.to_datetime(dta["date"], utc=True).dt.tz_localize(None)
+    day = dta["date"].dt.normalize()
+    sdate = pd.to_datetime(dta["QuoteID"].map(windows["SDate"]))
+    edate = pd.to_datetime(dta["QuoteID"].map(windows["EDate"]))
+    return dta[(day >= sdate) & (day <= edate)][["QuoteID", "date"]]
+
+
+def first_last_per_quote(found):
+    """
+    Enter the dates with a total return and get the date range per quote.
+
+    Return: A dataframe with QuoteID, firstdt and lastdt, i.e. the first
+    and last date with a total return.
+    """
+    if found.empty:
+        return pd.DataFrame(columns=["QuoteID", "firstdt", "lastdt"])
+    dta = found.groupby("QuoteID", sort=False)["date"].agg(["min", "max"])
+    dta["firstdt"] = dta["min"].dt.strftime("%Y-%m-%d")
+    dta["lastdt"] = dta["max"].dt.strftime("%Y-%m-%d")
+    return dta.reset_index()[["QuoteID", "firstdt", "lastdt"]]
+
+
+def boundary_dates(found):
+    """
+    Enter the dates with a total return and get the first and last per quote.
+
+    Only the first and last date of a quote are used, by
+    first_last_per_quote and unv.boundary_windows, so each batch is reduced
+    to them as soon as it is parsed.
+    """
+    if found.empty:
+        return found
+    dates = found.groupby("QuoteID", sort=False)["date"]
+    return pd.concat(
+        [dates.min().reset_index(), dates.max().reset_index()], ignore_index=True
+    ).drop_duplicates()
+
+
+def fetch_dates(windows, bounds, frq, **kwargs):
+    """
+    Enter date windows and a frequency and get the dates with data.
+
+    Arguments:
+
+    windows: A dataframe with QuoteID, SDate and EDate, one or more rows
+    per quote.
+
+    bounds: A dataframe indexed by QuoteID with the SDate and EDate of
+    each quote.
+
+    frq: The Eikon frequency, e.g. "D", "M" or "CY".
+
+    Return: The tuple (found, answered, failed), i.e. a dataframe with
+    QuoteID and date holding the first and last date with data per quote,
+    the set of quotes answered, with data or not, and the set of quotes
+    with a transient error not recovered.
+
+    Notes:
+    **kwargs is for rtv.iter_requests, e.g. quarantine and ledger.
+    The responses are parsed by rtv.iter_parsed while the next ones are
+    retrieved.
+    """
+    if GROUPED:
+        # Quotes with similar SDate and EDate share one request
+        groups = unv.group_windows(windows, "QuoteID", freq=GROUP_FREQ)
+    else:
+        groups = [
+            (sdate, edate, [qte])
+            for qte, sdate, edate in windows[["QuoteID", "SDate", "EDate"]].values
+        ]
+
+    def requests():
+        for sdate, edate, quotes in groups:
+            own_dict = {
+                # "Period": period,
+                "SDate": sdate,
+                "Edate": edate,
+                "Frq": frq,
+            }
+            own_fields = [
+                ek.TR_Field("TR.PriceCloseDate", own_dict),
+                ek.TR_Field("TR.TotalReturn1D", own_dict),
+            ]
+            # Keep the number of rows per request bounded
+            if frq == "D":
+                periods = len(pd.bdate_range(sdate, edate))
+            else:
+                periods = len(
+                    pd.period_range(sdate, edate, freq=unv.PERIODS[frq])
+                )
+            size = max(1, min(SIZE, ROWS // max(1, periods)))
+            for line_start in range(0, len(quotes), size):
+                part = quotes[line_start:line_start + size]
+                yield (sdate, edate, part), part, own_fields
+
+    def parse(item):
+        tag, dta, err = item
+        quotes = set()
+        if dta is not None and not dta.empty:
+            quotes.update(dta.iloc[:, 0])
+        return tag, boundary_dates(dates_per_quote(dta, bounds)), quotes, err
+
+    frames = []
+    answered = set()  # Quotes in the responses, even if only an empty row
+    failed = set()
+    for (sdate, edate, quotes), dates, quotes_answered, err in rtv.iter_parsed(
+        rtv.iter_requests(requests(), field_name=False, raw_output=False, **kwargs),
+        parse,
+    ):
+        print(
+            f" - {len(quotes)} QuoteID for period {sdate} -- {edate} at frequency {frq}"
+        )
+        # A permanent error, e.g. 412 or 416, is an answer without data
+        err_answered, err_failed = rtv.split_errors(err)
+        answered.update(quotes_answered, err_answered)
+        failed.update(err_failed)
+        frames.append(dates)
+    found = pd.concat(frames) if frames else pd.DataFrame(columns=["QuoteID", "date"])
+    return found, answered, failed
+
+
 if __name__ == "__main__":
 
     # PREPARE FILES
@@ -103,15 +273,10 @@
         ],  # Must be possible to trace to Quote and to Organization
     )
 
-    # Read already collected ID vars
-    existing_id = own.read_csv_file(out_file)
-    existing_id = existing_id["QuoteID"]
-    existing_id = existing_id.to_frame()
-    err_quote = own.read_csv_file(err_file)
-    frames = [existing_id, err_quote]
-    existing_id = pd.concat(frames)
-    existing_id.drop_duplicates(inplace=True)
-    own.save_to_csv_file(existing_id, test3, header=True, mode="w")
+    # Already collected ID vars, in the out-file or the error file. The
+    # csv-files are only read beyond the rows the ledger has recorded.
+    collected = idl.IdLedger.for_output(out_file, "QuoteID")
+    collected.import_files(out_file, err_file)
 
     # Add IPO Dates
     ipo = own.read_csv_file(ipo_dates)
@@ -228,9 +393,8 @@
     ).EDate.transform("max")
 
     ### Drop if data has already been collected
-    first_last_dates = (first_last_dates.merge(existing_id, on="QuoteID", how="left", indicator=True)
-                        .query('_merge == "left_only"')
-                        .drop(labels="_merge", axis=1))
+    pending = collected.pending(first_last_dates["QuoteID"].unique())
+    first_last_dates = first_last_dates[first_last_dates["QuoteID"].isin(pending)]
 
     ### Convert into a dictionary (and Quotes as a list)
     first_last_dates = first_last_dates[["QuoteID", "SDate", "EDate"]]
@@ -240,10 +404,6 @@
     own_list = first_last_dates.copy()
     own.save_to_csv_file(own_list, test2, header=True, mode="w")
     # own_list = list.dropna(subset=["QuoteID"], inplace=True)
-    own_list = (own_list.merge(existing_id, on="QuoteID", how="left", indicator=True)
-                        .query('_merge == "left_only"')
-                        .drop(labels="_merge", axis=1))
-    own_list.drop_duplicates(subset=["QuoteID"], inplace=True)
 
     own_list = own_list["QuoteID"]
     # own_list = own_list["QuoteID"].values.tolist()
@@ -254,108 +414,69 @@
     first_last_dates["EDate"] = first_last_dates["EDate"].dt.strftime(
         "%Y-%m-%d"
     )
-    first_last_dates = first_last_dates.set_index("QuoteID")
-    date_dict = first_last_dates.to_dict(
-        "index"
-    )  # Dictionary w/ SDate and EDate per QuoteID
+    windows = first_last_dates[first_last_dates["QuoteID"].isin(own_list)]
 
     # RETRIEVE DATA FROM EIKON
     print(f"No of 'QuoteID' to retrieve data for: {str(len(own_list))}.")
-    # dta_all = pd.DataFrame()  # Just so it is defined
-    counter = 0
-    for qte in own_list:
-        no_data = pd.DataFrame()
-        counter = counter + 1
-        sdate = date_dict[qte]["SDate"]  # Start date
-        edate = date_dict[qte]["EDate"]  # End date
-        # print(" - Period: " + str(period) + ", based on SDate " + str(s_dte))
-        print(f" - QuoteID {qte} for period {sdate} -- {edate}. #{counter}/{str(len(own_list))}")
-        own_dict = {
-            # "Period": period,
-            "SDate": sdate,
-            "Edate": edate,
-            # "Scale": scale,
-            # "ReportType": rep_type,
-            # "ReportingState": rep_state,
-            # "ConsolBasis": consol_basis,
-            # "Curn": curn,
-            # "AlignType": align,
-            # "RollPeriods": roll,
-            # "IncludeSpl": special,
-        }
-        own_fields = [
-            ek.TR_Field("TR.PriceCloseDate", own_dict),
-            ek.TR_Field("TR.TotalReturn1D", own_dict),
-        ]
-        # The actual retrieval loop
-        # I run this in sections to avoid other types of errors such as 'timeout'
-        # errors
-
-        # Have added a retry loop if error since sometimes there are
-        # problems in the API-connection
-        for rec_attempts in range(20):
-            try:
-                # Retrieval function get_data
-                dta, err = ek.get_data(
-                    instruments=qte,
-                    fields=own_fields,
-                    field_name=False,
-                    raw_output=False,
-                )
-                dta.rename(
-                    {
-                        "Instrument": "QuoteID",
-                        "Date": "date",
-                        "Daily Total Return": "tret",
-                    },
-                    axis=1,
-                    inplace=True,
-                )
-            except Exception as own_err:
-                print(
-                    f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
-                    f"again. "
-                )
-                # Try again after a sleep of 30 seconds
-                time.sleep(30)
-                continue
-            else:
-                break
-        else:
-            # All attempts failed
-            print(
-                f"All attempts have failed: Program aborted while running QuoteID {qte}"
+    bounds = windows.set_index("QuoteID")
+    own_kwargs = {
+        "max_workers": MAX_WORKERS,
+        "cache": CACHE,
+        # Quotes that make their batch fail, like no_data.csv
+        "quarantine": rtv.Quarantine(
+            raw_path.joinpath("quarantine_quoteid.csv"), id_name="QuoteID"
+        ),
+        "ledger": erl.ErrorLedger.for_output(out_file),  # Quotes not recovered
+    }
+    quotes_all = windows["QuoteID"].tolist()
+    for line_start in range(0, len(quotes_all), CHUNK):
+        line_end = line_start + CHUNK
+        quotes = quotes_all[line_start:line_end]
+        print(f" + Lines: {str(line_start)}/{str(line_end)}")
+        stage = windows[windows["QuoteID"].isin(quotes)]
+        failed = set()
+        # Probe at coarse frequencies for the periods holding the first and
+        # last date, so that only these are downloaded as daily data
+        for frq in PROBE_FREQS:
+            found, answered, stage_failed = fetch_dates(
+                stage, bounds, frq, **own_kwargs
             )
-            sys.exit()
-
-        if dta is not None:
-            if not dta.empty:
-                # Drop empty rows
-                my_header = list(dta.columns.values)
-                dta = dta.dropna(how="any", subset=my_header[1:])
-                # Remove any duplicates
-                dta = dta.drop_duplicates()
-            # Appends the retrieved Eikon data to out-file, unless empty dta
-            if not dta.empty:
-                dta["date"] = pd.to_datetime(dta["date"])
-                dta["firstdt"] = dta["date"].min()
-                dta["lastdt"] = dta["date"].max()
-                dta["firstdt"] = dta["firstdt"].dt.strftime("%Y-%m-%d")
-                dta["lastdt"] = dta["lastdt"].dt.strftime("%Y-%m-%d")
-                dta = dta[["QuoteID", "firstdt", "lastdt"]]
-                dta = dta.drop_duplicates()
-                # print(f"     From {dta['firstdtf']} to {dta['lastdt']}")
-                # Only save data to file once per loop
-                if pl.Path.exists(out_file):
-                    own.save_to_csv_file(dta, out_file)
-                else:
-                    own.save_to_csv_file(dta, out_file, header=True, mode="w")
+            # Quotes failed are tried again by the next run, but not quotes
+            # quarantined
+            failed.update(stage_failed, set(stage["QuoteID"]) - answered)
+            stage = stage[~stage["QuoteID"].isin(failed)]
+            stage = unv.boundary_windows(stage, found, bounds, "QuoteID", frq)
+            print(f"     {len(stage)} date windows left to download as daily data")
+        found, answered, stage_failed = fetch_dates(stage, bounds, "D", **own_kwargs)
+        failed.update(stage_failed)
+        dta = first_last_per_quote(found)
+        # Quotes with a failed window may miss their first or last date
+        dta = dta[~dta["QuoteID"].isin(failed)]
+        # Appends the retrieved Eikon data to out-file, unless empty dta
+        if not dta.empty:
+            # Only save data to file once per loop
+            if pl.Path.exists(out_file):
+                own.save_to_csv_file(dta, out_file)
+            else:
+                own.save_to_csv_file(dta, out_file, header=True, mode="w")
+        # Quotes answered without data. Quotes that failed are left out, so
+        # they are tried again by the next run.
+        found = set(dta["QuoteID"])
+        no_data = pd.DataFrame(
+            {
+                "QuoteID": [
+                    qte
+                    for qte in quotes
+                    if qte in answered and qte not in failed and qte not in found
+                ]
+            }
+        )
+        if not no_data.empty:
+            if pl.Path.exists(err_file):
+                own.save_to_csv_file(no_data, err_file)
             else:
-                no_data["QuoteID"] = [qte]
-                if pl.Path.exists(err_file):
-                    own.save_to_csv_file(no_data, err_file)
-                else:
-                    own.save_to_csv_file(no_data, err_file, header=True, mode="w")
-                print(f"     No data")
-        time.sleep(1)
+                own.save_to_csv_file(no_data, err_file, header=True, mode="w")
+            print(f"     No data for {len(no_data)} QuoteID")
+        # Record the chunk as collected, once it is saved
+        collected.record(found=dta, no_data=no_data["QuoteID"])
     print("DONE")
@@ -4,20 +4,14 @@
 
 Based on a list of RICs
 
-Retrieves a single Eikon instrument identifier and saves it into a single csv-file.
-The script generates two files, a -raw- file and a v2 file. The v2 file has data
-where empty rows, and possible duplicate rows, are discarded. Use v2.
+Retrieves Eikon instrument identifiers, e.g. ISIN, SEDOL, CUSIP and
+OAPermID, for a list of symbols.
 
-Beware that the list of RICs does not expect a heading, and that its a pure txt-file.
-
-The output file is prefixed with the variable name in lower case
-(and suffixed csv). The csv-file is tab separated.
-
-TODO: This needs to be fully converted to save diction as JSON since
-raw_output = True gives dictions and setting best_match = False gives too strange
-output as a Pandas dataframe. I've started the work, but its not complete.
-Something to think of is how to append a diction as the loop goes on. It's not
-valid to append a JSON file with dictions. Figure out appending dictions
+Each mapped-symbol record of get_symbology's raw output is appended to an
+NDJSON file, one json document per line, as the batches arrive. A restart
+skips the symbols already in the file. The NDJSON file is then compacted
+into a Parquet lookup table with one row per symbol and one column per
+identifier.
 
 Input required
 ---------------
@@ -27,16 +21,20 @@
 """
 # IMPORT PACKAGES
 # from datetime import datetime
-import csv
-
-# import json5
+import concurrent.futures as cf
+import json as js
 import os
 import sys
-import time  # For sleep functionality
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from src.my_functions import own_functions as own
+from src.my_functions import rate_limit as rl
+from src.my_functions import response_cache as rc
+from src.my_functions import retry_policy as rp
+
 
 def e_get_symbols(
     sym_lst,
@@ -44,6 +42,8 @@ def e_get_symbols(
     to_symbol_type=None,
     best_match=False,
     raw_output=True,
+    cache=None,
+    limiter=None,
     **kwargs
 ):
     """
@@ -64,8 +64,21 @@ def e_get_symbols(
 
     raw_output : Set this parameter to True to get the data in JSON format.
                 Otherwise in Pandas df.
+
+    cache : A rc.ResponseCache to reuse earlier responses. None to always
+            call Eikon.
+
+    limiter : A rl.TokenBucket. Default is the shared limiter.
     """
-    sym_df = ek.get_symbology(
+
+    def call(symbols, **params):
+        rl.acquire(symbols, limiter=limiter)  # Shared Eikon rate limit
+        return ek.get_symbology(symbols, **params)
+
+    sym_df = rc.cached_call(
+        cache,
+        "get_symbology",
+        call,
         sym_lst,
         from_symbol_type=from_symbol_type,
         to_symbol_type=to_symbol_type,
@@ -76,11 +89,146 @@ def e_get_symbols(
     return sym_df
 
 
-def merge_two_dicts(x, y):
-    """Given two dictionaries, merge them into a new dict as a shallow copy."""
-    z = x.copy()
-    z.update(y)
-    return z
+def read_done_symbols(file):
+    """
+    Enter an NDJSON file of mapped symbols and get the symbols in it.
+
+    Notes:
+    A line cut short by a crash is skipped, so its symbol is retrieved
+    again.
+    """
+    done = set()
+    if not os.path.exists(file):
+        return done
+    with open(file, mode="r", encoding="utf-8") as ndjson_file:
+        for line in ndjson_file:
+            try:
+                done.add(js.loads(line)["symbol"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def fetch_symbology(symbols, attempts=5, **kwargs):
+    """
+    Enter a batch of symbols and get their mapped-symbol records.
+
+    Arguments:
+
+    symbols: The batch of symbols.
+
+    attempts: Number of attempts before the program is aborted.
+
+    Return: The list of mapped-symbol records of the raw output.
+
+    Notes:
+    **kwargs is for e_get_symbols.
+    """
+    # Have added a retry loop if error since sometimes there are
+    # problems in the API-connection
+    for rec_attempts in range(attempts):
+        try:
+            # Retrieve symbol data from Eikon
+            dta = e_get_symbols(symbols, raw_output=True, **kwargs)
+            return dta.get("mappedSymbols", [])
+        except Exception as own_err:
+            print(
+                "Exception in attempt #"
+                + str(rec_attempts)
+                + ": "
+                + str(own_err)
+                + ", was raised. Trying again."
+            )
+            # Give up at once on permanent errors, else back off
+            rp.handle_failure(own_err, rec_attempts)
+    # All attempts failed
+    print("All attempts have failed: Program aborted")
+    sys.exit()
+
+
+def get_symbols_ndjson(
+    symbols, out_file, size=500, max_workers=4, **kwargs
+):
+    """
+    Enter symbols and an NDJSON file and append their mapped-symbol records.
+
+    Arguments:
+
+    symbols: The list of symbols, e.g. RICs.
+
+    out_file: The NDJSON file. The symbols already in it are skipped.
+
+    size: Number of symbols per get_symbology call.
+
+    max_workers: Number of calls in flight at once.
+
+    Return: The number of records appended.
+
+    Notes:
+    **kwargs is for e_get_symbols, e.g. from_symbol_type and to_symbol_type.
+    The records are appended in the order of the list, one per line, and
+    flushed per batch, so a crash loses at most the batches in flight.
+    """
+    done = read_done_symbols(out_file)
+    symbols = [sym for sym in dict.fromkeys(symbols) if sym not in done]
+    if done:
+        print(f"     Resuming: {len(done)} symbols already done")
+    batches = [symbols[j:j + size] for j in range(0, len(symbols), size)]
+    records = 0
+    with open(out_file, mode="a", encoding="utf-8", newline="") as ndjson_file:
+        with cf.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(
+                lambda batch: fetch_symbology(batch, **kwargs), batches
+            )
+            for j, mapped in enumerate(results):
+                print(f" - From {str(j * size)}, to {str(j * size + len(batches[j]))}")
+                lines = [js.dumps(record, sort_keys=True) for record in mapped]
+                if lines:
+                    ndjson_file.write("\n".join(lines) + "\n")
+                    ndjson_file.flush()
+                records += len(lines)
+    return records
+
+
+def compact_symbols(ndjson_file, parquet_file, symbol_types, compression="snappy"):
+    """
+    Enter an NDJSON file of mapped symbols and save a Parquet lookup table.
+
+    Arguments:
+
+    ndjson_file: The NDJSON file of get_symbols_ndjson.
+
+    parquet_file: The Parquet file. It is replaced.
+
+    symbol_types: The identifiers of the table, e.g. ISIN and SEDOL.
+
+    Return: The lookup table as a dataframe, with the column symbol, one
+    column per identifier and the column error.
+
+    Notes:
+    An identifier is the best match if retrieved with best_match=True,
+    else the first of the symbols listed, e.g. the first of ISINs. The
+    last record of a symbol retrieved more than once is kept.
+    """
+    rows = {}
+    with open(ndjson_file, mode="r", encoding="utf-8") as fl:
+        for line in fl:
+            try:
+                record = js.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            row = {"symbol": record.get("symbol")}
+            best = record.get("bestMatch", {})
+            for sym_type in symbol_types:
+                listed = record.get(f"{sym_type}s") or [None]
+                row[sym_type] = best.get(sym_type, listed[0])
+            row["error"] = record.get("error")
+            rows[row["symbol"]] = row
+    columns = ["symbol"] + list(symbol_types) + ["error"]
+    dta = pd.DataFrame(list(rows.values()), columns=columns)
+    table = pa.Table.from_pandas(dta.astype("string"), preserve_index=False)
+    pq.write_table(table, parquet_file, compression=compression)
+    return dta
 
 
 if __name__ == "__main__":
@@ -88,7 +236,10 @@ def merge_two_dicts(x, y):
     ek.set_timeout(300)  # Set Eikon's timeout to be 5 min.
     # insert APP_KEY from app key generator in eikon
     ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
-    SIZE = 2  # Number of rows gathered per Eikon-loop
+    SIZE = 500  # Number of symbols gathered per Eikon-loop
+    MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+    USE_CACHE = False  # True to reuse responses of earlier runs
+    CACHE = rc.ResponseCache() if USE_CACHE else None
 
     # SET PANDAS CONFIGURATION
     pd.set_option("display.max_columns", None)
@@ -96,8 +247,7 @@ def merge_two_dicts(x, y):
     pd.set_option("max_colwidth", None)
 
     # WHICH VARIABLES TO RETRIEVE?
-    # OWN_VARIABLES = ['ISIN', 'SEDOL', 'CUSIP', 'OAPermID']
-    OWN_VARIABLES = ["RIC"]
+    OWN_VARIABLES = ["ISIN", "SEDOL", "CUSIP", "OAPermID"]
     # FROM WHICH VARIABLE?
     SYM_IN = "RIC"
 
@@ -108,7 +258,7 @@ def merge_two_dicts(x, y):
     # FILE NAMES OF DATA
     SOURCE_FNAME = "ric_all"  # Name of source file
     SOURCE_FNAME_SUFFIX = ".csv"  # File type
-    # Out file specified in loop below
+    # Out files specified below
 
     # Source file name concatenation
     S_FNAME = SOURCE_FNAME + SOURCE_FNAME_SUFFIX
@@ -116,141 +266,39 @@ def merge_two_dicts(x, y):
 
     # READ THE DATA FROM SOURCE FILE
     # File has header. make it into a list
-    own_list = own.read_csv_file((SOURCE_FNAME_CPL)
-    own_list = own_list["ric"].values.tolist()
-    own_list = [
-        "VOLVb.ST",
-        "ATCOa.ST",
-        "HUFVa.ST",
-        "VOLO.ST",
-        "247.TE",
-        "24STOR.ST",
-        "SBBb.ST",
-    ]
-    own_list = ["ERICb.ST"]
+    own_list = own.read_csv_file(SOURCE_FNAME_CPL)
+    own_list = own_list["ric"].dropna().values.tolist()
+    # own_list = [
+    #     "VOLVb.ST",
+    #     "ATCOa.ST",
+    #     "HUFVa.ST",
+    #     "VOLO.ST",
+    #     "247.TE",
+    #     "24STOR.ST",
+    #     "SBBb.ST",
+    # ]
     # own_list = own_list[1:500]
 
     # RETRIEVE DATA FROM EIKON
+    # All identifiers in one pass, appended to one NDJSON file
     print("No of RICs to retrieve data for: " + str(len(own_list)))
-    for i in OWN_VARIABLES:
-        OWN_VAR = i
-        print("Retrieves data for Eikon variable: " + str(OWN_VAR))
-
-        # Out file name concatenation
-        O_FNAME = str(i).lower() + ".json"
-        OUT_FNAME_CPL = os.path.join(OUT_PATH, O_FNAME)
-        print(OUT_FNAME_CPL)
-
-        # Remove out-file, if it exist
-        if os.path.exists(OUT_FNAME_CPL):
-            os.remove(OUT_FNAME_CPL)
-
-        # Write header to out-file
-        # header = ['ric', OWN_VAR]
-        # with open(OUT_FNAME_CPL, 'w', encoding='UTF8') as f:
-        #     writer = csv.writer(f, delimiter='\t')
-        #     writer.writerow(header)
-
-        # The actual retrieval loop
-        # I run this in sections to avoid other types of errors such as 'timeout'
-        # errors
-        for j in range(0, len(own_list), SIZE):
-            k = j + SIZE
-            print(" - From " + str(j) + ", to " + str(k))
-
-            # Have added a retry loop if error since sometimes there are
-            # problems in the API-connection
-            for rec_attempts in range(5):
-                try:
-                    # Retrieve symbol data from Eikon
-                    dta = e_get_symbols(
-                        own_list[j:k],
-                        SYM_IN,
-                        to_symbol_type=OWN_VAR,
-                        best_match=False,
-                        raw_output=True,
-                    )
-                    print(dta)
-                    new_name = "mappedSymbols" + "_" + str(j)
-                    dta[new_name] = dta.pop("mappedSymbols")
-                    print(dta)
-                except Exception as own_err:
-                    print(
-                        "Exception in attempt #"
-                        + str(rec_attempts)
-                        + ": "
-                        + str(own_err)
-                        + ", was raised. Trying again."
-                    )
-                    # Try again after a sleep of 30 seconds
-                    time.sleep(30)
-                    continue
-                else:
-                    break
-            else:
-                # All attempts failed
-                print("All attempts have failed: Program aborted")
-                sys.exit()
-
-            # Append json array to json file
-            if j == 0:
-                with open(OUT_FNAME_CPL, "w") as fp:
-                    json5.dump(
-                        dta, fp, sort_keys=True, indent=4, trailing_commas=False
-                    )
-            else:
-                output_list = []
-                with open(OUT_FNAME_CPL, "r") as fp:
-                    output_list.append(json5.load(fp))
-
-                with open(OUT_FNAME_CPL, "w") as fp:
-                    json5.dump(
-                        dta, fp, sort_keys=True, indent=4, trailing_commas=False
-                    )
-
-            # Saves the retrieved Eikon data to out-file
-            # dta.to_csv(OUT_FNAME_CPL, mode='a', sep='\t',
-            #            encoding='utf-8', index=False, header=False)
-            # Pause for 10s to reduce risk of throwing an exception
-            time.sleep(10)
-        print("Time to dump")
-        # with open(OUT_FNAME_CPL, 'w', encoding="utf-8") as fp:
-        #     json5.dump(own_dict, fp, sort_keys=True,
-        #                indent=4, trailing_commas=False)
-
-    # # FIX OUTPUT FILES
-    # for i in OWN_VARIABLES:
-    #     # Out-file name concatenation
-    #     # Original file
-    #     O_FNAME = str(i).lower() + '.csv'
-    #     OUT_FNAME_CPL = os.path.join(OUT_PATH, O_FNAME)
-    #     # Revised file
-    #     NEW_O_FNAME = str(i).lower() + '_v2' + '.csv'
-    #     NEW_OUT_FNAME_CPL = os.path.join(OUT_PATH, NEW_O_FNAME)
-    #
-    #     # Remove revised out-file, if it exists
-    #     if os.path.exists(NEW_OUT_FNAME_CPL):
-    #         os.remove(NEW_OUT_FNAME_CPL)
-    #
-    #     # Write header to revised out file
-    #     header = ['ric', i]
-    #     with open(NEW_OUT_FNAME_CPL, 'w', encoding='UTF8') as f:
-    #         writer = csv.writer(f, delimiter='\t')
-    #         writer.writerow(header)
-    #
-    #     # Read the original out file
-    #     dta = pd.read_csv(OUT_FNAME_CPL, delimiter='\t',
-    #                       low_memory=False, skiprows=[2])
-    #     print(len(dta))
-    #
-    #     # Drop empty rows
-    #     dta = dta.dropna(how='any', subset=[i])
-    #
-    #     # Remove any duplicates
-    #     dta.drop_duplicates(inplace=True)
-    #     print(len(dta))
-    #
-    #     # Save data
-    #     dta.to_csv(NEW_OUT_FNAME_CPL, mode='a', sep='\t',
-    #                encoding='utf-8', index=False, header=False)
+    print("Retrieves data for Eikon variables: " + ", ".join(OWN_VARIABLES))
+    OUT_FNAME_CPL = os.path.join(OUT_PATH, "symbology.ndjson")
+    PARQUET_FNAME_CPL = os.path.join(OUT_PATH, "symbology.parquet")
+    print(OUT_FNAME_CPL)
+    get_symbols_ndjson(
+        own_list,
+        OUT_FNAME_CPL,
+        size=SIZE,
+        max_workers=MAX_WORKERS,
+        from_symbol_type=SYM_IN,
+        to_symbol_type=OWN_VARIABLES,
+        best_match=False,
+        cache=CACHE,
+    )
+
+    # FIX OUTPUT FILES
+    # The lookup table from RIC to each identifier
+    dta = compact_symbols(OUT_FNAME_CPL, PARQUET_FNAME_CPL, OWN_VARIABLES)
+    print(f"Lookup table {PARQUET_FNAME_CPL} has {len(dta)} symbols")
     print("DONE")
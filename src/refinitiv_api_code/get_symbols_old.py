@@ -25,10 +25,11 @@
 # from datetime import datetime
 import csv
 import os
-import time  # For sleep functionality
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
+from src.my_functions import rate_limit as rl
+from src.my_functions import retry_policy as rp
 
 
 def e_get_symbols(sym_lst, sym_in, sym_out):
@@ -38,6 +39,7 @@ def e_get_symbols(sym_lst, sym_in, sym_out):
     Output symbol if sym_out
     best_match is set to False to get all matches and not just Primary
     '''
+    rl.acquire(sym_lst)  # Shared Eikon rate limit
     sym_df = ek.get_symbology(
         sym_lst,
         from_symbol_type=sym_in,
@@ -133,8 +135,8 @@ def e_get_symbols(sym_lst, sym_in, sym_out):
                 except Exception as own_err:
                     print('Exception in attempt #' + str(rec_attempts)
                           + ': ' + str(own_err) + ', was raised. Trying again.')
-                    # Try again after a sleep of 30 seconds
-                    time.sleep(30)
+                    # Give up at once on permanent errors, else back off
+                    rp.handle_failure(own_err, rec_attempts)
                     continue
                 else:
                     break
@@ -147,6 +149,4 @@ def e_get_symbols(sym_lst, sym_in, sym_out):
             dta.to_csv(OUT_FNAME_CPL, mode='a', sep='\t',
                        quoting=csv.QUOTE_ALL, encoding='utf-8',
                        index=False, header=False)
-            # Pause for 10s to reduce risk of throwing an exception
-            time.sleep(10)
 print('DONE')
@@ -17,11 +17,15 @@
 import csv
 import os
 import pathlib as pl
-import sys
-import time  # For sleep functionality
 # IMPORT PACKAGES
-from datetime import datetime
 from src.my_functions import own_functions as own
+from src.my_functions import batch_sink as snk
+from src.my_functions import batch_sizing as bsz
+from src.my_functions import checkpoint as ckp
+from src.my_functions import error_ledger as erl
+from src.my_functions import response_cache as rc
+from src.my_functions import retrieval as rtv
+from src.my_functions import universe as unv
 
 import eikon as ek  # the Eikon Python wrapper package
 import pandas as pd
@@ -31,6 +35,9 @@
 # insert APP_KEY from app key generator in eikon
 ek.set_app_key("1418cf51ee9046a3a767d6f8c871c1d3fcaf1953")
 SIZE = 1500  # Number of rows gathered per Eikon-loop
+MAX_WORKERS = 4  # Number of Eikon-loops in flight at once
+USE_CACHE = False  # True to reuse responses of earlier runs
+CACHE = rc.ResponseCache() if USE_CACHE else None
 
 # SET PANDAS CONFIGURATION
 pd.set_option("display.max_columns", None)
@@ -63,6 +70,8 @@
 name = "refinitiv_relations.csv"
 SOURCE_FILE = pl.Path.joinpath(raw_path, name)
 instrument_types = pl.Path.joinpath(raw_path, "instrumenttypecode.csv")
+OUT_FILE = pl.Path.joinpath(out_path, "ts_data.csv")  # Name of output file
+OUT_FILE2 = pl.Path.joinpath(out_path, "ts_data_v2.csv")  # Name of output file
 
 
 if __name__ == "__main__":
@@ -139,6 +148,14 @@
 
     # RETRIEVE DATA FROM EIKON
     print(f"No of {SYM_IN} to retrieve data for: {str(len(own_list))}. ")
+    # FirstTradeDate and RetireDate per QuoteID
+    lifetimes = unv.read_lifetimes(SOURCE_FILE, SYM_IN)
+    manifest = ckp.Manifest.for_output(OUT_FILE)  # Completed years and batches
+    ledger = erl.ErrorLedger.for_output(OUT_FILE)  # Instruments not recovered
+    # Instruments that make their batch fail, like no_data.csv
+    quarantine = rtv.Quarantine(
+        raw_path.joinpath(f"quarantine_{SYM_IN.lower()}.csv"), id_name=SYM_IN
+    )
     for yr in range(LAST_YEAR, FIRST_YEAR - 1, -1):
         # What period? E.g. FY2020, or CY2020
         # period = f"{YEAR_TYPE}{yr}"
@@ -172,63 +189,39 @@
             ek.TR_Field("TR.RetireDate"),
 
         ]
+        # Only the instruments alive during the year
+        year_list = unv.prune(own_list, lifetimes, f"{yr}-01-01", sdate)
+        # Skip the year if an earlier run has completed it
+        unit = ckp.make_unit(year_list, own_fields, year=yr, sdate=sdate)
+        if manifest.is_complete(unit):
+            print(f"     Year {yr} is already done.")
+            continue
         # The actual retrieval loop
         # I run this in sections to avoid other types of errors such as 'timeout'
-        # errors
-        dta_all = pd.DataFrame()  # Just so it is defined
-        for line_start in range(0, len(own_list) + 1, SIZE):
-            line_end = line_start + SIZE
-            print(f" + Lines: {str(line_start)}/{str(line_end)} (Year {yr})")
-            # Have added a retry loop if error since sometimes there are
-            # problems in the API-connection
-            for rec_attempts in range(20):
-                try:
-                    # Retrieval function get_data
-                    dta, err = ek.get_data(
-                        instruments=own_list[line_start:line_end],
-                        fields=own_fields,
-                        field_name=False,
-                        raw_output=False,
-                    )
-                except Exception as own_err:
-                    print(
-                        f"Exception in attempt # {str(rec_attempts)}: {str(own_err)}, was raised. Trying "
-                        f"again. "
-                    )
-                    # Try again after a sleep of 30 seconds
-                    time.sleep(30)
-                    continue
-                else:
-                    break
-            else:
-                # All attempts failed
-                print(f"All attempts have failed: Program aborted while running year {yr}")
-                sys.exit()
-
-            if dta is not None:
-                if not dta.empty:
-                    # Drop empty rows
-                    my_header = list(dta.columns.values)
-                    dta = dta.dropna(how="all", subset=my_header[1:])
-
-                    # Remove any duplicates
-                    dta = dta.drop_duplicates()
-                # Appends the retrieved Eikon data to out-file, unless empty dta
-                if not dta.empty:
-                    # dta = dta.rename(
-                    #     columns={"Instruments": "SEDOL"}
-                    # )
-                    # dta = dta.rename(
-                    #     columns={"Instrument": "SEDOL"}
-                    # )
-
-                    frames = [dta_all, dta]
-                    dta_all = pd.concat(frames)
-                    dta_all = dta_all.drop_duplicates()
-                    print(f"     dta_all len is {len(dta_all)}")
-            time.sleep(1)
-        # Only save data to file once per yr
-        own.save_to_csv_file(dta_all, OUT_FILE)
+        # errors. Several sections are in flight at once. Each section is
+        # written to a part file at once, which is added to the out-file
+        # when the year is done.
+        sink = snk.BatchSink(OUT_FILE, staged=True)
+        rtv.get_data_batched(
+            year_list,
+            own_fields,
+            # Learned per field set, but fixed when cached, so that a re-run
+            # asks for the same batches
+            size=bsz.load_batch_size(own_fields, SIZE) if CACHE is None else SIZE,
+            max_workers=MAX_WORKERS,
+            label=f"(Year {yr})",
+            manifest=manifest,
+            unit=unit,
+            cache=CACHE,
+            quarantine=quarantine,
+            ledger=ledger,
+            sink=sink,
+            field_name=False,
+            raw_output=False,
+        )
+        print(f"     dta_all len is {sink.rows}")
+        sink.commit()
+        manifest.mark_complete(unit)
 
     # FIX OUTPUT FILE
     # Revised file name
@@ -20,6 +20,10 @@
     inactive_public.csv
     inactive_private.csv
     (these 4 files can be updated using get_data_screener.py)
+
+get_data_screener.py also saves the OrganizationIDs added and removed since
+its previous run, e.g. snapshots/organizationid_swe_2026-10-16_delta.csv.
+Read it with snp.read_delta to process only the changed firms.
 """
 import pandas as pd
 import pathlib as pl
@@ -0,0 +1,194 @@
+"""
+Created on 16 Oct 2026
+
+This is a script with tests of the retrieval engine against fake_eikon.
+
+Run them from the project folder with python -m pytest -q.
+
+"""
+
+#  Copyright (c) 2022. All right reserved.
+
+# IMPORT PACKAGES
+import pandas as pd
+import pytest
+from src.my_functions import checkpoint as ckp
+from src.my_functions import error_ledger as erl
+from src.my_functions import fake_eikon as fe
+from src.my_functions import id_ledger as idl
+from src.my_functions import own_functions as own
+from src.my_functions import rate_limit as rl
+from src.my_functions import retrieval as rtv
+from src.my_functions import retry_policy as rp
+
+FIELDS = ["TR.COMMONNAME", "TR.ISIN"]
+INSTRUMENTS = [f"I{i}" for i in range(40)]
+
+
+class BatchFailingApi:
+    """ A fake failing every batch that holds a bad instrument. """
+
+    def __init__(self, bad):
+        self.fake = fe.FakeEikon()
+        self.bad = set(bad)
+        self.requests = []  # The instruments of each call
+
+    def get_data(self, instruments, fields, *args, **kwargs):
+        self.requests.append(list(instruments))
+        if self.bad.intersection(instruments):
+            raise fe.EikonError(412, "Unable to resolve all requested identifiers.")
+        return self.fake.get_data(instruments, fields, *args, **kwargs)
+
+
+@pytest.fixture
+def own_kwargs(tmp_path):
+    """ Get the keyword arguments of a fast retrieval, without sleeps. """
+    return {
+        "limiter": rl.TokenBucket(1000, None, tmp_path.joinpath("rate")),
+        "breaker": rp.CircuitBreaker(),
+        "backoff_base": 0,
+    }
+
+
+def test_batches_equal_one_request(own_kwargs):
+    fake = fe.FakeEikon()
+    expected, err = fake.get_data(INSTRUMENTS, FIELDS)
+    dta = rtv.get_data_batched(
+        INSTRUMENTS,
+        FIELDS,
+        size=7,
+        max_workers=3,
+        api=fake,
+        clean=None,
+        **own_kwargs,
+    )
+    assert fake.calls == 1 + 6  # One request, and six batches
+    pd.testing.assert_frame_equal(dta.reset_index(drop=True), expected)
+
+
+def test_manifest_resumes_after_a_crash(tmp_path, own_kwargs):
+    manifest = ckp.Manifest.for_output(tmp_path.joinpath("out.csv"))
+    unit = ckp.make_unit(INSTRUMENTS, FIELDS, year=2020)
+
+    def crash(dta):
+        if "I14" in set(dta["Instrument"]):
+            raise RuntimeError("Crash")
+        return dta
+
+    with pytest.raises(RuntimeError):
+        rtv.get_data_batched(
+            INSTRUMENTS,
+            FIELDS,
+            size=7,
+            api=fe.FakeEikon(),
+            clean=crash,
+            manifest=manifest,
+            unit=unit,
+            **own_kwargs,
+        )
+    assert manifest.done_ranges(unit) == [(0, 7), (7, 14)]
+    fake = fe.FakeEikon()
+    dta = rtv.get_data_batched(
+        INSTRUMENTS,
+        FIELDS,
+        size=7,
+        api=fake,
+        clean=None,
+        manifest=manifest,
+        unit=unit,
+        **own_kwargs,
+    )
+    assert fake.calls == 4  # Only the batches not done
+    assert dta["Instrument"].tolist() == INSTRUMENTS
+
+
+def test_failed_entries_are_requeued(tmp_path, own_kwargs):
+    fake = fe.FakeEikon(invalid=["I3"], partial_error_rate=0.2, seed=1)
+    ledger = erl.ErrorLedger(tmp_path.joinpath("out.errors.jsonl"))
+    dta, err = rtv.fetch_recover(
+        INSTRUMENTS, FIELDS, api=fake, ledger=ledger, **own_kwargs
+    )
+    assert fake.calls > 1  # The failed instruments were asked for again
+    # Only the instrument that can't be resolved is left, with its empty row
+    assert [entry["instrument"] for entry in err] == ["I3"]
+    # The rows of the re-queued instruments come after the others
+    assert sorted(dta["Instrument"]) == sorted(INSTRUMENTS)
+    assert dta.set_index("Instrument").drop(index="I3").notna().all().all()
+    assert ledger.instruments(rp.PERMANENT) == {"I3"}
+
+
+def test_failed_entries_not_requeued_are_kept(own_kwargs):
+    fake = fe.FakeEikon(invalid=["I3"], partial_error_rate=0.2, seed=1)
+    dta, err = rtv.fetch_recover(
+        INSTRUMENTS, FIELDS, api=fake, requeue_attempts=0, **own_kwargs
+    )
+    answered, failed = rtv.split_errors(err)
+    assert fake.calls == 1
+    assert answered == {"I3"}  # Answered without data
+    assert failed and "I3" not in failed  # Tried again by the next run
+
+
+def test_bisect_quarantines_the_failing_instrument(tmp_path, own_kwargs):
+    quarantine = rtv.Quarantine(tmp_path.joinpath("quarantine.csv"))
+    api = BatchFailingApi(bad=["I9"])
+    batches = list(
+        rtv.iter_batches(
+            INSTRUMENTS,
+            FIELDS,
+            size=20,
+            api=api,
+            quarantine=quarantine,
+            **own_kwargs,
+        )
+    )
+    dta = pd.concat([dta for line_start, line_end, dta, err in batches])
+    assert quarantine.instruments() == {"I9"}
+    assert dta["Instrument"].tolist() == [ins for ins in INSTRUMENTS if ins != "I9"]
+    # A later run leaves the quarantined instrument out of its batch
+    api = BatchFailingApi(bad=["I9"])
+    list(
+        rtv.iter_batches(
+            INSTRUMENTS,
+            FIELDS,
+            size=20,
+            api=api,
+            quarantine=quarantine,
+            **own_kwargs,
+        )
+    )
+    assert len(api.requests) == 2
+    assert all("I9" not in request for request in api.requests)
+
+
+def test_no_data_ids_are_recorded(tmp_path):
+    out_file = tmp_path.joinpath("out.csv")
+    err_file = tmp_path.joinpath("no_data.csv")
+    found = pd.DataFrame(
+        {"QuoteID": ["1", "2"], "firstdt": ["a", "a"], "lastdt": ["b", "b"]}
+    )
+    no_data = pd.DataFrame({"QuoteID": ["2", "3"]})
+    own.save_to_csv_file(found, out_file, header=True, mode="w")
+    own.save_to_csv_file(no_data, err_file, header=True, mode="w")
+    collected = idl.IdLedger.for_output(out_file, "QuoteID")
+    assert collected.import_files(out_file, err_file) == 3
+    # An id both found and without data keeps the data found
+    assert collected.count(idl.FOUND) == 2
+    assert collected.count(idl.NO_DATA) == 1
+    assert collected.pending(["1", "3", "4"]) == ["4"]
+
+
+def test_no_data_ids_saved_before_a_crash_are_recorded(tmp_path):
+    out_file = tmp_path.joinpath("out.csv")
+    err_file = tmp_path.joinpath("no_data.csv")
+    collected = idl.IdLedger.for_output(out_file, "QuoteID")
+    collected.import_files(out_file, err_file)
+    found = pd.DataFrame({"QuoteID": ["1"], "firstdt": ["a"], "lastdt": ["b"]})
+    own.save_to_csv_file(found, out_file, header=True, mode="w")
+    no_data = pd.DataFrame({"QuoteID": ["2"]})
+    own.save_to_csv_file(no_data, err_file, header=True, mode="w")
+    collected.record(found=found, no_data=["2"])
+    # Saved, but the run stops before it is recorded
+    own.save_to_csv_file(pd.DataFrame({"QuoteID": ["3"]}), err_file)
+    collected = idl.IdLedger.for_output(out_file, "QuoteID")
+    assert collected.import_files(out_file, err_file) == 1
+    assert collected.pending(["1", "2", "3", "4"]) == ["4"]